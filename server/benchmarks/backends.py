@@ -0,0 +1,250 @@
+# backends.py
+# Stub servers that emulate every service the Django tier calls: the
+# dealership API (database/app.js), the carsInventory API
+# (carsInventory/app.js), the sentiment analyzer and the OpenAI chat
+# completions API. Data is seeded from database/data/*.json and
+# carsInventory/data/car_records.json, copied `scale` times with new ids
+# for bigger payloads. Used by `manage.py benchmark`.
+
+import contextlib
+import json
+import os
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+from benchmarks.stubs import StubServer
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+POSITIVE = {"great", "good", "excellent", "fantastic", "love", "best",
+            "friendly", "helpful", "recommend"}
+NEGATIVE = {"bad", "poor", "terrible", "worst", "rude", "slow", "never",
+            "awful", "disappointed"}
+
+
+def load_json(*parts):
+    with open(os.path.join(SERVER_DIR, *parts)) as f:
+        return json.load(f)
+
+
+def seed_data(scale=1):
+    dealers = load_json('database', 'data', 'dealerships.json')['dealerships']
+    reviews = load_json('database', 'data', 'reviews.json')['reviews']
+    cars = load_json('carsInventory', 'data', 'car_records.json')['cars']
+    data = {"dealers": [], "reviews": [], "cars": []}
+    for copy in range(scale):
+        offset = copy * len(dealers)
+        data["dealers"] += [{**dealer, "id": dealer["id"] + offset}
+                            for dealer in dealers]
+        data["reviews"] += [{**review,
+                             "id": review["id"] + copy * len(reviews),
+                             "dealership": review["dealership"] + offset}
+                            for review in reviews]
+        data["cars"] += [{"_id": f"{copy:08x}{index:016x}", **car,
+                          "dealer_id": car["dealer_id"] + offset, "__v": 0}
+                         for index, car in enumerate(cars)]
+    return data
+
+
+def _parts(target):
+    parts = urlsplit(target)
+    return ([unquote(part) for part in parts.path.split('/') if part],
+            dict(parse_qsl(parts.query)))
+
+
+def _body(body):
+    try:
+        return json.loads(body or b'{}')
+    except ValueError:
+        return {}
+
+
+class DealershipAPI:
+    def __init__(self, data):
+        self.dealers = data["dealers"]
+        self.reviews = data["reviews"]
+        self.by_id = {dealer["id"]: dealer for dealer in self.dealers}
+
+    def dealers_route(self, method, target, body):
+        parts, _ = _parts(target)
+        if len(parts) == 1:
+            return 200, self.dealers
+        return 200, [dealer for dealer in self.dealers
+                     if dealer["state"] == parts[1]]
+
+    def dealer(self, method, target, body):
+        parts, _ = _parts(target)
+        dealer = self.by_id.get(int(parts[1]))
+        return 200, [dealer] if dealer else []
+
+    def reviews_route(self, method, target, body):
+        parts, _ = _parts(target)
+        if len(parts) == 3:
+            dealer_id = int(parts[2])
+            return 200, [review for review in self.reviews
+                         if review["dealership"] == dealer_id]
+        if len(parts) == 2:
+            review_id = int(parts[1])
+            return 200, [review for review in self.reviews
+                         if review["id"] == review_id]
+        return 200, self.reviews
+
+    def write(self, method, target, body):
+        # insert_review, edit_review, update_dealer and new_dealer echo the
+        # saved document without changing the seed data
+        parts, _ = _parts(target)
+        document = _body(body)
+        if len(parts) == 2:
+            document["id"] = int(parts[1])
+        return 200, document
+
+    def routes(self):
+        return {"/fetchDealers": self.dealers_route,
+                "/fetchDealer/": self.dealer,
+                "/fetchReviews": self.reviews_route,
+                "/insert_review": self.write,
+                "/edit_review/": self.write,
+                "/update_dealer/": self.write,
+                "/new_dealer": self.write}
+
+
+class InventoryAPI:
+    def __init__(self, data):
+        self.cars = data["cars"]
+        self.by_dealer = {}
+        for car in self.cars:
+            self.by_dealer.setdefault(car["dealer_id"], []).append(car)
+
+    def inventory(self, method, target, body):
+        _, query = _parts(target)
+
+        def wanted(car):
+            if query.get('make') and car['make'] != query['make']:
+                return False
+            if query.get('model') and car['model'] != query['model']:
+                return False
+            if query.get('year') and car['year'] < int(query['year']):
+                return False
+            for field in ('mileage', 'price'):
+                low = query.get(field + 'Min')
+                high = query.get(field + 'Max')
+                if low and high and not int(low) <= car[field] <= int(high):
+                    return False
+            return True
+
+        matches = [car for car in self.cars if wanted(car)]
+        page = int(query.get('page', 1))
+        limit = int(query.get('limit', 10))
+        return 200, {"status": 200,
+                     "cars": matches[(page - 1) * limit:page * limit],
+                     "totalCars": len(matches),
+                     "totalPages": -(-len(matches) // limit),
+                     "currentPage": page}
+
+    def makes_models(self, method, target, body):
+        models = {}
+        for car in self.cars:
+            models.setdefault(car["make"], set()).add(car["model"])
+        return 200, [{"make": make, "models": sorted(names)}
+                     for make, names in models.items()]
+
+    def dealer_cars(self, method, target, body):
+        parts, _ = _parts(target)
+        cars = self.by_dealer.get(int(parts[1]), [])
+        if len(parts) == 3:
+            field = {"carsbymake": "make", "carsbymodel": "model"}.get(
+                parts[0])
+            value = parts[2]
+            if field:
+                cars = [car for car in cars if car[field] == value]
+            elif parts[0] == "carsbyyear":
+                cars = [car for car in cars if car["year"] >= int(value)]
+            elif parts[0] == "carsbymaxmileage":
+                cars = [car for car in cars if car["mileage"] <= int(value)]
+            elif parts[0] == "carsbyprice":
+                cars = [car for car in cars if car["price"] <= int(value)]
+        return 200, cars
+
+    def routes(self):
+        routes = {"/inventory/": self.inventory,
+                  "/makes_models/": self.makes_models}
+        for prefix in ("cars", "carsbymake", "carsbymodel", "carsbyyear",
+                       "carsbymaxmileage", "carsbyprice"):
+            routes[f"/{prefix}/"] = self.dealer_cars
+        return routes
+
+
+def score(text):
+    words = set(str(text).lower().split())
+    pos, neg = len(words & POSITIVE), len(words & NEGATIVE)
+    sentiment = "positive" if pos > neg else \
+        "negative" if neg > pos else "neutral"
+    return {"sentiment": sentiment, "scores": {"pos": pos, "neg": neg}}
+
+
+class SentimentAPI:
+    def analyze(self, method, target, body):
+        parts, _ = _parts(target)
+        return 200, score(parts[1] if len(parts) > 1 else "")
+
+    def analyze_batch(self, method, target, body):
+        texts = _body(body).get("texts") or []
+        return 200, {"sentiments": [score(text) for text in texts]}
+
+    def routes(self):
+        return {"/analyze/": self.analyze,
+                "/analyze_batch": self.analyze_batch}
+
+
+class ChatAPI:
+    """POST /v1/chat/completions, plain or streamed (server-sent events)."""
+
+    def __init__(self, tokens=40):
+        self.tokens = tokens
+
+    def completions(self, method, target, body):
+        request = _body(body)
+        words = [f"word{i} " for i in range(self.tokens)]
+        base = {"id": "chatcmpl-bench", "created": 0,
+                "model": request.get("model", "bench")}
+        if not request.get("stream"):
+            return 200, {**base, "object": "chat.completion",
+                         "choices": [{"index": 0,
+                                      "message": {"role": "assistant",
+                                                  "content": "".join(words)},
+                                      "finish_reason": "stop"}],
+                         "usage": {"prompt_tokens": 0,
+                                   "completion_tokens": self.tokens,
+                                   "total_tokens": self.tokens}}
+        events = []
+        for word in words:
+            chunk = {**base, "object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": {"content": word},
+                                  "finish_reason": None}]}
+            events.append(f"data: {json.dumps(chunk)}\n\n")
+        events.append("data: [DONE]\n\n")
+        return 200, "".join(events).encode(), "text/event-stream"
+
+    def routes(self):
+        return {"/v1/chat/completions": self.completions}
+
+
+@contextlib.contextmanager
+def running_backends(latency=0.0, chat_latency=0.0, scale=1, chat_tokens=40):
+    """Starts all four stubs; yields (env for the Django tier, servers,
+    seed data)."""
+    data = seed_data(scale)
+    servers = {
+        "dealership": StubServer(DealershipAPI(data).routes(), latency),
+        "inventory": StubServer(InventoryAPI(data).routes(), latency),
+        "sentiment": StubServer(SentimentAPI().routes(), latency),
+        "chat": StubServer(ChatAPI(chat_tokens).routes(), chat_latency),
+    }
+    with contextlib.ExitStack() as stack:
+        for server in servers.values():
+            stack.enter_context(server)
+        env = {"backend_url": servers["dealership"].url,
+               "searchcars_url": servers["inventory"].url,
+               "sentiment_analyzer_url": servers["sentiment"].url + "/",
+               "OPENAI_BASE_URL": servers["chat"].url + "/v1",
+               "OpenAIAPIKey": "benchmark"}
+        yield env, servers, data
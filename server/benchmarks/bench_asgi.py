@@ -0,0 +1,55 @@
+# bench_asgi.py
+# Compares concurrent throughput of the Django tier in WSGI mode (sync
+# gunicorn workers, sync views) and ASGI mode (uvicorn workers, async
+# views) against local stub backends that add a fixed upstream latency.
+#
+#   python benchmarks/bench_asgi.py --latency 0.1 --concurrency 100
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from benchmarks.load import drive, gunicorn_server  # noqa: E402
+from benchmarks.stubs import StubServer  # noqa: E402
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_json(*parts):
+    with open(os.path.join(SERVER_DIR, *parts)) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--latency', type=float, default=0.1,
+                        help="seconds each stub backend call takes")
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=600)
+    parser.add_argument('--workers', type=int, default=3)
+    args = parser.parse_args()
+
+    dealers = load_json('database', 'data', 'dealerships.json')
+    routes = {"/fetchDealers": dealers['dealerships'],
+              "/fetchDealer/": dealers['dealerships'][:1]}
+    with StubServer(routes, latency=args.latency) as stub:
+        env = {"backend_url": stub.url,
+               "searchcars_url": stub.url,
+               "sentiment_analyzer_url": stub.url + "/"}
+        for mode in ('wsgi', 'asgi'):
+            env['SERVER_MODE'] = mode
+            env['ASYNC_PROXY_VIEWS'] = str(mode == 'asgi').lower()
+            with gunicorn_server(env, workers=args.workers) as url:
+                drive(url + "/djangoapp/get_dealers", 30, 90)  # warm up
+                stats = drive([url + "/djangoapp/get_dealers",
+                               url + "/djangoapp/dealer/1"],
+                              args.concurrency, args.requests)
+            print(f"{mode}: {json.dumps(stats)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# bench_conditional.py
+# Bytes on the wire and response time for repeat visits to the JSON list
+# endpoints the SPA reloads on every navigation, served by gunicorn from
+# the stub backends seeded with database/data/dealerships.json and
+# carsInventory/data/car_records.json:
+#
+#   plain        no Accept-Encoding or validators (what every visit cost
+#                before ETags and compression)
+#   compressed   first visit with Accept-Encoding: gzip, br
+#   revalidated  repeat visit sending the ETag back (304, empty body)
+#
+#   python benchmarks/bench_conditional.py --requests 200
+
+import argparse
+import http.client
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from benchmarks.backends import running_backends  # noqa: E402
+from benchmarks.load import SERVER_DIR, gunicorn_server, \
+    percentile  # noqa: E402
+
+ROUTES = ["/djangoapp/get_dealers", "/djangoapp/reviews/dealer/15",
+          "/djangoapp/get_cars", "/djangoapp/makes_models"]
+
+
+def fetch(conn, path, headers):
+    started = time.perf_counter()
+    conn.request("GET", path, headers=headers)
+    response = conn.getresponse()
+    body = response.read()
+    elapsed = (time.perf_counter() - started) * 1000
+    # Status line, headers and body as they crossed the socket
+    wire = len(f"HTTP/1.1 {response.status} {response.reason}\r\n") + \
+        len(str(response.headers)) + len(body)
+    return response, wire, elapsed
+
+
+def measure(netloc, path, headers, requests):
+    conn = http.client.HTTPConnection(netloc, timeout=30)
+    sizes, times = [], []
+    for _ in range(requests):
+        response, wire, elapsed = fetch(conn, path, headers)
+        sizes.append(wire)
+        times.append(elapsed)
+    conn.close()
+    return response, sum(sizes) / len(sizes), percentile(times, 50)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    with running_backends() as (env, _, _), \
+            tempfile.TemporaryDirectory() as tmp:
+        env.update({"SQLITE_PATH": os.path.join(tmp, "db.sqlite3"),
+                    "METRICS_DIR": os.path.join(tmp, "metrics"),
+                    "LOG_LEVEL": "WARNING"})
+        server_env = dict(os.environ)
+        server_env.update(env)
+        for command in (["migrate", "--run-syncdb"], ["seed_cars"]):
+            subprocess.run([sys.executable, "manage.py", *command,
+                            "--skip-checks"], cwd=SERVER_DIR,
+                           env=server_env, check=True, capture_output=True)
+        with gunicorn_server(env, workers=1) as url:
+            netloc = url.split("//", 1)[1]
+            accept = {"Accept-Encoding": "gzip, br"}
+            for path in ROUTES:
+                _, plain, plain_ms = measure(netloc, path, {},
+                                             args.requests)
+                first, packed, packed_ms = measure(netloc, path, accept,
+                                                   args.requests)
+                validator = {"If-None-Match": first.getheader("ETag")}
+                _, repeat, repeat_ms = measure(
+                    netloc, path, {**accept, **validator}, args.requests)
+                encoding = first.getheader("Content-Encoding", "identity")
+                print(f"{path:30} plain {plain:7.0f} B {plain_ms:6.2f} ms | "
+                      f"{encoding:8} {packed:6.0f} B {packed_ms:6.2f} ms | "
+                      f"304 {repeat:5.0f} B {repeat_ms:6.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
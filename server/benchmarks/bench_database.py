@@ -0,0 +1,100 @@
+# bench_database.py
+# Concurrent /djangoapp/register and /djangoapp/login throughput for each
+# database mode (see djangoproj/database.py). Every mode gets a fresh
+# database and a gunicorn server; sessions are stored in the database so
+# each login writes to it. Passwords are hashed with MD5 (see
+# fast_hash_settings.py) so the database, not PBKDF2, sets the pace;
+# --real-hash keeps the project's hashers. Failed requests are mostly
+# "database is locked" errors surfacing as 500s.
+#
+#   python benchmarks/bench_database.py --workers 4 --concurrency 32
+#
+# Pass --postgres to also run the pooled Postgres mode against the server
+# named by the POSTGRES_* variables (its database is flushed first).
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from benchmarks.load import SERVER_DIR, drive, gunicorn_server  # noqa: E402
+
+PASSWORD = "benchmark-password"
+
+MODES = {
+    "sqlite, connection per request": {
+        "DB_CONN_MAX_AGE": "0", "SQLITE_WAL": "false",
+        "SQLITE_TRANSACTION_MODE": "DEFERRED", "SQLITE_TIMEOUT": "5"},
+    "sqlite, WAL + persistent": {},
+    "postgres, pooled": {"DATABASE_ENGINE": "postgres"},
+}
+
+
+def users(prefix, count):
+    return [json.dumps({"userName": f"{prefix}-{i}", "password": PASSWORD,
+                        "firstName": "Bench", "lastName": "User",
+                        "email": f"{prefix}-{i}@example.com",
+                        "dealer_id": None, "user_type": "user"})
+            for i in range(count)]
+
+
+def prepare(env):
+    server_env = dict(os.environ)
+    server_env.update(env)
+    commands = [["migrate", "--run-syncdb"]]
+    if env.get("DATABASE_ENGINE") == "postgres":
+        commands.append(["flush", "--noinput"])
+    for command in commands:
+        subprocess.run([sys.executable, "manage.py", *command,
+                        "--skip-checks"], cwd=SERVER_DIR, env=server_env,
+                       check=True, capture_output=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=200,
+                        help="registrations (and then logins) per mode")
+    parser.add_argument('--postgres', action='store_true')
+    parser.add_argument('--real-hash', action='store_true')
+    args = parser.parse_args()
+
+    headers = {"Content-Type": "application/json"}
+    results = []
+    for mode, settings in MODES.items():
+        if mode.startswith("postgres") and not args.postgres:
+            continue
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {"SQLITE_PATH": os.path.join(tmp, "db.sqlite3"),
+                   "METRICS_DIR": os.path.join(tmp, "metrics"),
+                   "SESSION_STORE": "db", "LOG_LEVEL": "WARNING",
+                   **settings}
+            if not args.real_hash:
+                env["DJANGO_SETTINGS_MODULE"] = \
+                    "benchmarks.fast_hash_settings"
+            prepare(env)
+            bodies = users("bench", args.requests)
+            logins = [json.dumps({"userName": json.loads(body)["userName"],
+                                  "password": PASSWORD}) for body in bodies]
+            with gunicorn_server(env, workers=args.workers) as url:
+                for route, payload in (("register", bodies),
+                                       ("login", logins)):
+                    stats = drive(url + "/djangoapp/" + route,
+                                  args.concurrency, args.requests, 'POST',
+                                  payload, headers)
+                    results.append((mode, route, stats))
+
+    for mode, route, stats in results:
+        print(f"{mode:32} {route:9} {stats['rps']:7.1f} req/s  "
+              f"p50 {stats['p50_ms']:8.1f} ms  p99 {stats['p99_ms']:8.1f} ms"
+              f"  {stats['errors']} errors")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+# bench_dealer_geo.py
+# k-nearest dealer queries on --dealers synthetic dealers (copies of
+# database/data/dealerships.json scattered up to --spread-km around the
+# originals) with the k-d tree in djangoapp/dealer_geo.py, against linear
+# scans computing the haversine distance to every dealer, in Python and
+# vectorized with numpy. Every index answer is checked against the scan.
+#
+#   python benchmarks/bench_dealer_geo.py --dealers 100000 --k 10
+
+import argparse
+import heapq
+import json
+import math
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from benchmarks.load import SERVER_DIR, percentile  # noqa: E402
+from djangoapp.dealer_geo import EARTH_RADIUS_KM, DealerGeoIndex, \
+    haversine_km  # noqa: E402
+
+
+def synthetic_dealers(count, spread_km, seed=0):
+    with open(os.path.join(SERVER_DIR, 'database', 'data',
+                           'dealerships.json')) as f:
+        originals = json.load(f)['dealerships']
+    rng = random.Random(seed)
+    spread = spread_km / 111.0
+    dealers = []
+    for index in range(count):
+        dealer = dict(originals[index % len(originals)])
+        dealer["id"] = index + 1
+        dealer["lat"] = max(-90.0, min(90.0, dealer["lat"] +
+                                       rng.uniform(-spread, spread)))
+        dealer["long"] = dealer["long"] + rng.uniform(-spread, spread)
+        dealers.append(dealer)
+    return dealers
+
+
+def python_scan(dealers, lat, lon, k):
+    # What a client (or a view) looping over every dealer would do
+    lat, lon = math.radians(lat), math.radians(lon)
+    cos_lat = math.cos(lat)
+
+    def distance(dealer):
+        other = math.radians(dealer["lat"])
+        a = math.sin((other - lat) / 2) ** 2 + cos_lat * math.cos(other) * \
+            math.sin((math.radians(dealer["long"]) - lon) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+    return [dealer["id"] for dealer in
+            heapq.nsmallest(k, dealers, key=distance)]
+
+
+def numpy_scan(ids, lats, lons, lat, lon, k):
+    distances = haversine_km(lat, lon, lats, lons)
+    nearest = np.argpartition(distances, k - 1)[:k]
+    return ids[nearest[np.argsort(distances[nearest])]].tolist()
+
+
+def timed(func, queries):
+    samples, answers = [], []
+    for lat, lon in queries:
+        start = time.perf_counter()
+        answers.append(func(lat, lon))
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples, answers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--dealers', type=int, default=100000)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--scan-queries', type=int, default=20)
+    parser.add_argument('--spread-km', type=float, default=300)
+    args = parser.parse_args()
+
+    dealers = synthetic_dealers(args.dealers, args.spread_km)
+    start = time.perf_counter()
+    index = DealerGeoIndex(dealers)
+    print(f"{len(dealers)} dealers, index built in "
+          f"{(time.perf_counter() - start) * 1000:.0f} ms")
+
+    rng = random.Random(1)
+    # Around the dealers, as a map of the US would ask
+    queries = [(rng.uniform(25, 49), rng.uniform(-124, -67))
+               for _ in range(args.queries)]
+    ids = np.array([dealer["id"] for dealer in dealers])
+    lats = np.array([dealer["lat"] for dealer in dealers])
+    lons = np.array([dealer["long"] for dealer in dealers])
+
+    runs = {
+        "k-d tree": (lambda lat, lon: [
+            dealer["id"] for dealer, _ in index.nearest(lat, lon, args.k)],
+            queries),
+        "numpy scan": (lambda lat, lon: numpy_scan(ids, lats, lons, lat, lon,
+                                                   args.k),
+                       queries[:args.scan_queries * 10]),
+        "python scan": (lambda lat, lon: python_scan(dealers, lat, lon,
+                                                     args.k),
+                        queries[:args.scan_queries]),
+    }
+    answers = {}
+    for name, (func, sample) in runs.items():
+        samples, answers[name] = timed(func, sample)
+        print(f"{name:12} queries={len(sample):<6} "
+              f"p50={percentile(samples, 50):8.3f}ms  "
+              f"p99={percentile(samples, 99):8.3f}ms")
+    checked = min(len(found) for found in answers.values())
+    mismatches = sum(
+        answers["k-d tree"][i] != answers["numpy scan"][i] or
+        answers["k-d tree"][i] != answers["python scan"][i]
+        for i in range(checked))
+    print(f"{mismatches} of {checked} answers differ from the scans")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+# bench_inventory.py
+# Query latency of the in-process inventory index on a synthetic
+# inventory generated from carsInventory/data/car_records.json (each
+# record is copied with jittered year, mileage, price and dealer). A plain
+# Python scan over the same documents is timed for comparison, and page
+# numbers are compared with cursor pagination at increasing depth, and
+# facet counts are timed with and without cached filter masks.
+#
+#   python benchmarks/bench_inventory.py --cars 1000000
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'djangoproj.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from benchmarks.load import percentile  # noqa: E402
+from djangoapp import views  # noqa: E402
+from djangoapp.inventory_index import InventorySnapshot  # noqa: E402
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUERIES = {
+    "all, page 1": {},
+    "make": {"make": "Toyota"},
+    "make+model+year": {"make": "Audi", "model": "A4", "year": "2020"},
+    "price range": {"priceMin": "20000", "priceMax": "25000"},
+    "mileage+year, page 50": {"mileageMin": "10000", "mileageMax": "30000",
+                              "year": "2021", "page": "50"},
+    "sorted by -price": {"make": "Kia", "sort": "-price"},
+}
+
+
+def synthetic_inventory(count, seed=0):
+    path = os.path.join(SERVER_DIR, 'carsInventory', 'data',
+                        'car_records.json')
+    with open(path) as f:
+        records = json.load(f)['cars']
+    rng = random.Random(seed)
+    cars = []
+    for index in range(count):
+        car = dict(records[index % len(records)])
+        car["_id"] = f"{index:024x}"
+        car["year"] = max(2000, car["year"] - rng.randint(0, 5))
+        car["mileage"] = max(0, car["mileage"] + rng.randint(-5000, 40000))
+        car["price"] = max(1000, car["price"] + rng.randint(-8000, 8000))
+        car["dealer_id"] = rng.randint(1, 50)
+        car["__v"] = 0
+        cars.append(car)
+    return cars
+
+
+def scan(cars, params):
+    # What a per-request pass over the documents costs in Python
+    def wanted(car):
+        if params.get('make') and car['make'] != params['make']:
+            return False
+        if params.get('model') and car['model'] != params['model']:
+            return False
+        if params.get('year') and car['year'] < int(params['year']):
+            return False
+        for field in ('mileage', 'price'):
+            low = params.get(field + 'Min')
+            high = params.get(field + 'Max')
+            if low and high and not int(low) <= car[field] <= int(high):
+                return False
+        return True
+
+    matches = [car for car in cars if wanted(car)]
+    page, limit = int(params['page']), int(params['limit'])
+    return matches[(page - 1) * limit:page * limit], len(matches)
+
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--cars', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--scan-repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    cars = synthetic_inventory(args.cars)
+    start = time.perf_counter()
+    snapshot = InventorySnapshot(cars)
+    print(f"{len(cars)} cars, index built in "
+          f"{time.perf_counter() - start:.1f}s")
+    for name, query in QUERIES.items():
+        params = views.inventory_params(query)
+        total = snapshot.inventory(params)["totalCars"]
+        samples = timed(lambda: snapshot.inventory(params), args.repeat)
+        scan_ms = statistics.mean(
+            timed(lambda: scan(cars, params), args.scan_repeat))
+        print(f"{name:24} matches={total:<8} "
+              f"p50={percentile(samples, 50):7.2f}ms  "
+              f"p99={percentile(samples, 99):7.2f}ms  "
+              f"python scan={scan_ms:8.1f}ms")
+    facets(snapshot, args.repeat)
+    paging(snapshot, args.repeat)
+
+
+def facets(snapshot, repeat):
+    # Cold (fresh snapshot mask cache) and warm facet counts
+    for name, query in (("facets, no filters", {}),
+                        ("facets, make+price", {"make": "Kia",
+                                                "priceMin": "10000",
+                                                "priceMax": "40000"})):
+        params = views.inventory_params(query)
+        cold = []
+        for _ in range(min(repeat, 5)):
+            snapshot.masks.clear()
+            cold += timed(lambda: snapshot.facets(params), 1)
+        warm = timed(lambda: snapshot.facets(params), repeat)
+        print(f"{name:24} cold p50={percentile(cold, 50):7.2f}ms  "
+              f"warm p50={percentile(warm, 50):7.2f}ms")
+
+
+def cursor_at(snapshot, params, page):
+    # The cursor a client holds after scrolling to the given page
+    cursor = ""
+    for _ in range(page - 1):
+        cursor = snapshot.keyset_page(params, cursor)["nextCursor"]
+    return cursor
+
+
+def paging(snapshot, repeat, pages=(1, 100, 1000)):
+    for name, query in (("price order", {"sort": "price"}),
+                        ("make, price order", {"make": "Kia",
+                                               "sort": "price"})):
+        for page in pages:
+            params = views.inventory_params({**query, "page": str(page)})
+            offset = timed(lambda: snapshot.inventory(params), repeat)
+            cursor = cursor_at(snapshot, params, page)
+            keyset = timed(lambda: snapshot.keyset_page(params, cursor),
+                           repeat)
+            print(f"{name:18} page {page:<5} "
+                  f"page number p50={percentile(offset, 50):7.2f}ms  "
+                  f"cursor p50={percentile(keyset, 50):7.3f}ms")
+
+
+if __name__ == '__main__':
+    main()
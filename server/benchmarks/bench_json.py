@@ -0,0 +1,100 @@
+# bench_json.py
+# Time and peak memory to serialize and send a large inventory response
+# ({"status": 200, "cars": [...]}) of --cars synthetic records:
+#
+#   stdlib       django.http.JsonResponse (json.dumps, one string)
+#   orjson       djangoapp.fast_json.JsonResponse (orjson, one bytes)
+#   streamed     json_list_response over the list, in STREAM_JSON_BATCH
+#                chunks
+#   index        json_list_response over InventorySnapshot.iter_records,
+#                as get_inventory does: records are built batch by batch
+#
+# Each mode runs in its own process so peak RSS (ru_maxrss) is not shared;
+# memory is reported as the peak above what the process held once the
+# records (or the index) were loaded. The body is consumed chunk by chunk
+# and discarded, as a server writing to a socket would.
+#
+#   python benchmarks/bench_json.py --cars 100000
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'djangoproj.settings')
+
+MODES = ("stdlib", "orjson", "streamed", "index")
+
+
+def peak_rss_kb():
+    # Kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run(mode, count):
+    import django
+
+    django.setup()
+
+    from benchmarks.bench_inventory import synthetic_inventory
+    from django import http
+    from djangoapp import fast_json
+    from djangoapp.inventory_index import InventorySnapshot
+
+    cars = synthetic_inventory(count)
+    if mode == "index":
+        snapshot = InventorySnapshot(cars)
+        del cars
+        rows = snapshot.rows(snapshot.match())
+    envelope = {"status": 200}
+    baseline = peak_rss_kb()
+
+    start = time.perf_counter()
+    if mode == "stdlib":
+        response = http.JsonResponse({**envelope, "cars": cars})
+    elif mode == "orjson":
+        response = fast_json.JsonResponse({**envelope, "cars": cars})
+    elif mode == "streamed":
+        response = fast_json.json_list_response(envelope, "cars", cars)
+    else:
+        response = fast_json.json_list_response(
+            envelope, "cars", snapshot.iter_records(rows), count=len(rows))
+    size = 0
+    for chunk in response:
+        size += len(chunk)
+    elapsed = time.perf_counter() - start
+    return {"ms": elapsed * 1000, "bytes": size,
+            "streaming": response.streaming,
+            "peak_kb": peak_rss_kb() - baseline}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--cars', type=int, default=100000)
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run(args.mode, args.cars)))
+        return
+
+    print(f"{args.cars} cars")
+    for mode in MODES:
+        output = subprocess.run(
+            [sys.executable, __file__, '--mode', mode,
+             '--cars', str(args.cars)],
+            check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.splitlines()[-1])
+        print(f"{mode:10} {result['ms']:8.1f} ms  "
+              f"{result['bytes'] / 1e6:6.1f} MB body  "
+              f"peak +{result['peak_kb'] / 1024:6.1f} MB RSS"
+              f"{'  (streamed)' if result['streaming'] else ''}")
+
+
+if __name__ == '__main__':
+    main()
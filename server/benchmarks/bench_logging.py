@@ -0,0 +1,130 @@
+# bench_logging.py
+# Request throughput with the old print() lines vs the queued JSON logging
+# pipeline. Each simulated request does a little JSON work and emits the
+# lines a dealer-reviews request used to print (upstream URLs, one line
+# per sentiment result), from several threads at once. stdout is a pipe
+# drained by another thread, as under a container runtime, and is line
+# buffered like a PYTHONUNBUFFERED container.
+#
+#   python benchmarks/bench_logging.py --threads 8 --requests 5000
+
+import argparse
+import io
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SERVER_DIR, 'djangoapp', 'microservices'))
+
+from json_logging import QueueJsonHandler, request_id, \
+    skip_record_details  # noqa: E402
+
+REVIEWS = [{"id": i, "review": "Great service, would buy again",
+            "sentiment": {"sentiment": "positive", "scores": {"pos": 0.6}}}
+           for i in range(10)]
+URL = "http://localhost:3030/fetchReviews/dealer/15?"
+
+
+def work():
+    return json.dumps({"status": 200, "reviews": REVIEWS})
+
+
+def print_request(n):
+    print("GET from {} ".format(URL))
+    for review in REVIEWS:
+        print(review["sentiment"])
+    print("GET request call complete!")
+    return work()
+
+
+logger = logging.getLogger("bench.restapis")
+
+
+def logging_request(n):
+    token = request_id.set(f"req-{n}")
+    try:
+        logger.debug("GET %s", URL)
+        for review in REVIEWS:
+            logger.debug("Sentiment %s", review["sentiment"])
+        logger.info("Reviews for dealer %d", 15,
+                    extra={"reviews": len(REVIEWS), "elapsed_ms": 1.2})
+        return work()
+    finally:
+        request_id.reset(token)
+
+
+def pipe_stdout():
+    read_fd, write_fd = os.pipe()
+
+    def drain():
+        with os.fdopen(read_fd, 'rb') as f:
+            while f.read(65536):
+                pass
+    threading.Thread(target=drain, daemon=True).start()
+    return io.TextIOWrapper(os.fdopen(write_fd, 'wb'), line_buffering=True)
+
+
+def run(handle, threads, requests):
+    barrier = threading.Barrier(threads + 1)
+
+    def client(offset):
+        barrier.wait()
+        for n in range(offset, offset + requests):
+            handle(n)
+
+    workers = [threading.Thread(target=client, args=(i * requests,))
+               for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    return threads * requests / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=5000,
+                        help="requests per thread")
+    args = parser.parse_args()
+    # As settings.py does for the Django app
+    skip_record_details()
+
+    real_stdout = sys.stdout
+    sys.stdout = stdout = pipe_stdout()
+    results = []
+    try:
+        results.append(("print()", run(print_request, args.threads,
+                                       args.requests)))
+        for label, level, sample in (
+                ("queued JSON, INFO", logging.INFO, ""),
+                ("queued JSON, DEBUG 1/100", logging.DEBUG,
+                 "bench.restapis=100"),
+                ("queued JSON, DEBUG all", logging.DEBUG, "")):
+            # Undo the previous run's sampling
+            vars(logger).pop('isEnabledFor', None)
+            handler = QueueJsonHandler(stream=stdout, maxsize=100000,
+                                       sample=sample)
+            logger.handlers = [handler]
+            logger.setLevel(level)
+            logger.propagate = False
+            try:
+                rate = run(logging_request, args.threads, args.requests)
+            finally:
+                handler.close()
+            results.append((label + (f" ({handler.dropped} dropped)"
+                                     if handler.dropped else ""), rate))
+    finally:
+        sys.stdout = real_stdout
+    for label, rate in results:
+        print(f"{label:40} {rate:10,.0f} requests/sec")
+
+
+if __name__ == '__main__':
+    main()
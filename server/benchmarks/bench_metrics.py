@@ -0,0 +1,77 @@
+# bench_metrics.py
+# Per-request cost of the metrics middleware and of timing an upstream
+# call: a no-op view is called directly and through metrics_middleware,
+# and the difference is reported in microseconds. Also times a scrape
+# (render) of the resulting series.
+#
+#   python benchmarks/bench_metrics.py --requests 200000
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'djangoproj.settings')
+os.environ['METRICS_DIR'] = ''
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.http import HttpResponse  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+from django.urls import resolve  # noqa: E402
+
+from djangoapp.metrics import metrics  # noqa: E402
+from djangoapp.middleware import metrics_middleware  # noqa: E402
+
+RESPONSE = HttpResponse(b"")
+
+
+def noop_view(request):
+    return RESPONSE
+
+
+def per_call(fn, arg, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        fn(arg)
+    return (time.perf_counter() - started) / count * 1e6
+
+
+def timed_upstream(_):
+    with metrics.upstream("backend", "/fetchDealers") as timer:
+        timer.status = 200
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=200000)
+    args = parser.parse_args()
+
+    request = RequestFactory().get("/djangoapp/get_dealers")
+    request.resolver_match = resolve("/djangoapp/get_dealers")
+    instrumented = metrics_middleware(noop_view)
+    per_call(instrumented, request, 1000)  # warm up
+
+    plain = min(per_call(noop_view, request, args.requests)
+                for _ in range(3))
+    wrapped = min(per_call(instrumented, request, args.requests)
+                  for _ in range(3))
+    upstream = min(per_call(timed_upstream, None, args.requests)
+                   for _ in range(3))
+    print(f"no-op view           {plain:6.2f} us")
+    print(f"through middleware   {wrapped:6.2f} us "
+          f"(+{wrapped - plain:.2f} us)")
+    print(f"upstream timer       {upstream:6.2f} us")
+
+    started = time.perf_counter()
+    text = metrics.render()
+    print(f"scrape               {(time.perf_counter() - started) * 1e3:6.2f}"
+          f" ms ({len(text.splitlines())} lines)")
+
+
+if __name__ == '__main__':
+    main()
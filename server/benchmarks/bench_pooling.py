@@ -0,0 +1,58 @@
+# bench_pooling.py
+# Measures p50/p99 latency of restapis.get_request against a local stub
+# server, with and without the pooled keep-alive session.
+#
+#   python benchmarks/bench_pooling.py --requests 2000
+
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from benchmarks.stubs import StubServer  # noqa: E402
+from djangoapp import http_client, restapis  # noqa: E402
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(count, pooling):
+    http_client.pooling_enabled = pooling
+    http_client.close_session()
+    samples = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(count):
+            start = time.perf_counter()
+            restapis.get_request("/fetchDealers")
+            samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=1000)
+    args = parser.parse_args()
+
+    dealers = [{"id": i, "state": "Texas"} for i in range(50)]
+    with StubServer({"/fetchDealers": dealers}) as stub:
+        restapis.backend_url = stub.url
+        run(50, True)  # warm up
+        for pooling in (False, True):
+            samples = run(args.requests, pooling)
+            print(f"pooling={str(pooling):5}  n={len(samples)}  "
+                  f"p50={percentile(samples, 50):.3f}ms  "
+                  f"p99={percentile(samples, 99):.3f}ms  "
+                  f"mean={statistics.mean(samples):.3f}ms")
+
+
+if __name__ == '__main__':
+    main()
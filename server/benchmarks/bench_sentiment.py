@@ -0,0 +1,57 @@
+# bench_sentiment.py
+# Scores the review texts from database/data/reviews.json with the
+# sentiment service's engine, in-process and with the forked worker pool,
+# and reports texts/sec for each. Needs the microservice's requirements
+# (nltk and the VADER lexicon).
+#
+#   python benchmarks/bench_sentiment.py --repeat 50 --workers 4
+
+import argparse
+import json
+import os
+import sys
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SERVER_DIR, 'djangoapp', 'microservices'))
+
+from engine import ScoringEngine  # noqa: E402
+
+
+def load_texts():
+    path = os.path.join(SERVER_DIR, 'database', 'data', 'reviews.json')
+    with open(path) as f:
+        return [review['review'] for review in json.load(f)['reviews']]
+
+
+def run(engine, texts, batch_size):
+    started = time.perf_counter()
+    for i in range(0, len(texts), batch_size):
+        engine.score_batch(texts[i:i + batch_size])
+    return len(texts) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=20,
+                        help="times to score the full set of reviews")
+    parser.add_argument('--workers', type=int,
+                        default=os.cpu_count() or 1)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    texts = load_texts() * args.repeat
+    print(f"{len(texts)} texts, batches of {args.batch_size}")
+    for workers in (1, args.workers):
+        engine = ScoringEngine(workers=workers).start()
+        try:
+            run(engine, texts[:args.batch_size], args.batch_size)  # warm up
+            rate = run(engine, texts, args.batch_size)
+        finally:
+            engine.close()
+        mode = "single" if workers == 1 else f"pooled({workers})"
+        print(f"{mode:12}  {rate:,.0f} texts/sec")
+
+
+if __name__ == '__main__':
+    main()
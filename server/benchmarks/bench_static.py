@@ -0,0 +1,107 @@
+# bench_static.py
+# Requests/sec for the SPA catch-all route and for a large JS bundle with
+# FRONTEND_SERVING=template (index.html rendered per request, files sent
+# by django.views.static) and FRONTEND_SERVING=precompressed (index.html
+# from memory, collectstatic's .gz/.br copies, immutable caching). The
+# frontend is not built here, so a React-like build (index.html and a
+# minified-looking bundle of --bundle-kb) is generated and collected into
+# a temporary STATIC_ROOT first.
+#
+#   python benchmarks/bench_static.py --requests 2000 --concurrency 20
+
+import argparse
+import http.client
+import os
+import random
+import string
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from benchmarks.load import SERVER_DIR, drive, gunicorn_server  # noqa: E402
+
+BUNDLE = "static/js/main.5f2c9e1a.js"
+
+
+def fake_bundle(kb):
+    # Short random identifiers in repeated code shapes compress about as
+    # well as a real minified bundle (3-4x)
+    rng = random.Random(7)
+    parts, size = [], 0
+    while size < kb * 1024:
+        a, b, c = ("".join(rng.choices(string.ascii_letters, k=3))
+                   for _ in range(3))
+        word = rng.choice(['dealer', 'review', 'car', 'state'])
+        part = (f"function {a}({b},{c}){{return {b}.{a}?"
+                f"{c}[{rng.randint(0, 99)}]:\"{word}\"+{b}.length}};")
+        parts.append(part)
+        size += len(part)
+    return "".join(parts)
+
+
+def fake_build(directory, kb):
+    with open(os.path.join(SERVER_DIR, 'frontend', 'public',
+                           'index.html')) as f:
+        index = f.read().replace("%PUBLIC_URL%", "").replace(
+            "</body>", f'<script defer src="/{BUNDLE}"></script></body>')
+    os.makedirs(os.path.join(directory, os.path.dirname(BUNDLE)))
+    with open(os.path.join(directory, "index.html"), "w") as f:
+        f.write(index)
+    with open(os.path.join(directory, BUNDLE), "w") as f:
+        f.write(fake_bundle(kb))
+
+
+def wire_bytes(url, path, headers):
+    conn = http.client.HTTPConnection(url.split("//", 1)[1], timeout=30)
+    conn.request("GET", path, headers=headers)
+    response = conn.getresponse()
+    size = len(response.read())
+    conn.close()
+    return size, response.getheader("Content-Encoding", "identity")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--bundle-kb', type=int, default=500)
+    args = parser.parse_args()
+
+    headers = {"Accept-Encoding": "gzip, deflate, br"}
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        build = os.path.join(tmp, "build")
+        fake_build(build, args.bundle_kb)
+        env = {"FRONTEND_BUILD_DIR": build,
+               "STATIC_ROOT": os.path.join(tmp, "static"),
+               "SQLITE_PATH": os.path.join(tmp, "db.sqlite3"),
+               "METRICS_DIR": os.path.join(tmp, "metrics"),
+               "LOG_LEVEL": "WARNING"}
+        server_env = dict(os.environ)
+        server_env.update(env)
+        subprocess.run([sys.executable, "manage.py", "collectstatic",
+                        "--noinput", "--skip-checks"], cwd=SERVER_DIR,
+                       env=server_env, check=True, capture_output=True)
+        for mode in ("template", "precompressed"):
+            with gunicorn_server({**env, "FRONTEND_SERVING": mode},
+                                 workers=args.workers) as url:
+                for label, path in (("catch-all /dealers", "/dealers"),
+                                    ("bundle", "/" + BUNDLE)):
+                    drive(url + path, 4, 50, headers=headers)  # warm up
+                    stats = drive(url + path, args.concurrency,
+                                  args.requests, headers=headers)
+                    results.append((mode, label, stats,
+                                    wire_bytes(url, path, headers)))
+
+    for mode, label, stats, (size, encoding) in results:
+        print(f"{mode:14} {label:20} {stats['rps']:8.1f} req/s  "
+              f"p50 {stats['p50_ms']:7.2f} ms  p99 {stats['p99_ms']:7.2f} ms"
+              f"  {size:8,d} B {encoding}")
+
+
+if __name__ == '__main__':
+    main()
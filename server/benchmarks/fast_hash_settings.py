@@ -0,0 +1,8 @@
+# fast_hash_settings.py
+# Project settings with a cheap password hasher, for benchmarks that sign
+# users in and want to measure the database rather than PBKDF2. Never use
+# outside benchmarks.
+
+from djangoproj.settings import *  # noqa: F401,F403
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
@@ -0,0 +1,128 @@
+# load.py
+# Helpers shared by the load-test benchmarks: start the Django tier under
+# gunicorn in a subprocess and drive it with many concurrent clients.
+
+import contextlib
+import http.client
+import itertools
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+@contextlib.contextmanager
+def gunicorn_server(env, workers=3):
+    """Run gunicorn with gunicorn.conf.py and yield its base URL."""
+    port = free_port()
+    server_env = dict(os.environ)
+    server_env.update(env)
+    server_env['GUNICORN_BIND'] = f"127.0.0.1:{port}"
+    server_env['GUNICORN_WORKERS'] = str(workers)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py'],
+        cwd=SERVER_DIR, env=server_env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                with socket.create_connection(('127.0.0.1', port), 0.2):
+                    break
+            except OSError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("gunicorn failed to start")
+                time.sleep(0.1)
+        yield url
+    finally:
+        process.terminate()
+        process.wait(10)
+
+
+def _drive(urls, concurrency, total, method, body, headers):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    issued = itertools.count()
+
+    def worker():
+        connections = {}
+        while True:
+            index = next(issued)
+            if index >= total:
+                break
+            url = urls[index % len(urls)]
+            parts = urlsplit(url)
+            path = parts.path + ('?' + parts.query if parts.query else '')
+            start = time.perf_counter()
+            failed = False
+            try:
+                conn = connections.get(parts.netloc)
+                if conn is None:
+                    conn = http.client.HTTPConnection(parts.netloc, timeout=60)
+                    connections[parts.netloc] = conn
+                payload = body[index % len(body)] \
+                    if isinstance(body, list) else body
+                conn.request(method, path, body=payload,
+                             headers=headers or {})
+                response = conn.getresponse()
+                response.read()
+                failed = response.status >= 400
+                if response.getheader('Connection', '').lower() == 'close':
+                    conn.close()
+                    connections.pop(parts.netloc)
+            except (OSError, http.client.HTTPException):
+                failed = True
+                connections.pop(parts.netloc, None)
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+                errors[0] += failed
+        for conn in connections.values():
+            conn.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {"requests": len(latencies),
+            "errors": errors[0],
+            "seconds": round(elapsed, 3),
+            "rps": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2)}
+
+
+def drive(urls, concurrency=50, total=500, method='GET', body=None,
+          headers=None):
+    """Issue ``total`` requests from ``concurrency`` keep-alive clients.
+
+    ``urls`` and ``body`` may be lists, used in turn by successive requests.
+    """
+    if isinstance(urls, str):
+        urls = [urls]
+    return _drive(urls, concurrency, total, method, body, headers)
@@ -0,0 +1,115 @@
+# stubs.py
+# Minimal local HTTP servers that stand in for the dealership, inventory,
+# sentiment and chat backends, so the Django tier can be benchmarked and
+# tested without MongoDB, Node, Flask or OpenAI.
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections open so pooled clients can reuse them
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without TCP_NODELAY the
+    # body waits on the client's delayed ACK on every reused connection.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _dispatch(self, method):
+        stub = self.server.stub
+        path = self.path.split('?', 1)[0]
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        with stub.lock:
+            stub.hits[path] = stub.hits.get(path, 0) + 1
+        if stub.latency:
+            time.sleep(stub.latency)
+        status, payload, *content_type = stub.respond(method, self.path,
+                                                      body)
+        if not isinstance(payload, bytes):
+            payload = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type',
+                         content_type[0] if content_type
+                         else 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        try:
+            self.end_headers()
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up first (a timeout under test)
+            self.close_connection = True
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Load tests open hundreds of connections at once
+    request_queue_size = 512
+
+
+class StubServer:
+    """A threaded JSON server on an ephemeral localhost port.
+
+    ``routes`` maps a path prefix to either a JSON-serialisable payload or a
+    callable ``(method, path, body) -> (status, payload)``, where ``path``
+    still has its query string and ``payload`` may be bytes. A callable may
+    return a third item, the response's content type. The longest matching
+    prefix wins; unknown paths return 404.
+    """
+
+    def __init__(self, routes=None, latency=0.0):
+        self.routes = dict(routes or {})
+        self.latency = latency
+        self.hits = {}
+        self.lock = threading.Lock()
+        self.httpd = StubHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.httpd.stub = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def respond(self, method, target, body):
+        path = target.split('?', 1)[0]
+        for prefix in sorted(self.routes, key=len, reverse=True):
+            if path.startswith(prefix):
+                route = self.routes[prefix]
+                if callable(route):
+                    return route(method, target, body)
+                return 200, route
+        return 404, {"error": "not found"}
+
+    def total_hits(self):
+        with self.lock:
+            return sum(self.hits.values())
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class DjangoappConfig(AppConfig):
     name = 'djangoapp'
+
+    def ready(self):
+        from . import signals
+        signals.connect()
@@ -0,0 +1,147 @@
+# async_restapis.py
+# Async counterparts of the read-only helpers in restapis.py, used by the
+# async proxy views. URLs, sentiment caching and error handling are shared
+# with restapis.py; only the transport is the pooled aiohttp session.
+
+import logging
+
+from asgiref.sync import sync_to_async
+
+from . import http_client
+from . import restapis
+from .circuit_breaker import breakers
+from .last_known_good import last_known_good
+from .metrics import metrics
+from .response_cache import response_cache
+from .sentiment_cache import sentiment_cache
+from .single_flight import upstream_gets
+
+logger = logging.getLogger(__name__)
+
+
+def off_loop(func):
+    # For file cache I/O and local scoring, which would block the event loop
+    return sync_to_async(func, thread_sensitive=False)
+
+
+async def upstream_call(upstream, request_url, send, endpoint=None):
+    endpoint = endpoint or restapis.endpoint_label(request_url)
+
+    async def timed():
+        with metrics.upstream(upstream, endpoint) as timer:
+            response = await send()
+            timer.status = response.status_code
+        return response
+    return await breakers[upstream].acall(timed)
+
+
+async def shared_get(request_url, upstream, endpoint=None):
+    return await upstream_gets.ado(
+        request_url,
+        lambda: upstream_call(upstream, request_url,
+                              lambda: http_client.aget(request_url),
+                              endpoint))
+
+
+async def read_json(request_url, upstream, fallback=True):
+    logger.debug("GET %s", request_url)
+    try:
+        response = await shared_get(request_url, upstream)
+        if response.status_code < 500:
+            if response.status_code < 400:
+                last_known_good.remember(request_url, response.content)
+            return response.json()
+        logger.warning("Upstream %s returned %s", upstream,
+                       response.status_code)
+    except Exception as err:
+        logger.warning("Request to %s failed %r", upstream, err)
+    if fallback:
+        return last_known_good.recall(request_url, upstream)
+
+
+async def get_request(endpoint, **kwargs):
+    return await read_json(restapis.backend_request_url(endpoint, **kwargs),
+                           "backend")
+
+
+async def searchcars_request(endpoint, **kwargs):
+    return await read_json(
+        restapis.searchcars_request_url(endpoint, **kwargs), "searchcars")
+
+
+async def cached_read_json(namespace, request_url, upstream):
+    value = await response_cache.aget_or_fetch(
+        namespace, request_url,
+        lambda: read_json(request_url, upstream, fallback=False))
+    if value is None:
+        value = last_known_good.recall(request_url, upstream)
+    return value
+
+
+async def cached_get_request(namespace, endpoint, **kwargs):
+    return await cached_read_json(
+        namespace, restapis.backend_request_url(endpoint, **kwargs),
+        "backend")
+
+
+async def cached_searchcars_request(namespace, endpoint, **kwargs):
+    return await cached_read_json(
+        namespace, restapis.searchcars_request_url(endpoint, **kwargs),
+        "searchcars")
+
+
+async def _fetch_sentiment(text):
+    if restapis.sentiment_engine == "local":
+        return await off_loop(restapis._fetch_sentiment)(text)
+    request_url = restapis.sentiment_request_url(text)
+    response = await shared_get(request_url, "sentiment",
+                                "/analyze/:text")
+    return response.json()
+
+
+def _cached_sentiment(text, review_id):
+    sentiment_cache.remember_review(review_id, text)
+    return sentiment_cache.get(text)
+
+
+async def analyze_review_sentiments(text, review_id=None):
+    if restapis.sentiment_engine == "local":
+        return await off_loop(restapis.analyze_review_sentiments)(text,
+                                                                  review_id)
+    cached = await off_loop(_cached_sentiment)(text, review_id)
+    if cached is not None:
+        return cached
+    try:
+        result = await _fetch_sentiment(text)
+        if 'sentiment' in result:
+            await off_loop(sentiment_cache.set)(text, result)
+        return result
+    except Exception as err:
+        logger.warning("Sentiment request failed %r", err)
+
+
+async def analyze_review_sentiments_batch(texts, review_ids=None):
+    if restapis.sentiment_engine == "local":
+        return await off_loop(restapis.analyze_review_sentiments_batch)(
+            texts, review_ids)
+    texts = list(texts)
+    results, pending = await off_loop(restapis.split_cached_sentiments)(
+        texts, review_ids)
+    if not pending:
+        return results
+
+    request_url = restapis.sentiment_analyzer_url+"analyze_batch"
+    try:
+        response = await upstream_call(
+            "sentiment", request_url,
+            lambda: http_client.apost(request_url, json={"texts": pending}))
+        if response.status_code in (404, 405):
+            # Older analyzer deployments only have the per-text endpoint
+            sentiments = [await _fetch_sentiment(text) for text in pending]
+        else:
+            sentiments = response.json()['sentiments']
+        return await off_loop(restapis.merge_scored_sentiments)(
+            texts, results, pending, sentiments)
+    except Exception as err:
+        logger.warning("Sentiment batch request failed %r", err)
+        return results
@@ -0,0 +1,256 @@
+# async_views.py
+# Async versions of the proxy views in views.py. They do the same work and
+# return the same JSON, but await upstream I/O on the pooled async client
+# instead of holding a worker thread, so an ASGI worker can serve many
+# in-flight requests at once. urls.py routes to these when
+# ASYNC_PROXY_VIEWS is enabled (the default for SERVER_MODE=asgi).
+
+import asyncio
+import json
+import logging
+import time
+
+import openai
+from asgiref.sync import sync_to_async
+
+from . import views
+from .chat import areply, areply_tokens, asse_tokens, chat_context, \
+    event_stream_response, wants_stream
+from .conditional import conditional_get
+from .dealer_geo import dealer_locator
+from .fast_json import JsonResponse, json_list_response
+from .inventory_index import current_snapshot
+from .async_restapis import get_request, analyze_review_sentiments, \
+    analyze_review_sentiments_batch, searchcars_request, \
+    cached_get_request, cached_searchcars_request, off_loop
+
+logger = logging.getLogger(__name__)
+
+
+@conditional_get
+async def get_dealerships(request, state="All"):
+    if (state == "All"):
+        endpoint = "/fetchDealers"
+    else:
+        endpoint = "/fetchDealers/"+state
+    dealerships = await cached_get_request("dealers", endpoint)
+    if isinstance(dealerships, list):
+        return json_list_response({"status": 200}, "dealers", dealerships,
+                                  asynchronous=True)
+    return JsonResponse({"status": 200, "dealers": dealerships})
+
+
+async def nearby_dealers(request):
+    try:
+        lat, lon, k, radius = views.nearby_params(request.GET)
+    except ValueError:
+        return JsonResponse({"status": 400, "message": "Bad Request"})
+    dealerships = await cached_get_request("dealers", "/fetchDealers")
+    if not isinstance(dealerships, list):
+        return JsonResponse({"status": 503,
+                             "message": "Dealers unavailable"})
+    if not dealer_locator.indexed(dealerships):
+        # Digesting, and maybe indexing, a new list is CPU work
+        await off_loop(dealer_locator.index_for)(dealerships)
+    return JsonResponse({"status": 200,
+                         "dealers": dealer_locator.nearby(
+                             dealerships, lat, lon, k, radius)})
+
+
+@conditional_get
+async def get_dealer_reviews(request, dealer_id):
+    if (dealer_id):
+        endpoint = "/fetchReviews/dealer/"+str(dealer_id)
+        reviews = await get_request(endpoint)
+        # None when the backend is down; its error body on a 4xx
+        if not isinstance(reviews, list):
+            return JsonResponse({"status": 503,
+                                 "message": "Reviews unavailable"})
+        sentiments = await analyze_review_sentiments_batch(
+            [review_detail['review'] for review_detail in reviews],
+            [review_detail.get('id') for review_detail in reviews])
+        views.attach_sentiments(reviews, sentiments)
+        return json_list_response({"status": 200}, "reviews", reviews,
+                                  asynchronous=True)
+    else:
+        return JsonResponse({"status": 400, "message": "Bad Request"})
+
+
+async def get_review(request, review_id):
+    if (review_id):
+        endpoint = "/fetchReviews/"+str(review_id)
+        review = await get_request(endpoint)
+        if isinstance(review, list) and review:
+            response = await analyze_review_sentiments(review[0]['review'],
+                                                       review[0].get('id'))
+            if response is not None:
+                review[0]['sentiment'] = response['sentiment']
+            else:
+                review[0]['sentiment'] = ""
+            return JsonResponse({"status": 200, "reviews": review[0]})
+        else:
+            return JsonResponse({"status": 400, "message": "review not found"})
+    else:
+        return JsonResponse({"status": 400, "message": "Bad Request"})
+
+
+async def get_dealer_details(request, dealer_id):
+    if (dealer_id):
+        endpoint = "/fetchDealer/"+str(dealer_id)
+        dealership = await cached_get_request("dealers", endpoint)
+        return JsonResponse({"status": 200, "dealer": dealership})
+    else:
+        return JsonResponse({"status": 400, "message": "Bad Request"})
+
+
+async def _leg(task, name, deadline, errors, default):
+    try:
+        value = await asyncio.wait_for(
+            asyncio.shield(task), max(0.0, deadline - time.monotonic()))
+    except asyncio.TimeoutError:
+        errors[name] = "timeout"
+        return default
+    except Exception as err:
+        logger.warning("Fan-out leg %s failed %r", name, err)
+        errors[name] = "error"
+        return default
+    if value is None:
+        errors[name] = "unavailable"
+        return default
+    return value
+
+
+async def get_dealer_page(request, dealer_id):
+    if not dealer_id:
+        return JsonResponse({"status": 400, "message": "Bad Request"})
+    started = time.monotonic()
+    timeouts = views.DEALER_PAGE_TIMEOUTS
+    errors = {}
+    dealer_task = asyncio.create_task(
+        cached_get_request("dealers", "/fetchDealer/"+str(dealer_id)))
+    reviews_task = asyncio.create_task(
+        get_request("/fetchReviews/dealer/"+str(dealer_id)))
+    inventory_task = asyncio.create_task(
+        searchcars_request("/cars/"+str(dealer_id)))
+
+    reviews = await _leg(reviews_task, "reviews",
+                         started + timeouts["reviews"], errors, [])
+    if not isinstance(reviews, list):
+        # The backend's error body on a 4xx
+        errors["reviews"] = "unavailable"
+        reviews = []
+    if reviews:
+        sentiments_task = asyncio.create_task(analyze_review_sentiments_batch(
+            [review_detail['review'] for review_detail in reviews],
+            [review_detail.get('id') for review_detail in reviews]))
+        sentiments = await _leg(sentiments_task, "sentiments",
+                                started + timeouts["sentiments"], errors,
+                                [None] * len(reviews))
+        views.attach_sentiments(reviews, sentiments)
+
+    dealer = await _leg(dealer_task, "dealer",
+                        started + timeouts["dealer"], errors, [])
+    inventory = await _leg(inventory_task, "inventory",
+                           started + timeouts["inventory"], errors, [])
+    return JsonResponse({"status": 200,
+                         "dealer": dealer,
+                         "reviews": reviews,
+                         "cars": inventory,
+                         "partial": bool(errors),
+                         "errors": errors})
+
+
+async def get_inventory(request, dealer_id):
+    data = request.GET
+    if (dealer_id):
+        snapshot = await sync_to_async(current_snapshot,
+                                       thread_sensitive=False)()
+        if snapshot is not None:
+            rows = snapshot.dealer_rows(dealer_id, data)
+            if not isinstance(rows, dict):
+                return json_list_response({"status": 200}, "cars",
+                                          snapshot.iter_records(rows),
+                                          count=len(rows), asynchronous=True)
+            cars = rows
+        else:
+            cars = await searchcars_request(
+                views.inventory_endpoint(dealer_id, data))
+            if isinstance(cars, list):
+                return json_list_response({"status": 200}, "cars", cars,
+                                          asynchronous=True)
+        return JsonResponse({"status": 200, "cars": cars})
+    else:
+        return JsonResponse({"status": 400, "message": "Bad Request"})
+
+
+async def full_inventory(request):
+    endpoint = "/inventory/"
+
+    try:
+        params = views.inventory_params(request.GET)
+        cursor = request.GET.get('cursor')
+        snapshot = await sync_to_async(current_snapshot,
+                                       thread_sensitive=False)()
+        if cursor is not None and snapshot is not None:
+            return JsonResponse(snapshot.keyset_page(params, cursor))
+        if cursor is not None:
+            cars = await searchcars_request(
+                endpoint, **views.service_cursor_params(params, cursor))
+            return JsonResponse(views.service_cursor_page(cars))
+        if snapshot is not None:
+            cars = snapshot.inventory(params)
+        else:
+            cars = await searchcars_request(endpoint, **params)
+        return JsonResponse(views.inventory_page(cars))
+    except ValueError:
+        return JsonResponse({"status": 400, "message": "Bad Request"})
+    except Exception:
+        logger.exception("Error getting full inventory")
+        return JsonResponse({"status": 500,
+                             "error": "An internal error has occurred!"})
+
+
+async def chat_view(request):
+    if request.method == 'POST':
+        started = time.perf_counter()
+        body = json.loads(request.body)
+        user_message = body.get('userMessage', '')
+
+        if not user_message:
+            return JsonResponse({"error": "No message provided"}, status=400)
+
+        # Only the first build (or none at all) does upstream I/O
+        snapshot = await sync_to_async(chat_context.get,
+                                       thread_sensitive=False)()
+        if wants_stream(request, body):
+            tokens = areply_tokens(user_message, snapshot)
+            return event_stream_response(asse_tokens(tokens, started))
+
+        try:
+            chat_gpt_message = await areply(user_message, snapshot)
+
+            return JsonResponse({"response": chat_gpt_message})
+
+        except openai.OpenAIError as e:
+            logger.warning("Error in OpenAI %r", e)
+            return JsonResponse({"status": 500,
+                                 "error": "An internal error has occurred!"})
+
+    return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+
+@conditional_get
+async def makes_models(request):
+    if request.method == 'GET':
+        endpoint = "/makes_models/"
+        try:
+            res = await cached_searchcars_request("makes_models",
+                                                  endpoint)
+            return JsonResponse({"status": 200, "makes_models": res})
+        except Exception:
+            logger.exception("Error getting makes/models")
+            return JsonResponse({"status": 500,
+                                 "error": "An internal error has occurred!"})
+    else:
+        logger.info("Method %s not allowed", request.method)
+        return JsonResponse({"message": "Method Not Allowed"}, status=405)
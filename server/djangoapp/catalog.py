@@ -0,0 +1,61 @@
+# catalog.py
+# In-memory catalog of the car make/model pairs served by get_cars. The
+# catalog is built from the database once and then served from memory;
+# saving or deleting a CarMake or CarModel bumps its version (see
+# signals.py) and the next request rebuilds it. The version also lives in
+# the RESPONSE_CACHE_ALIAS cache (the workers' shared file cache by
+# default), so an edit in one worker is seen by all of them and they all
+# serve, and tag, the same catalog. Like the response cache's generations
+# it is read from there at most once every SHARED_CACHE_CHECK seconds, not
+# on every get_cars request.
+
+import threading
+
+from django.conf import settings
+
+from .response_cache import SharedCounter
+
+VERSION_KEY = "car-catalog-version"
+
+
+class CarCatalog:
+    def __init__(self, shared_alias=None):
+        self.shared_alias = shared_alias
+        self.shared_version = SharedCounter(shared_alias, VERSION_KEY)
+        self.version = 0
+        self.built = None
+        self.lock = threading.Lock()
+        self.builds = 0
+
+    def current_version(self):
+        return (self.version, self.shared_version.get())
+
+    def _build(self):
+        from .models import CarModel
+
+        car_models = CarModel.objects.select_related('car_make').order_by(
+            'car_make__name', 'name')
+        self.builds += 1
+        return [{"CarModel": car_model.name,
+                 "CarMake": car_model.car_make.name}
+                for car_model in car_models]
+
+    def get(self):
+        version = self.current_version()
+        built = self.built
+        if built is not None and built[0] == version:
+            return built[1]
+        with self.lock:
+            if self.built is None or self.built[0] != version:
+                self.built = (version, self._build())
+            return self.built[1]
+
+    def invalidate(self, **kwargs):
+        # Accepts signal arguments so it can be connected directly
+        with self.lock:
+            self.version += 1
+        self.shared_version.bump()
+
+
+car_catalog = CarCatalog(
+    shared_alias=getattr(settings, 'RESPONSE_CACHE_ALIAS', None))
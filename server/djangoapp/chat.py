@@ -0,0 +1,369 @@
+# chat.py
+# Model client used by the chat views. The default client talks to the
+# OpenAI chat completions API; CHAT_CLIENT can name any class with the
+# same methods (for example a local fake in tests or benchmarks).
+#
+# The system prompt carries a compact snapshot of our own data (dealers,
+# makes/models and price ranges from the inventory service). The snapshot
+# is built once and refreshed in the background every CHAT_CONTEXT_TTL
+# seconds. Answers are cached by normalized question and snapshot version,
+# so repeated questions skip the model round-trip until the data changes.
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import unicodedata
+from collections import namedtuple
+
+import openai
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.module_loading import import_string
+
+from . import restapis
+from .fanout import executor
+from .metrics import metrics
+from .sentiment_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+CHAT_MODEL = os.getenv('CHAT_MODEL', "gpt-3.5-turbo")
+CHAT_ANSWER_TTL = float(os.getenv('CHAT_ANSWER_TTL', 3600))
+CHAT_ANSWER_CACHE_SIZE = int(os.getenv('CHAT_ANSWER_CACHE_SIZE', 1000))
+CHAT_CONTEXT_TTL = float(os.getenv('CHAT_CONTEXT_TTL', 600))
+# How soon to retry when no upstream service answered the last build
+CHAT_CONTEXT_RETRY = float(os.getenv('CHAT_CONTEXT_RETRY', 30))
+CHAT_CONTEXT_INVENTORY_LIMIT = int(
+    os.getenv('CHAT_CONTEXT_INVENTORY_LIMIT', 5000))
+
+SYSTEM_PROMPT = ("You are a helpful assistant for a network of car "
+                 "dealerships. Use the dealership data below when it is "
+                 "relevant to the question.")
+
+openai.api_key = os.getenv('OpenAIAPIKey')
+
+
+def chat_messages(user_message, context=""):
+    system = SYSTEM_PROMPT + "\n\n" + context if context else SYSTEM_PROMPT
+    return [
+        {"role": "system",
+         "content": system},
+        {
+            "role": "user",
+            "content": user_message
+        }
+    ]
+
+
+def normalize_question(text):
+    text = unicodedata.normalize('NFKC', str(text)).casefold()
+    return " ".join(text.split()).rstrip("?!. ")
+
+
+ContextSnapshot = namedtuple('ContextSnapshot', ['text', 'version'])
+
+
+def _dealers_section(dealers):
+    entries = [f"{dealer.get('id')}: {dealer.get('full_name')}, "
+               f"{dealer.get('city')}, {dealer.get('st')}"
+               for dealer in sorted(dealers, key=lambda d: d.get('id', 0))]
+    return "Dealerships (id: name, city, state): " + "; ".join(entries)
+
+
+def _makes_models_section(makes_models):
+    entries = [f"{entry['make']} ({', '.join(sorted(entry['models']))})"
+               for entry in sorted(makes_models, key=lambda e: e['make'])]
+    return "Makes and models: " + "; ".join(entries)
+
+
+def _prices_section(cars):
+    ranges = {}
+    for car in cars:
+        key = (car.get('make'), car.get('bodyType'))
+        low, high, count = ranges.get(key, (car['price'], car['price'], 0))
+        ranges[key] = (min(low, car['price']), max(high, car['price']),
+                       count + 1)
+    entries = [f"{make} {body} ${low:,}-${high:,} ({count} cars)"
+               for (make, body), (low, high, count) in sorted(
+                   ranges.items(), key=lambda item: str(item[0]))]
+    return "Price ranges by make and body type: " + "; ".join(entries)
+
+
+def build_context():
+    sections = []
+    dealers = restapis.cached_get_request("dealers", "/fetchDealers")
+    if isinstance(dealers, list) and dealers:
+        sections.append(_dealers_section(dealers))
+    makes_models = restapis.cached_searchcars_request("makes_models",
+                                                      "/makes_models/")
+    if isinstance(makes_models, list) and makes_models:
+        sections.append(_makes_models_section(makes_models))
+    page = restapis.searchcars_request(
+        "/inventory/", limit=CHAT_CONTEXT_INVENTORY_LIMIT)
+    cars = page.get('cars') if isinstance(page, dict) else None
+    if cars:
+        sections.append(_prices_section(
+            [car for car in cars if car.get('price') is not None]))
+    return "\n".join(sections)
+
+
+class ChatContext:
+    """Dealership data snapshot for the system prompt, rebuilt per TTL."""
+
+    def __init__(self, build, ttl, retry):
+        self.build = build
+        self.ttl = ttl
+        self.retry = retry
+        self.snapshot = None
+        self.expires = 0
+        self.lock = threading.Lock()
+        self.refreshing = False
+        self.builds = 0
+
+    def _rebuild(self):
+        try:
+            text = self.build()
+        except Exception as err:
+            logger.warning("Chat context build failed %r", err)
+            text = ""
+        self.builds += 1
+        if text or self.snapshot is None:
+            version = hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+            self.snapshot = ContextSnapshot(text, version)
+        self.expires = time.monotonic() + (self.ttl if text else self.retry)
+
+    def _refresh(self):
+        try:
+            self._rebuild()
+        finally:
+            self.refreshing = False
+
+    def get(self):
+        if self.snapshot is None:
+            # Only one request pays for the first build
+            with self.lock:
+                if self.snapshot is None:
+                    self._rebuild()
+            return self.snapshot
+        if time.monotonic() >= self.expires:
+            with self.lock:
+                start = not self.refreshing
+                self.refreshing = True
+            if start:
+                executor.submit(self._refresh)
+        return self.snapshot
+
+    def clear(self):
+        with self.lock:
+            self.snapshot = None
+            self.expires = 0
+
+
+class AnswerCache:
+    """Size-bounded cache of model answers that expire after a TTL."""
+
+    def __init__(self, maxsize, ttl):
+        self.local = LRUCache(maxsize)
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0}
+
+    def key(self, question, snapshot):
+        digest = hashlib.sha256(
+            normalize_question(question).encode('utf-8')).hexdigest()
+        return f"chat:{snapshot.version}:{digest}"
+
+    def get(self, key):
+        entry = self.local.get(key)
+        hit = entry is not None and entry[1] > time.monotonic()
+        with self.lock:
+            self.counters["hits" if hit else "misses"] += 1
+        return entry[0] if hit else None
+
+    def set(self, key, answer):
+        if answer:
+            self.local.set(key, (answer, time.monotonic() + self.ttl))
+
+    def clear(self):
+        self.local.clear()
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats["size"] = len(self.local)
+        stats["evictions"] = self.local.evictions
+        return stats
+
+
+chat_context = ChatContext(build_context, CHAT_CONTEXT_TTL,
+                           CHAT_CONTEXT_RETRY)
+chat_answers = AnswerCache(CHAT_ANSWER_CACHE_SIZE, CHAT_ANSWER_TTL)
+
+
+class OpenAIChatClient:
+    """complete()/stream() and their async twins over the OpenAI API."""
+
+    def __init__(self):
+        self._async_client = None
+
+    def complete(self, messages):
+        response = openai.chat.completions.create(model=CHAT_MODEL,
+                                                  messages=messages)
+        return response.choices[0].message.content
+
+    def stream(self, messages):
+        chunks = openai.chat.completions.create(model=CHAT_MODEL,
+                                                messages=messages,
+                                                stream=True)
+        for chunk in chunks:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            self._async_client = openai.AsyncOpenAI(api_key=openai.api_key)
+        return self._async_client
+
+    async def acomplete(self, messages):
+        response = await self.async_client.chat.completions.create(
+            model=CHAT_MODEL, messages=messages)
+        return response.choices[0].message.content
+
+    async def astream(self, messages):
+        chunks = await self.async_client.chat.completions.create(
+            model=CHAT_MODEL, messages=messages, stream=True)
+        async for chunk in chunks:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+_chat_client = None
+
+
+def get_chat_client():
+    global _chat_client
+    if _chat_client is None:
+        _chat_client = import_string(settings.CHAT_CLIENT)()
+    return _chat_client
+
+
+def set_chat_client(client):
+    global _chat_client
+    _chat_client = client
+
+
+def reply(user_message, snapshot):
+    key = chat_answers.key(user_message, snapshot)
+    answer = chat_answers.get(key)
+    if answer is None:
+        with metrics.upstream("openai", "chat.completions") as timer:
+            answer = get_chat_client().complete(
+                chat_messages(user_message, snapshot.text))
+            timer.status = 200
+        chat_answers.set(key, answer)
+    return answer
+
+
+def reply_tokens(user_message, snapshot):
+    key = chat_answers.key(user_message, snapshot)
+    answer = chat_answers.get(key)
+    if answer is not None:
+        yield answer
+        return
+    parts = []
+    with metrics.upstream("openai", "chat.completions/stream") as timer:
+        for token in get_chat_client().stream(
+                chat_messages(user_message, snapshot.text)):
+            parts.append(token)
+            yield token
+        timer.status = 200
+    # Only answers that streamed to the end are cached
+    chat_answers.set(key, "".join(parts))
+
+
+async def areply(user_message, snapshot):
+    key = chat_answers.key(user_message, snapshot)
+    answer = chat_answers.get(key)
+    if answer is None:
+        with metrics.upstream("openai", "chat.completions") as timer:
+            answer = await get_chat_client().acomplete(
+                chat_messages(user_message, snapshot.text))
+            timer.status = 200
+        chat_answers.set(key, answer)
+    return answer
+
+
+async def areply_tokens(user_message, snapshot):
+    key = chat_answers.key(user_message, snapshot)
+    answer = chat_answers.get(key)
+    if answer is not None:
+        yield answer
+        return
+    parts = []
+    with metrics.upstream("openai", "chat.completions/stream") as timer:
+        async for token in get_chat_client().astream(
+                chat_messages(user_message, snapshot.text)):
+            parts.append(token)
+            yield token
+        timer.status = 200
+    chat_answers.set(key, "".join(parts))
+
+
+def wants_stream(request, body):
+    return bool(body.get('stream')) or \
+        'text/event-stream' in request.headers.get('Accept', '')
+
+
+def event_stream_response(events):
+    response = StreamingHttpResponse(events,
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def sse_event(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+def _log_first_token(started):
+    ttft = (time.perf_counter() - started) * 1000
+    logger.info("Chat time to first token %.1fms", ttft,
+                extra={"ttft_ms": round(ttft, 1)})
+
+
+def sse_tokens(tokens, started):
+    # Relays model tokens as server-sent events, then a final "done" event
+    first = True
+    try:
+        for token in tokens:
+            if first:
+                _log_first_token(started)
+                first = False
+            yield sse_event({"token": token})
+    except openai.OpenAIError as e:
+        logger.warning("Error in OpenAI %r", e)
+        yield sse_event({"error": "An internal error has occurred!"},
+                        event="error")
+    yield sse_event({}, event="done")
+
+
+async def asse_tokens(tokens, started):
+    first = True
+    try:
+        async for token in tokens:
+            if first:
+                _log_first_token(started)
+                first = False
+            yield sse_event({"token": token})
+    except openai.OpenAIError as e:
+        logger.warning("Error in OpenAI %r", e)
+        yield sse_event({"error": "An internal error has occurred!"},
+                        event="error")
+    yield sse_event({}, event="done")
@@ -0,0 +1,152 @@
+# circuit_breaker.py
+# Per-upstream circuit breakers. Each breaker keeps the outcome of the
+# last BREAKER_WINDOW calls; a call counts as failed if it raised, got a
+# 5xx response, or took longer than BREAKER_SLOW_CALL seconds. Once at
+# least BREAKER_MIN_CALLS outcomes are recorded and the failure rate
+# reaches BREAKER_FAILURE_RATE the breaker opens and calls fail fast with
+# CircuitOpenError. After BREAKER_OPEN_SECONDS it lets
+# BREAKER_HALF_OPEN_CALLS probe calls through (half-open): if they all
+# succeed it closes again, and any failure opens it for another period.
+
+import os
+import threading
+import time
+from collections import Counter, deque
+
+from .metrics import metrics
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+BREAKER_SETTINGS = {
+    "failure_rate": float(os.getenv('BREAKER_FAILURE_RATE', 0.5)),
+    "slow_call": float(os.getenv('BREAKER_SLOW_CALL', 5)),
+    "window": int(os.getenv('BREAKER_WINDOW', 20)),
+    "min_calls": int(os.getenv('BREAKER_MIN_CALLS', 10)),
+    "open_seconds": float(os.getenv('BREAKER_OPEN_SECONDS', 30)),
+    "half_open_calls": int(os.getenv('BREAKER_HALF_OPEN_CALLS', 1)),
+}
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name):
+        super().__init__(f"Circuit for {name} is open")
+        self.name = name
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_rate=0.5, slow_call=5.0, window=20,
+                 min_calls=10, open_seconds=30.0, half_open_calls=1,
+                 clock=time.monotonic):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.slow_call = slow_call
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.outcomes = deque(maxlen=window)
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probes = 0
+        self.probe_successes = 0
+        self.transitions = Counter()
+        self.rejected = 0
+
+    def _move(self, state):
+        transition = f"{self.state}->{state}"
+        self.transitions[transition] += 1
+        metrics.inc("upstream_breaker_transitions_total",
+                    (("upstream", self.name), ("transition", transition)))
+        if CLOSED in (self.state, state):
+            metrics.add("upstream_breaker_open", (("upstream", self.name),),
+                        1 if self.state == CLOSED else -1)
+        self.state = state
+        if state == OPEN:
+            self.opened_at = self.clock()
+        elif state == HALF_OPEN:
+            self.probes = self.probe_successes = 0
+        else:
+            self.outcomes.clear()
+
+    def allow(self):
+        with self.lock:
+            if (self.state == OPEN and
+                    self.clock() - self.opened_at >= self.open_seconds):
+                self._move(HALF_OPEN)
+            if self.state == HALF_OPEN and \
+                    self.probes < self.half_open_calls:
+                self.probes += 1
+                return True
+            if self.state == CLOSED:
+                return True
+            self.rejected += 1
+        metrics.inc("upstream_breaker_rejections_total",
+                    (("upstream", self.name),))
+        return False
+
+    def record(self, failed, elapsed=0.0):
+        failed = failed or elapsed >= self.slow_call
+        with self.lock:
+            if self.state == HALF_OPEN:
+                if failed:
+                    self._move(OPEN)
+                else:
+                    self.probe_successes += 1
+                    if self.probe_successes >= self.half_open_calls:
+                        self._move(CLOSED)
+            elif self.state == CLOSED:
+                self.outcomes.append(failed)
+                if (len(self.outcomes) >= self.min_calls and
+                        sum(self.outcomes) / len(self.outcomes) >=
+                        self.failure_rate):
+                    self._move(OPEN)
+            # Calls that started before the breaker opened are ignored
+
+    def call(self, fn):
+        # Runs fn() (returning a response) under the breaker
+        if not self.allow():
+            raise CircuitOpenError(self.name)
+        started = self.clock()
+        failed = True
+        try:
+            response = fn()
+            failed = response.status_code >= 500
+            return response
+        finally:
+            self.record(failed, self.clock() - started)
+
+    async def acall(self, fn):
+        if not self.allow():
+            raise CircuitOpenError(self.name)
+        started = self.clock()
+        failed = True
+        try:
+            response = await fn()
+            failed = response.status_code >= 500
+            return response
+        finally:
+            self.record(failed, self.clock() - started)
+
+    def stats(self):
+        with self.lock:
+            outcomes = list(self.outcomes)
+            return {"state": self.state,
+                    "failure_rate": (sum(outcomes) / len(outcomes)
+                                     if outcomes else 0.0),
+                    "rejected": self.rejected,
+                    "transitions": dict(self.transitions)}
+
+    def reset(self):
+        with self.lock:
+            if self.state != CLOSED:
+                metrics.add("upstream_breaker_open",
+                            (("upstream", self.name),), -1)
+            self.outcomes.clear()
+            self.state = CLOSED
+            self.transitions.clear()
+            self.rejected = 0
+
+
+breakers = {name: CircuitBreaker(name, **BREAKER_SETTINGS)
+            for name in ("backend", "searchcars", "sentiment")}
@@ -0,0 +1,139 @@
+# compression.py
+# Compresses responses with the best encoding the client accepts (see its
+# Accept-Encoding header): brotli when the brotli package is installed,
+# otherwise gzip. Only text-like bodies of at least COMPRESS_MIN_BYTES are
+# compressed; smaller ones would not get any shorter on the wire.
+# Streamed JSON arrays are compressed chunk by chunk as they stream; other
+# streaming responses (chat events, files) are left alone.
+
+import gzip
+import os
+import zlib
+
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', 1024))
+GZIP_LEVEL = int(os.getenv('COMPRESS_GZIP_LEVEL', 6))
+# 4-5 is brotli's sweet spot for on-the-fly compression
+BROTLI_QUALITY = int(os.getenv('COMPRESS_BROTLI_QUALITY', 5))
+
+COMPRESSIBLE = ('text/', 'application/json', 'application/javascript',
+                'image/svg+xml')
+
+
+def accepted_encodings(header):
+    # "gzip;q=0.8, br" -> {"gzip": 0.8, "br": 1.0}
+    accepted = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = 1.0
+        name, _, value = params.strip().partition('=')
+        if name.strip() == 'q':
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        if coding.strip():
+            accepted[coding.strip().lower()] = quality
+    return accepted
+
+
+def available_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def choose_encoding(header, offers=None):
+    # Best of `offers` (in order of preference) the client accepts, or None
+    accepted = accepted_encodings(header or '')
+    wildcard = accepted.get('*', 0.0)
+    if offers is None:
+        offers = available_encodings()
+    best, best_quality = None, 0.0
+    for coding in offers:
+        quality = accepted.get(coding, wildcard)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def compress(content, encoding, level=None):
+    # `level` overrides the on-the-fly defaults, e.g. for content that is
+    # compressed once and served many times
+    if encoding == 'br':
+        return brotli.compress(content, quality=level or BROTLI_QUALITY)
+    return gzip.compress(content, compresslevel=level or GZIP_LEVEL, mtime=0)
+
+
+def stream_compressor(encoding):
+    # (compress a chunk, finish) for one stream
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        return compressor.process, compressor.finish
+    # wbits 31: a gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+def compress_stream(chunks, encoding):
+    process, finish = stream_compressor(encoding)
+    for chunk in chunks:
+        data = process(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+async def acompress_stream(chunks, encoding):
+    process, finish = stream_compressor(encoding)
+    async for chunk in chunks:
+        data = process(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+def compress_streaming_response(request, response):
+    if not response.get('Content-Type', '').startswith('application/json'):
+        return response
+    patch_vary_headers(response, ('Accept-Encoding',))
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    if encoding is None:
+        return response
+    compress_chunks = acompress_stream if response.is_async else \
+        compress_stream
+    response.streaming_content = compress_chunks(response.streaming_content,
+                                                 encoding)
+    del response.headers['Content-Length']
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def compress_response(request, response):
+    if response.has_header('Content-Encoding'):
+        return response
+    if response.streaming:
+        return compress_streaming_response(request, response)
+    if not response.get('Content-Type', '').startswith(COMPRESSIBLE) or \
+            len(response.content) < MIN_BYTES:
+        return response
+    # The body depends on Accept-Encoding from here on
+    patch_vary_headers(response, ('Accept-Encoding',))
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    if encoding is None:
+        return response
+    compressed = compress(response.content, encoding)
+    if len(compressed) >= len(response.content):
+        return response
+    response.content = compressed
+    response.headers['Content-Length'] = str(len(compressed))
+    response.headers['Content-Encoding'] = encoding
+    # The compressed bytes differ from the ones the ETag was computed on
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        response.headers['ETag'] = 'W/' + etag
+    return response
@@ -0,0 +1,86 @@
+# conditional.py
+# Conditional GET for JSON views whose data rarely changes (dealer list,
+# dealer reviews, car catalog, makes/models). The view still builds its
+# response (from the upstream caches), but the body is hashed into an
+# ETag, and a request whose If-None-Match or If-Modified-Since still
+# matches gets an empty 304 instead of the full body.
+#
+# Last-Modified is when this worker first saw the current ETag for the
+# path; workers can disagree by a few seconds, so clients should (and
+# browsers do) revalidate with If-None-Match, which takes precedence.
+# Responses built from last-known-good data are never tagged.
+
+import functools
+import hashlib
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .last_known_good import stale_upstreams
+from .sentiment_cache import LRUCache
+
+
+class ContentVersions:
+    def __init__(self, maxsize=10000):
+        # full path -> (etag, first time it was served)
+        self.versions = LRUCache(maxsize)
+        self.lock = threading.Lock()
+        self.counters = {"tagged": 0, "not_modified": 0}
+
+    def last_modified(self, path, etag):
+        version = self.versions.get(path)
+        if version is not None and version[0] == etag:
+            return version[1]
+        modified = int(time.time())
+        self.versions.set(path, (etag, modified))
+        return modified
+
+    def respond(self, request, response):
+        if request.method not in ('GET', 'HEAD') or \
+                response.status_code != 200 or response.streaming or \
+                stale_upstreams.get():
+            return response
+        etag = quote_etag(hashlib.blake2b(response.content,
+                                          digest_size=16).hexdigest())
+        modified = self.last_modified(request.get_full_path(), etag)
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = http_date(modified)
+        # Cache, but check back before every reuse
+        patch_cache_control(response, no_cache=True)
+        conditional = get_conditional_response(
+            request, etag=etag, last_modified=modified, response=response)
+        with self.lock:
+            self.counters["tagged"] += 1
+            self.counters["not_modified"] += conditional is not response
+        return conditional
+
+    def clear(self):
+        self.versions.clear()
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats["paths"] = len(self.versions)
+        return stats
+
+
+content_versions = ContentVersions()
+
+
+def conditional_get(view):
+    """Adds ETag/Last-Modified to a view's 200 responses and answers
+    matching conditional requests with 304."""
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            return content_versions.respond(
+                request, await view(request, *args, **kwargs))
+    else:
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            return content_versions.respond(
+                request, view(request, *args, **kwargs))
+    return wrapper
@@ -0,0 +1,212 @@
+# dealer_geo.py
+# Nearest-dealer search over the lat/long of the dealer list. Coordinates
+# are mapped to points on the unit sphere and kept in a k-d tree. The
+# straight-line (chord) distance between two such points orders them
+# exactly as the great-circle distance does, so a query walks the tree
+# nearest box first, stops once no box can hold anything closer than the
+# k found so far, and only the dealers returned get haversine distances.
+#
+# The index is built from the dealer list the response cache holds and is
+# rebuilt when the contents of that list change: edit_dealer and new_dealer
+# invalidate the "dealers" namespace (in every worker when the cache is
+# shared), the next request fetches a fresh list, and the first nearby
+# query indexes it. A new list with the same contents (a cache miss, or a
+# last-known-good copy decoded afresh) reuses the index.
+
+import hashlib
+import heapq
+import json
+import math
+import os
+import threading
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+NEARBY_K = int(os.getenv('NEARBY_DEALERS_K', 10))
+NEARBY_MAX_K = int(os.getenv('NEARBY_DEALERS_MAX_K', 100))
+# Dealers per tree leaf, measured against the numpy call per leaf
+LEAF_SIZE = 32
+
+
+def coordinates(dealer):
+    # (lat, long) in degrees, or None for a dealer that cannot be placed
+    try:
+        lat, lon = float(dealer['lat']), float(dealer['long'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def unit_vectors(lats, lons):
+    lats, lons = np.radians(lats), np.radians(lons)
+    cos_lats = np.cos(lats)
+    return np.column_stack((cos_lats * np.cos(lons),
+                            cos_lats * np.sin(lons), np.sin(lats)))
+
+
+def haversine_km(lat, lon, lats, lons):
+    # Great-circle distances from one point to arrays of points
+    lat, lon = math.radians(lat), math.radians(lon)
+    lats, lons = np.radians(lats), np.radians(lons)
+    a = np.sin((lats - lat) / 2) ** 2 + \
+        math.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def squared_chord(km):
+    # Squared straight-line distance between points `km` apart
+    angle = min(km / EARTH_RADIUS_KM, math.pi)
+    return (2 * math.sin(angle / 2)) ** 2
+
+
+class DealerGeoIndex:
+    def __init__(self, dealers, leaf_size=LEAF_SIZE):
+        located = [(dealer, position) for dealer in dealers
+                   for position in [coordinates(dealer)] if position]
+        lats = np.array([position[0] for _, position in located], float)
+        lons = np.array([position[1] for _, position in located], float)
+        points = unit_vectors(lats, lons)
+        order = np.arange(len(located))
+        # Node arrays; a node covers order[start:end] and is a leaf when
+        # it has no children (-1)
+        self.starts, self.ends, self.lows, self.highs = [], [], [], []
+        self.lefts, self.rights = [], []
+        if located:
+            self._build(points, order, 0, len(located), leaf_size)
+        # Dealers stored in tree order, so every leaf is one slice
+        self.points = points[order]
+        self.lats, self.lons = lats[order], lons[order]
+        self.dealers = [located[index][0] for index in order]
+
+    def _build(self, points, order, start, end, leaf_size):
+        node = len(self.starts)
+        box = points[order[start:end]]
+        low, high = box.min(axis=0), box.max(axis=0)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.lows.append(tuple(low.tolist()))
+        self.highs.append(tuple(high.tolist()))
+        self.lefts.append(-1)
+        self.rights.append(-1)
+        if end - start > leaf_size:
+            # Split the widest side at the median
+            axis = int(np.argmax(high - low))
+            middle = (start + end) // 2
+            segment = order[start:end]
+            order[start:end] = segment[np.argpartition(
+                points[segment, axis], middle - start)]
+            self.lefts[node] = self._build(points, order, start, middle,
+                                           leaf_size)
+            self.rights[node] = self._build(points, order, middle, end,
+                                            leaf_size)
+        return node
+
+    def _box_distance(self, node, point):
+        # Squared distance from point to the node's bounding box
+        total = 0.0
+        for value, low, high in zip(point, self.lows[node],
+                                    self.highs[node]):
+            if value < low:
+                total += (low - value) ** 2
+            elif value > high:
+                total += (value - high) ** 2
+        return total
+
+    def nearest(self, lat, lon, k=NEARBY_K, radius_km=None):
+        """The k dealers closest to (lat, lon), nearest first, as
+        (dealer, distance in km) pairs; only those within radius_km when
+        it is given."""
+        if not self.dealers or k < 1:
+            return []
+        target = unit_vectors([lat], [lon])[0]
+        point = tuple(target.tolist())
+        limit = math.inf
+        if radius_km is not None:
+            # A hair wider than the radius; haversine decides at the edge
+            limit = squared_chord(radius_km) * (1 + 1e-9)
+        # Max-heap of the best (-squared distance, position) so far
+        best = []
+        boxes = [(0.0, 0)]
+        while boxes:
+            bound, node = heapq.heappop(boxes)
+            if bound > limit or (len(best) == k and bound >= -best[0][0]):
+                break
+            left = self.lefts[node]
+            if left >= 0:
+                for child in (left, self.rights[node]):
+                    distance = self._box_distance(child, point)
+                    if distance <= limit:
+                        heapq.heappush(boxes, (distance, child))
+                continue
+            start = self.starts[node]
+            distances = ((self.points[start:self.ends[node]] - target) ** 2
+                         ).sum(axis=1)
+            worst = -best[0][0] if len(best) == k else limit
+            for offset in np.flatnonzero(distances <= worst).tolist():
+                entry = (-float(distances[offset]), start + offset)
+                if len(best) < k:
+                    heapq.heappush(best, entry)
+                elif entry > best[0]:
+                    heapq.heapreplace(best, entry)
+        positions = [position for _, position in sorted(best, reverse=True)]
+        distances = haversine_km(lat, lon, self.lats[positions],
+                                 self.lons[positions]).tolist()
+        return [(self.dealers[position], distance)
+                for position, distance in zip(positions, distances)
+                if radius_km is None or distance <= radius_km]
+
+    def __len__(self):
+        return len(self.dealers)
+
+
+def dealers_digest(dealers):
+    return hashlib.blake2b(json.dumps(dealers, sort_keys=True, default=str)
+                           .encode('utf-8'), digest_size=16).digest()
+
+
+class DealerLocator:
+    """Keeps a DealerGeoIndex for the current dealer list."""
+
+    def __init__(self):
+        # (last dealer list seen, digest of its contents, their index)
+        self.current = (None, None, None)
+        self.lock = threading.Lock()
+        self.builds = 0
+
+    def indexed(self, dealers):
+        # True when index_for(dealers) has nothing to compute
+        return self.current[0] is dealers
+
+    def index_for(self, dealers):
+        source, _, index = self.current
+        if source is dealers:
+            return index
+        digest = dealers_digest(dealers)
+        with self.lock:
+            _, current_digest, index = self.current
+            if current_digest != digest:
+                index = DealerGeoIndex(dealers)
+                self.builds += 1
+            self.current = (dealers, digest, index)
+        return index
+
+    def nearby(self, dealers, lat, lon, k=NEARBY_K, radius_km=None):
+        # Copies of the nearest dealers with their distance in km
+        return [{**dealer, "distance": round(distance, 3)}
+                for dealer, distance in self.index_for(dealers).nearest(
+                    lat, lon, k, radius_km)]
+
+    def clear(self):
+        with self.lock:
+            self.current = (None, None, None)
+
+    def stats(self):
+        index = self.current[2]
+        return {"builds": self.builds,
+                "dealers": len(index) if index is not None else 0}
+
+
+dealer_locator = DealerLocator()
@@ -0,0 +1,56 @@
+# fanout.py
+# Runs independent upstream calls for a single view concurrently on a
+# shared thread pool, so the view waits for the slowest call rather than
+# the sum of all of them. Each call ("leg") has its own deadline measured
+# from when the fan-out started; legs that miss it or fail are reported
+# and the view carries on with whatever did arrive.
+
+import contextvars
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('FANOUT_WORKERS', 16)),
+    thread_name_prefix='fanout')
+
+
+class FanOut:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.futures = {}
+        self.errors = {}
+
+    def submit(self, name, func, *args, **kwargs):
+        # Legs see the view's context variables (e.g. stale_upstreams)
+        context = contextvars.copy_context()
+        self.futures[name] = executor.submit(context.run, func, *args,
+                                             **kwargs)
+        return self
+
+    def result(self, name, timeout, default=None):
+        # A leg that times out keeps running in the pool until its own HTTP
+        # timeout fires; only the view stops waiting for it.
+        remaining = max(0.0, timeout - (time.monotonic() - self.started))
+        try:
+            value = self.futures[name].result(timeout=remaining)
+        except FutureTimeoutError:
+            self.errors[name] = "timeout"
+            return default
+        except Exception as err:
+            logger.warning("Fan-out leg %s failed %r", name, err)
+            self.errors[name] = "error"
+            return default
+        if value is None:
+            # restapis helpers return None when the upstream call failed
+            self.errors[name] = "unavailable"
+            return default
+        return value
+
+    @property
+    def partial(self):
+        return bool(self.errors)
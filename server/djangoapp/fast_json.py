@@ -0,0 +1,116 @@
+# fast_json.py
+# JSON responses for the djangoapp views. JsonResponse is a drop-in for
+# Django's that encodes with the class named by JSON_ENCODER (orjson by
+# default, several times faster than the stdlib encoder; the stdlib one is
+# used when orjson is not installed). Any class with a `dumps(obj) ->
+# bytes` method will do.
+#
+# json_list_response streams large arrays: the envelope is written first
+# and the items follow in batches of STREAM_JSON_BATCH as separate chunks,
+# so the encoded body never has to exist in memory at once. Given a lazy
+# iterable (for example records generated from the inventory index) the
+# items themselves are never all in memory either. Lists shorter than
+# STREAM_JSON_MIN_ITEMS get a plain JsonResponse, which keeps ETags and
+# compression of the whole body.
+
+import itertools
+import json
+import os
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.module_loading import import_string
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+STREAM_MIN_ITEMS = int(os.getenv('STREAM_JSON_MIN_ITEMS', 1000))
+STREAM_BATCH = int(os.getenv('STREAM_JSON_BATCH', 1000))
+
+
+class StdlibEncoder:
+    def dumps(self, obj):
+        return json.dumps(obj, cls=DjangoJSONEncoder).encode()
+
+
+class OrjsonEncoder:
+    def __init__(self):
+        self.options = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        # Decimal, lazy translations and the like, as Django encodes them
+        self.default = DjangoJSONEncoder().default
+
+    def dumps(self, obj):
+        return orjson.dumps(obj, default=self.default, option=self.options)
+
+
+_json_encoder = None
+
+
+def get_json_encoder():
+    global _json_encoder
+    if _json_encoder is None:
+        encoder_class = import_string(settings.JSON_ENCODER)
+        if encoder_class is OrjsonEncoder and orjson is None:
+            encoder_class = StdlibEncoder
+        _json_encoder = encoder_class()
+    return _json_encoder
+
+
+def set_json_encoder(encoder):
+    global _json_encoder
+    _json_encoder = encoder
+
+
+class JsonResponse(HttpResponse):
+    def __init__(self, data, encoder=None, safe=True,
+                 json_dumps_params=None, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError(
+                "In order to allow non-dict objects to be serialized set the "
+                "safe parameter to False.")
+        kwargs.setdefault('content_type', 'application/json')
+        if encoder is not None or json_dumps_params:
+            # Custom stdlib encoding, as django.http.JsonResponse does it
+            content = json.dumps(data, cls=encoder or DjangoJSONEncoder,
+                                 **(json_dumps_params or {}))
+        else:
+            content = get_json_encoder().dumps(data)
+        super().__init__(content=content, **kwargs)
+
+
+def json_array_chunks(envelope, key, items):
+    # {...envelope, key: [items]} with the array last, in pieces
+    dumps = get_json_encoder().dumps
+    head = dumps(envelope)[:-1]
+    yield head + (b',' if len(head) > 1 else b'') + dumps(key) + b':['
+    items = iter(items)
+    separator = b''
+    while True:
+        batch = list(itertools.islice(items, STREAM_BATCH))
+        if not batch:
+            break
+        yield separator + dumps(batch)[1:-1]
+        separator = b','
+    yield b']}'
+
+
+async def ajson_array_chunks(envelope, key, items):
+    for chunk in json_array_chunks(envelope, key, items):
+        yield chunk
+
+
+def json_list_response(envelope, key, items, count=None,
+                       asynchronous=False):
+    """Responds with {...envelope, key: items}, streamed when `items` is
+    long. Pass `count` for iterables without a length (generators), which
+    are otherwise always streamed."""
+    if count is None and hasattr(items, '__len__'):
+        count = len(items)
+    if count is not None and count < STREAM_MIN_ITEMS:
+        return JsonResponse({**envelope, key: list(items)})
+    chunks = (ajson_array_chunks if asynchronous else json_array_chunks)(
+        envelope, key, items)
+    return StreamingHttpResponse(chunks, content_type='application/json')
@@ -0,0 +1,168 @@
+# http_client.py
+# This module holds the shared HTTP session used by restapis.py to talk to
+# the dealership, inventory and sentiment services. Each gunicorn worker
+# keeps one pooled keep-alive session, so repeated calls to the same
+# upstream host reuse their TCP connections instead of opening new ones.
+# Every call gets a connect/read timeout and idempotent GETs are retried
+# a bounded number of times with exponential backoff. The async views use
+# an aiohttp session with the same timeout and retry settings.
+
+import asyncio
+import json
+import os
+import threading
+import weakref
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Number of per-host pools kept, and connections kept alive in each pool
+pool_connections = int(os.getenv('UPSTREAM_POOL_CONNECTIONS', 10))
+pool_maxsize = int(os.getenv('UPSTREAM_POOL_MAXSIZE', 20))
+# Seconds to wait for the TCP connect and for each read from the socket
+connect_timeout = float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', 3.05))
+read_timeout = float(os.getenv('UPSTREAM_READ_TIMEOUT', 10))
+# Retries apply to GET only; POST/PUT are never replayed
+get_retries = int(os.getenv('UPSTREAM_GET_RETRIES', 2))
+retry_backoff = float(os.getenv('UPSTREAM_RETRY_BACKOFF', 0.2))
+# Concurrent connections per upstream host for the async session
+async_max_connections = int(os.getenv('UPSTREAM_ASYNC_MAX_CONNECTIONS', 200))
+# Set UPSTREAM_POOLING=false to open a fresh connection for every call
+pooling_enabled = os.getenv('UPSTREAM_POOLING', 'true').lower() != 'false'
+
+RETRY_STATUSES = (502, 503, 504)
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+# One async session per event loop; under ASGI that is one per worker
+_async_sessions = weakref.WeakKeyDictionary()
+
+
+def timeout():
+    return (connect_timeout, read_timeout)
+
+
+def new_session():
+    retry = Retry(total=get_retries,
+                  backoff_factor=retry_backoff,
+                  status_forcelist=RETRY_STATUSES,
+                  allowed_methods=frozenset(['GET']),
+                  raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_connections,
+                          pool_maxsize=pool_maxsize,
+                          max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session():
+    # Sessions must not be shared across a fork, so the session is rebuilt
+    # the first time it is used in each worker process.
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                _session = new_session()
+                _session_pid = pid
+    return _session
+
+
+def close_session():
+    global _session, _session_pid
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+        _session_pid = None
+
+
+def request(method, url, **kwargs):
+    kwargs.setdefault('timeout', timeout())
+    if pooling_enabled:
+        return get_session().request(method, url, **kwargs)
+    with new_session() as session:
+        return session.request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, data=None, json=None, **kwargs):
+    return request('POST', url, data=data, json=json, **kwargs)
+
+
+def put(url, data=None, **kwargs):
+    return request('PUT', url, data=data, **kwargs)
+
+
+class AsyncResponse:
+    """Status and body of a completed aiohttp request."""
+
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def new_async_session():
+    connector = aiohttp.TCPConnector(
+        limit=0, limit_per_host=async_max_connections)
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout,
+                                      sock_read=read_timeout))
+
+
+def get_async_session():
+    loop = asyncio.get_running_loop()
+    session = _async_sessions.get(loop)
+    if session is None or session.closed:
+        session = new_async_session()
+        _async_sessions[loop] = session
+    return session
+
+
+async def aclose_session():
+    session = _async_sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+
+async def _send_async(session, method, url, **kwargs):
+    attempts = get_retries + 1 if method == 'GET' else 1
+    for attempt in range(attempts):
+        last_attempt = attempt == attempts - 1
+        try:
+            async with session.request(method, url, **kwargs) as response:
+                content = await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if last_attempt:
+                raise
+        else:
+            if response.status not in RETRY_STATUSES or last_attempt:
+                return AsyncResponse(response.status, content)
+        await asyncio.sleep(retry_backoff * (2 ** attempt))
+
+
+async def arequest(method, url, **kwargs):
+    if pooling_enabled:
+        return await _send_async(get_async_session(), method, url, **kwargs)
+    async with new_async_session() as session:
+        return await _send_async(session, method, url, **kwargs)
+
+
+async def aget(url, **kwargs):
+    return await arequest('GET', url, **kwargs)
+
+
+async def apost(url, data=None, json=None, **kwargs):
+    return await arequest('POST', url, data=data, json=json, **kwargs)
@@ -0,0 +1,472 @@
+# inventory_index.py
+# In-process search index over the car inventory. A snapshot of every car
+# is fetched from the carsInventory service and stored column-wise in
+# NumPy arrays: make, model and bodyType are dictionary-encoded to small
+# integer codes, and year, mileage, price and dealer_id are plain integer
+# columns. Filters become vectorized masks over those columns, so
+# full_inventory and get_inventory are answered without a round-trip to
+# the service and its skip()/countDocuments() per request.
+#
+# Query semantics mirror carsInventory/app.js (/inventory/ and the
+# per-dealer /carsby* routes), including parseInt() on query values and
+# insertion order for results. keyset_page() adds cursor pagination over
+# the precomputed price/mileage/year orders, with ties broken by _id so a
+# cursor resumes in the same place on any worker and after a rebuild. The
+# snapshot's version is a digest of its contents. The snapshot is rebuilt in
+# the background every INVENTORY_INDEX_TTL seconds; until the first build
+# succeeds the views keep calling the service.
+
+import base64
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from . import restapis
+from .fanout import executor
+from .sentiment_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+INVENTORY_INDEX = os.getenv('INVENTORY_INDEX', 'true').lower() != 'false'
+INVENTORY_INDEX_TTL = float(os.getenv('INVENTORY_INDEX_TTL', 300))
+INVENTORY_INDEX_RETRY = float(os.getenv('INVENTORY_INDEX_RETRY', 30))
+INVENTORY_INDEX_FETCH_LIMIT = int(
+    os.getenv('INVENTORY_INDEX_FETCH_LIMIT', 2000000))
+
+CATEGORICAL = {"make": np.int32, "model": np.int32, "bodyType": np.int16}
+NUMERIC = {"dealer_id": np.int32, "year": np.int16,
+           "mileage": np.int32, "price": np.int32}
+SORTABLE = ("price", "mileage", "year")
+CURSOR_SORT = "price"
+# Upper edges of the buckets used by getMileageCondition() and
+# getPriceCondition(); anything above the last edge is one more bucket
+MILEAGE_BUCKETS = (50000, 100000, 150000, 200000)
+PRICE_BUCKETS = (20000, 40000, 60000, 80000)
+# Query parameters each facet ignores, so its counts show the choices
+# open to the user rather than only the one already picked
+FACET_PARAMS = {"make": ('make',), "model": ('model',), "year": ('year',),
+                "mileage": ('mileageMin', 'mileageMax'),
+                "price": ('priceMin', 'priceMax')}
+# Filter masks (one byte per car) kept per snapshot for paging
+INVENTORY_INDEX_MASKS = int(os.getenv('INVENTORY_INDEX_MASKS', 16))
+
+_leading_int = re.compile(r'\s*([+-]?\d+)')
+
+
+def parse_int(value):
+    # JavaScript parseInt(): leading integer or None (NaN)
+    match = _leading_int.match(str(value))
+    return int(match.group(1)) if match else None
+
+
+def _bounds(value, buckets):
+    # (above, at most) for a value, the way the getXCondition() helpers
+    # in carsInventory/app.js turn it into a bucket query
+    if value is None:
+        return buckets[-1], None
+    for index, upper in enumerate(buckets):
+        if value <= upper:
+            return (buckets[index - 1] if index else None), value
+    return buckets[-1], None
+
+
+def mileage_bounds(mileage):
+    return _bounds(mileage, MILEAGE_BUCKETS)
+
+
+def price_bounds(price):
+    return _bounds(price, PRICE_BUCKETS)
+
+
+def encode_cursor(value):
+    raw = json.dumps(value, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip("=")
+
+
+def decode_cursor(cursor, *shape):
+    # The list encoded in a cursor, checked against the expected item types
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(value, list) or len(value) != len(shape) or \
+            not all(isinstance(item, kind)
+                    for item, kind in zip(value, shape)):
+        raise ValueError("Invalid cursor")
+    return value
+
+
+class InventorySnapshot:
+    def __init__(self, cars):
+        self.size = len(cars)
+        self.masks = LRUCache(INVENTORY_INDEX_MASKS)
+        self.fields = list(cars[0]) if cars else []
+        self.vocab = {}
+        self.codes = {}
+        self.columns = {}
+        for field, dtype in CATEGORICAL.items():
+            values, codes = np.unique(
+                np.array([str(car[field]) for car in cars], dtype=str),
+                return_inverse=True)
+            self.vocab[field] = values
+            self.codes[field] = {value: code
+                                 for code, value in enumerate(values.tolist())}
+            self.columns[field] = codes.astype(dtype)
+        for field, dtype in NUMERIC.items():
+            self.columns[field] = np.array([car[field] for car in cars],
+                                           dtype=dtype)
+        # Fields the service adds (_id, __v) are only ever read back out
+        self.extras = {field: np.array([car.get(field) for car in cars])
+                       for field in self.fields
+                       if field not in CATEGORICAL and field not in NUMERIC}
+        # Cars without an _id are told apart by their row number
+        self.ids = self.extras['_id'].astype(str) if '_id' in self.extras \
+            else np.arange(self.size).astype(str)
+        self.id_order = np.argsort(self.ids, kind='stable')
+        self.id_rank = np.empty(self.size, dtype=np.int64)
+        self.id_rank[self.id_order] = np.arange(self.size)
+        # Sort orders with ties in _id order, and the sort key at each
+        # position of them (negated for descending sorts) for seeking to
+        # a cursor
+        self.orders = {}
+        self.keys = {}
+        for field in SORTABLE:
+            column = self.columns[field].astype(np.int64)
+            for sort, key in ((field, column), ("-" + field, -column)):
+                self.orders[sort] = np.lexsort((self.id_rank, key))
+                self.keys[sort] = key[self.orders[sort]]
+        self.version = self._digest()
+
+    def _digest(self):
+        # Same cars, same version, whichever worker built the snapshot
+        digest = hashlib.blake2b(digest_size=8)
+        for field in self.fields:
+            digest.update(field.encode('utf-8'))
+            if field in self.vocab:
+                digest.update("\0".join(self.vocab[field].tolist()).encode(
+                    'utf-8'))
+            if field in self.columns:
+                digest.update(self.columns[field].tobytes())
+            else:
+                digest.update(json.dumps(self.extras[field].tolist(),
+                                         default=str).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _equals(self, field, value):
+        code = self.codes[field].get(value)
+        if code is None:
+            return np.zeros(self.size, dtype=bool)
+        return self.columns[field] == code
+
+    def _between(self, field, above=None, at_least=None, at_most=None):
+        column = self.columns[field]
+        mask = np.ones(self.size, dtype=bool)
+        if above is not None:
+            mask &= column > above
+        if at_least is not None:
+            mask &= column >= at_least
+        if at_most is not None:
+            mask &= column <= at_most
+        return mask
+
+    def match(self, make=None, model=None, year=None, mileage_range=None,
+              price_range=None, dealer_id=None):
+        # Boolean mask of the cars matching every filter
+        mask = np.ones(self.size, dtype=bool)
+        if dealer_id is not None:
+            mask &= self.columns["dealer_id"] == int(dealer_id)
+        if make is not None:
+            mask &= self._equals("make", make)
+        if model is not None:
+            mask &= self._equals("model", model)
+        if year is not None:
+            mask &= self._between("year", at_least=year)
+        if mileage_range is not None:
+            mask &= self._between("mileage", *mileage_range)
+        if price_range is not None:
+            mask &= self._between("price", *price_range)
+        return mask
+
+    def rows(self, mask, sort=None):
+        # Matching row numbers, in insertion order unless a known sort
+        # ("price", "-price", "mileage", ...) is given
+        if sort not in self.orders:
+            return np.flatnonzero(mask)
+        order = self.orders[sort]
+        return order[mask[order]]
+
+    def records(self, rows):
+        columns = {}
+        for field in self.fields:
+            if field in CATEGORICAL:
+                columns[field] = self.vocab[field][
+                    self.columns[field][rows]].tolist()
+            elif field in NUMERIC:
+                columns[field] = self.columns[field][rows].tolist()
+            else:
+                columns[field] = self.extras[field][rows].tolist()
+        return [dict(zip(self.fields, values))
+                for values in zip(*(columns[field] for field in self.fields))]
+
+    def iter_records(self, rows, batch=1000):
+        # records() a batch at a time, for responses streamed as they are
+        # encoded
+        for start in range(0, len(rows), batch):
+            yield from self.records(rows[start:start + batch])
+
+    def _filters(self, params):
+        # match() arguments for inventory_params(), or None when a bound
+        # is NaN to parseInt() and so matches no car
+        filters = {"make": params.get('make') or None,
+                   "model": params.get('model') or None}
+        bounds = []
+        if params.get('year'):
+            filters["year"] = parse_int(params['year'])
+            bounds.append(filters["year"])
+        for field in ("mileage", "price"):
+            low = params.get(field + 'Min')
+            high = params.get(field + 'Max')
+            if low and high:
+                at_least, at_most = parse_int(low), parse_int(high)
+                filters[field + "_range"] = (None, at_least, at_most)
+                bounds += [at_least, at_most]
+        return None if None in bounds else filters
+
+    def matches(self, params):
+        # (mask, total) for the filters in params. Both are cached per
+        # snapshot, so paging through one result set counts it only once.
+        filters = self._filters(params)
+        if filters is None:
+            return np.zeros(self.size, dtype=bool), 0
+        key = tuple(sorted(filters.items()))
+        cached = self.masks.get(key)
+        if cached is None:
+            mask = self.match(**filters)
+            cached = (mask, int(np.count_nonzero(mask)))
+            self.masks.set(key, cached)
+        return cached
+
+    def _facet_values(self, params, facet, field):
+        # The field's column over the cars the facet counts
+        mask, total = self.matches({
+            key: value for key, value in params.items()
+            if key not in FACET_PARAMS[facet]})
+        column = self.columns[field]
+        return column if total == self.size else column[mask]
+
+    def _bucket_counts(self, params, field, buckets):
+        values = self._facet_values(params, field, field)
+        # Cars at or below each edge; neighbouring differences are the
+        # bucket counts (faster than searchsorted on unsorted values)
+        at_most = [0] + [int(np.count_nonzero(values <= edge))
+                         for edge in buckets] + [len(values)]
+        counts = [high - low for low, high in zip(at_most, at_most[1:])]
+        lows = (None,) + buckets
+        highs = buckets + (None,)
+        return [{"above": low, "atMost": high, "count": count}
+                for low, high, count in zip(lows, highs, counts)]
+
+    def facets(self, params):
+        # Counts per make, model, year and price/mileage bucket for the
+        # filters in params. Each facet leaves out its own filter; masks
+        # come from the per-snapshot cache, and each count is one
+        # vectorized pass over a column.
+        counts = {}
+        for field in ("make", "model"):
+            per_code = np.bincount(self._facet_values(params, field, field),
+                                   minlength=len(self.vocab[field]))
+            counts[field] = dict(zip(self.vocab[field].tolist(),
+                                     per_code.tolist()))
+        years = self.columns["year"]
+        if self.size:
+            first = int(years.min())
+            per_year = np.bincount(
+                self._facet_values(params, "year", "year") - first,
+                minlength=int(years.max()) - first + 1)
+            counts["year"] = {str(first + offset): count
+                              for offset, count in enumerate(
+                                  per_year.tolist())}
+        else:
+            counts["year"] = {}
+        counts["mileage"] = self._bucket_counts(params, "mileage",
+                                                MILEAGE_BUCKETS)
+        counts["price"] = self._bucket_counts(params, "price", PRICE_BUCKETS)
+        return {"status": 200,
+                "total": self.matches(params)[1],
+                "facets": counts}
+
+    def inventory(self, params):
+        # Answers inventory_params() the way GET /inventory/ does
+        page = parse_int(params.get('page', 1))
+        limit = parse_int(params.get('limit', 10))
+        if page is None or limit is None or (page - 1) * limit < 0:
+            raise ValueError("Invalid page or limit")
+        mask, total = self.matches(params)
+        rows = self.rows(mask, params.get('sort'))
+        skip = (page - 1) * limit
+        # limit(0) means no limit to MongoDB, and a negative limit is |n|
+        end = skip + abs(limit) if limit else None
+        return self._page(self.records(rows[skip:end]), total, page, limit)
+
+    def _position(self, sort, cursor):
+        # Index into orders[sort] just past the car the cursor points at,
+        # which need not be in this snapshot any more
+        cursor_sort, key, car_id = cursor
+        if cursor_sort != sort:
+            raise ValueError("Cursor is for a different sort")
+        keys = self.keys[sort]
+        low = int(np.searchsorted(keys, key, side='left'))
+        high = int(np.searchsorted(keys, key, side='right'))
+        # Ties are in _id order: skip those with an _id up to the cursor's
+        rank = int(np.searchsorted(self.ids, car_id, side='right',
+                                   sorter=self.id_order))
+        return low + int(np.searchsorted(
+            self.id_rank[self.orders[sort][low:high]], rank, side='left'))
+
+    def keyset_page(self, params, cursor=None):
+        # One page of cars in a stable price/mileage/year order, starting
+        # after the car encoded in the cursor. Cost depends on the page
+        # size, not on how deep the page is.
+        sort = params.get('sort')
+        if sort not in self.orders:
+            sort = CURSOR_SORT
+        limit = parse_int(params.get('limit', 10))
+        if limit is None or limit < 1:
+            raise ValueError("Invalid limit")
+        mask, total = self.matches(params)
+        order = self.orders[sort]
+        start = self._position(
+            sort, decode_cursor(cursor, str, int, str)) if cursor else 0
+        found = []
+        window = max(limit * 4, 1024)
+        # One car more than the page tells whether there is a next page
+        while start < self.size and len(found) <= limit:
+            chunk = order[start:start + window]
+            found.extend(chunk[mask[chunk]][:limit + 1 - len(found)].tolist())
+            start += window
+        next_cursor = None
+        if len(found) > limit:
+            found = found[:limit]
+            last = found[-1]
+            key = int(self.columns[sort.lstrip("-")][last])
+            next_cursor = encode_cursor([
+                sort, -key if sort.startswith("-") else key,
+                str(self.ids[last])])
+        return {"status": 200,
+                "cars": self.records(np.array(found, dtype=np.int64)),
+                "total": total,
+                "nextCursor": next_cursor}
+
+    def _page(self, cars, total, page, limit):
+        return {"status": 200,
+                "cars": cars,
+                "totalCars": total,
+                "totalPages": math.ceil(total / limit) if limit else None,
+                "currentPage": page}
+
+    def dealer_cars(self, dealer_id, data):
+        rows = self.dealer_rows(dealer_id, data)
+        return rows if isinstance(rows, dict) else self.records(rows)
+
+    def dealer_rows(self, dealer_id, data):
+        # Same precedence as views.inventory_endpoint(); an error dict for
+        # a year the service would reject
+        if 'year' in data:
+            try:
+                # Mongoose casts the year with Number(), which rejects junk
+                year = float(data['year'])
+            except ValueError:
+                return {"error": "Error fetching cars by dealer ID and "
+                                 "minimum year"}
+            mask = self.match(dealer_id=dealer_id, year=year)
+        elif 'make' in data:
+            mask = self.match(dealer_id=dealer_id, make=data['make'])
+        elif 'model' in data:
+            mask = self.match(dealer_id=dealer_id, model=data['model'])
+        elif 'mileage' in data:
+            above, at_most = mileage_bounds(parse_int(data['mileage']))
+            mask = self.match(dealer_id=dealer_id,
+                              mileage_range=(above, None, at_most))
+        elif 'price' in data:
+            above, at_most = price_bounds(parse_int(data['price']))
+            mask = self.match(dealer_id=dealer_id,
+                              price_range=(above, None, at_most))
+        else:
+            mask = self.match(dealer_id=dealer_id)
+        return self.rows(mask)
+
+
+def fetch_inventory():
+    page = restapis.searchcars_request(
+        "/inventory/", page="1", limit=str(INVENTORY_INDEX_FETCH_LIMIT))
+    if not isinstance(page, dict) or 'cars' not in page:
+        return None
+    return page['cars']
+
+
+class InventoryIndex:
+    """Holds the current snapshot and rebuilds it once it expires."""
+
+    def __init__(self, fetch, ttl, retry):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.retry = retry
+        self.snapshot = None
+        self.expires = 0
+        self.lock = threading.Lock()
+        self.refreshing = False
+        self.builds = 0
+
+    def _rebuild(self):
+        cars = None
+        try:
+            cars = self.fetch()
+            if cars is not None:
+                self.snapshot = InventorySnapshot(cars)
+                self.builds += 1
+        except Exception as err:
+            logger.warning("Inventory index build failed %r", err)
+        self.expires = time.monotonic() + (
+            self.ttl if cars is not None else self.retry)
+
+    def _refresh(self):
+        try:
+            self._rebuild()
+        finally:
+            self.refreshing = False
+
+    def get(self):
+        # The current snapshot, or None while the service is unreachable
+        if self.snapshot is None:
+            with self.lock:
+                if self.snapshot is None and time.monotonic() >= self.expires:
+                    self._rebuild()
+            return self.snapshot
+        if time.monotonic() >= self.expires:
+            with self.lock:
+                start = not self.refreshing
+                self.refreshing = True
+            if start:
+                executor.submit(self._refresh)
+        return self.snapshot
+
+    def clear(self):
+        with self.lock:
+            self.snapshot = None
+            self.expires = 0
+
+
+inventory_index = InventoryIndex(fetch_inventory, INVENTORY_INDEX_TTL,
+                                 INVENTORY_INDEX_RETRY)
+
+
+def current_snapshot():
+    return inventory_index.get() if INVENTORY_INDEX else None
@@ -0,0 +1,57 @@
+# last_known_good.py
+# Last successful response body for each upstream GET URL. When a read
+# fails (error, 5xx, or an open circuit breaker) restapis serves the
+# remembered body instead and records which upstream was stale for the
+# current request; middleware.py then flags the response.
+
+import contextvars
+import json
+import os
+import threading
+
+from .sentiment_cache import LRUCache
+
+# Upstreams served from last-known-good during the current request. The
+# middleware puts a fresh set here per request; fan-out threads and tasks
+# inherit the same set through their copied context.
+stale_upstreams = contextvars.ContextVar('stale_upstreams', default=None)
+
+
+def mark_stale(upstream):
+    upstreams = stale_upstreams.get()
+    if upstreams is not None:
+        upstreams.add(upstream)
+
+
+class LastKnownGood:
+    def __init__(self, maxsize):
+        # url -> raw body, parsed again on every recall so callers can
+        # modify what they get back
+        self.local = LRUCache(maxsize)
+        self.lock = threading.Lock()
+        self.counters = {"served": 0, "missing": 0}
+
+    def remember(self, url, content):
+        self.local.set(url, content)
+
+    def recall(self, url, upstream):
+        content = self.local.get(url)
+        with self.lock:
+            self.counters["served" if content is not None else "missing"] += 1
+        if content is None:
+            return None
+        mark_stale(upstream)
+        return json.loads(content)
+
+    def clear(self):
+        self.local.clear()
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats["size"] = len(self.local)
+        return stats
+
+
+last_known_good = LastKnownGood(
+    int(os.getenv('LAST_KNOWN_GOOD_SIZE', 5000)))
@@ -0,0 +1,293 @@
+import datetime
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from collections import namedtuple
+from http.cookies import SimpleCookie
+from urllib.parse import quote, urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import get_resolver
+
+from benchmarks.backends import running_backends
+from benchmarks.load import drive, gunicorn_server
+
+# paths: request paths used in turn; body: a JSON string or a list of them;
+# auth: send the signed-in admin's session and CSRF token; warm_up: send a
+# few requests first (off for routes whose bodies must not repeat)
+Plan = namedtuple('Plan', ['method', 'paths', 'body', 'auth', 'warm_up'],
+                  defaults=('GET', None, None, False, True))
+
+USER = "benchmark-admin"
+PASSWORD = "benchmark-password"
+RESULTS_DIR = os.path.join(settings.BASE_DIR, 'benchmarks', 'results')
+
+
+def route_plans(data, requests):
+    dealer_ids = [dealer["id"] for dealer in data["dealers"]][:20]
+    states = sorted({dealer["state"] for dealer in data["dealers"]})
+    review_ids = [review["id"] for review in data["reviews"]]
+    makes = sorted({car["make"] for car in data["cars"]})
+
+    def each(pattern, values):
+        return [pattern.format(quote(str(value))) for value in values]
+
+    review = json.dumps({"name": USER, "dealership": dealer_ids[0],
+                         "review": "Great service, would recommend",
+                         "purchase": False})
+    dealer = json.dumps({"short_name": "Bench", "full_name": "Bench Motors",
+                         "city": "Austin", "state": "Texas", "st": "TX",
+                         "address": "1 Main St", "zip": "73301"})
+    questions = [json.dumps({"userMessage": f"Which dealers sell {make} "
+                             f"cars in {state}?"})
+                 for make in makes for state in states[:5]]
+    return {
+        "login": Plan("POST", ["/djangoapp/login"],
+                      json.dumps({"userName": USER, "password": PASSWORD})),
+        "logout": Plan("GET", ["/djangoapp/logout"]),
+        "register": Plan("POST", ["/djangoapp/register"], [json.dumps({
+            "userName": f"bench-{i}", "password": PASSWORD,
+            "firstName": "Bench", "lastName": "User",
+            "email": f"bench-{i}@example.com", "dealer_id": None,
+            "user_type": "customer"}) for i in range(requests)],
+            warm_up=False),
+        "getcars": Plan("GET", ["/djangoapp/get_cars"]),
+        "get_dealers": Plan("GET", ["/djangoapp/get_dealers"]),
+        "get_dealers_by_state": Plan(
+            "GET", each("/djangoapp/get_dealers/{}", states)),
+        "nearby_dealers": Plan("GET", [
+            f"/djangoapp/dealers/nearby?lat={dealer['lat']}"
+            f"&lon={dealer['long']}&k=5" for dealer in data["dealers"][:20]] +
+            ["/djangoapp/dealers/nearby?lat=39.1&lon=-94.6&radius=800"]),
+        "dealer_details": Plan("GET", each("/djangoapp/dealer/{}",
+                                           dealer_ids)),
+        "dealer_page": Plan("GET", each("/djangoapp/dealer_page/{}",
+                                        dealer_ids)),
+        "dealer_reviews": Plan("GET", each("/djangoapp/reviews/dealer/{}",
+                                           dealer_ids)),
+        "review": Plan("GET", each("/djangoapp/reviews/{}", review_ids)),
+        "add_review": Plan("POST", ["/djangoapp/add_review"], review,
+                           auth=True),
+        "put_review": Plan("PUT", each("/djangoapp/put_review/{}",
+                                       review_ids),
+                           json.dumps({"review": "Updated review"}),
+                           auth=True),
+        "edit_dealer": Plan("PUT", each("/djangoapp/edit_dealer/{}",
+                                        dealer_ids), dealer, auth=True),
+        "new_dealer": Plan("POST", ["/djangoapp/new_dealer"], dealer,
+                           auth=True),
+        "get_inventory": Plan("GET", each("/djangoapp/get_inventory/{}",
+                                          dealer_ids) +
+                              each("/djangoapp/get_inventory/1?make={}",
+                                   makes)),
+        "full_inventory": Plan(
+            "GET", ["/djangoapp/full_inventory",
+                    "/djangoapp/full_inventory?page=3&per_page=20"] +
+            each("/djangoapp/full_inventory?make={}&priceMin=10000"
+                 "&priceMax=60000", makes)),
+        "full_inventory:cursor": Plan(
+            "GET", each("/djangoapp/full_inventory?make={}&cursor=", makes)),
+        "inventory_facets": Plan(
+            "GET", ["/djangoapp/inventory_facets"] +
+            each("/djangoapp/inventory_facets?make={}", makes)),
+        "makes_models": Plan("GET", ["/djangoapp/makes_models"]),
+        "chat": Plan("POST", ["/djangoapp/chat/"], questions, auth=True),
+        "chat:stream": Plan("POST", ["/djangoapp/chat/"], [
+            json.dumps({**json.loads(question), "stream": True})
+            for question in questions], auth=True),
+        "cache_stats": Plan("GET", ["/djangoapp/cache_stats"]),
+        "upstream_health": Plan("GET", ["/djangoapp/upstream_health"]),
+        "metrics": Plan("GET", ["/djangoapp/metrics"]),
+    }
+
+
+def djangoapp_routes():
+    resolver = get_resolver()
+    names = set()
+    for pattern in resolver.url_patterns:
+        namespace = getattr(pattern, 'namespace', None)
+        if namespace == 'djangoapp':
+            names.update(p.name for p in pattern.url_patterns if p.name)
+    return names
+
+
+def sign_in(url):
+    # Registers (or logs in) an admin and returns the headers that carry
+    # its session and CSRF token
+    parts = urlsplit(url)
+    headers = {}
+    for path in ("/djangoapp/register", "/djangoapp/login"):
+        conn = http.client.HTTPConnection(parts.netloc, timeout=60)
+        conn.request("POST", path, body=json.dumps({
+            "userName": USER, "password": PASSWORD, "firstName": "Bench",
+            "lastName": "Admin", "email": "admin@example.com",
+            "dealer_id": None, "user_type": "admin"}))
+        response = conn.getresponse()
+        response.read()
+        cookies = SimpleCookie()
+        for header in response.headers.get_all('Set-Cookie') or []:
+            cookies.load(header)
+        conn.close()
+        if "sessionid" in cookies:
+            headers = {"Cookie": "; ".join(f"{name}={morsel.value}"
+                                           for name, morsel in
+                                           cookies.items())}
+            if "csrftoken" in cookies:
+                headers["X-CSRFToken"] = cookies["csrftoken"].value
+            break
+    if not headers:
+        raise CommandError("Could not sign in to the benchmark server")
+    return headers
+
+
+def setting(value):
+    name, sep, value = value.partition('=')
+    if not sep or not name:
+        raise ValueError(value)
+    return name, value
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, current, threshold):
+    # Yields (route, rps change %, p99 change %, regressed) for routes in
+    # both runs
+    for route, stats in current.items():
+        before = previous.get(route)
+        if not before or not before["rps"] or not before["p99_ms"]:
+            continue
+        rps = (stats["rps"] - before["rps"]) / before["rps"] * 100
+        p99 = (stats["p99_ms"] - before["p99_ms"]) / before["p99_ms"] * 100
+        yield route, rps, p99, rps < -threshold or p99 > threshold
+
+
+class Command(BaseCommand):
+    help = ("Benchmark every djangoapp route under gunicorn against local "
+            "stub backends and save throughput and latency percentiles as "
+            "JSON")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=('wsgi', 'asgi'),
+                            default='wsgi')
+        parser.add_argument('--workers', type=int, default=3)
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--requests', type=int, default=200,
+                            help="requests per route")
+        parser.add_argument('--latency', type=float, default=0.02,
+                            help="seconds each backend stub call takes")
+        parser.add_argument('--chat-latency', type=float, default=0.2,
+                            help="seconds each chat completion takes")
+        parser.add_argument('--scale', type=int, default=1,
+                            help="copies of the seed dealers, reviews and "
+                                 "cars")
+        parser.add_argument('--routes', nargs='*',
+                            help="only these route names")
+        parser.add_argument('--env', type=setting, action='append',
+                            default=[], metavar='NAME=VALUE',
+                            help="extra environment for the server, e.g. "
+                                 "SESSION_STORE=db (repeatable)")
+        parser.add_argument('--output',
+                            help="results file (default: "
+                                 "benchmarks/results/<time>-<commit>.json)")
+        parser.add_argument('--compare',
+                            help="earlier results file to compare against")
+        parser.add_argument('--threshold', type=float, default=10.0,
+                            help="percent change reported as a regression")
+
+    def handle(self, *args, **options):
+        started = datetime.datetime.now(datetime.timezone.utc)
+        with running_backends(options['latency'], options['chat_latency'],
+                              options['scale']) as (env, _, data), \
+                tempfile.TemporaryDirectory() as tmp:
+            plans = route_plans(data, options['requests'])
+            missing = djangoapp_routes() - {name.split(':')[0]
+                                            for name in plans}
+            if missing:
+                raise CommandError("No benchmark plan for routes: " +
+                                   ", ".join(sorted(missing)))
+            if options['routes']:
+                plans = {name: plan for name, plan in plans.items()
+                         if name.split(':')[0] in options['routes']}
+            env.update({
+                "SERVER_MODE": options['mode'],
+                "ASYNC_PROXY_VIEWS": str(options['mode'] == 'asgi').lower(),
+                "SQLITE_PATH": os.path.join(tmp, 'db.sqlite3'),
+                "SENTIMENT_CACHE_DIR": os.path.join(tmp, 'sentiment'),
+                "SESSION_CACHE_DIR": os.path.join(tmp, 'sessions'),
+                "SHARED_CACHE_DIR": os.path.join(tmp, 'shared'),
+                "METRICS_DIR": os.path.join(tmp, 'metrics'),
+                "LOG_LEVEL": "WARNING",
+            })
+            env.update(options['env'])
+            self.prepare_database(env)
+            with gunicorn_server(env, workers=options['workers']) as url:
+                auth = sign_in(url)
+                results = {}
+                for name, plan in plans.items():
+                    results[name] = self.run_plan(url, plan, auth, options)
+                    self.stdout.write(f"{name:24} {json.dumps(results[name])}")
+
+        report = {"commit": git_commit(),
+                  "started": started.isoformat(timespec="seconds"),
+                  "options": {key: options[key] for key in (
+                      'mode', 'workers', 'concurrency', 'requests',
+                      'latency', 'chat_latency', 'scale')},
+                  "env": dict(options['env']),
+                  "routes": results}
+        output = options['output'] or os.path.join(
+            RESULTS_DIR, f"{started:%Y%m%dT%H%M%S}-{report['commit']}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(f"Results saved to {output}")
+        if options['compare']:
+            self.report_changes(options['compare'], results,
+                                options['threshold'])
+
+    def prepare_database(self, env):
+        server_env = dict(os.environ)
+        server_env.update(env)
+        for command in (["migrate", "--run-syncdb"], ["seed_cars"]):
+            done = subprocess.run(
+                [sys.executable, "manage.py", *command, "--skip-checks"],
+                cwd=settings.BASE_DIR, env=server_env, capture_output=True,
+                text=True)
+            if done.returncode:
+                raise CommandError(f"{' '.join(command)} failed:\n"
+                                   + done.stderr)
+
+    def run_plan(self, url, plan, auth, options):
+        urls = [url + path for path in plan.paths]
+        headers = {"Content-Type": "application/json"} if plan.body else {}
+        if plan.auth:
+            headers.update(auth)
+        if plan.warm_up:
+            # Fills the per-worker caches and connection pools
+            drive(urls, min(options['concurrency'], 4),
+                  max(4, options['requests'] // 10), plan.method, plan.body,
+                  headers)
+        return drive(urls, options['concurrency'], options['requests'],
+                     plan.method, plan.body, headers)
+
+    def report_changes(self, path, results, threshold):
+        with open(path) as f:
+            previous = json.load(f)["routes"]
+        regressions = 0
+        for route, rps, p99, regressed in compare(previous, results,
+                                                  threshold):
+            regressions += regressed
+            self.stdout.write(f"{route:24} rps {rps:+6.1f}%  p99 {p99:+6.1f}%"
+                              + ("  REGRESSION" if regressed else ""))
+        self.stdout.write(f"{regressions} regression(s) beyond "
+                          f"{threshold:g}% against {path}")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from djangoapp.populate import initiate
+
+
+class Command(BaseCommand):
+    help = "Insert the default car makes and models that are missing"
+
+    def handle(self, *args, **options):
+        created = initiate()
+        self.stdout.write(f"Seeded {created} car makes and models")
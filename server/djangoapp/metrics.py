@@ -0,0 +1,306 @@
+# metrics.py
+# Latency histograms, request/error counters and in-flight gauges for the
+# Django views (labelled by route name) and for upstream calls (labelled
+# by upstream and endpoint), rendered in the Prometheus text format.
+#
+# Each process keeps its own series. When METRICS_DIR is set (gunicorn.conf
+# sets it) a background thread writes them to METRICS_DIR/<pid>-<start>.json
+# every METRICS_FLUSH_INTERVAL seconds, and a scrape of any worker merges
+# every file: counters and histograms of all workers that ever ran, gauges
+# of live workers only.
+
+import bisect
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+# One debug line per upstream call, usually sampled (see LOG_SAMPLE)
+upstream_logger = logging.getLogger("djangoapp.upstream")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+
+HELP = {
+    "django_requests_total": ("counter", "Requests handled, by route and "
+                              "status code."),
+    "django_request_errors_total": ("counter", "Requests that raised or "
+                                    "returned a 5xx, by route."),
+    "django_request_duration_seconds": ("histogram", "Time spent in Django "
+                                        "per request, by route."),
+    "django_requests_in_flight": ("gauge", "Requests being handled."),
+    "upstream_requests_total": ("counter", "Upstream calls, by upstream, "
+                                "endpoint and status code."),
+    "upstream_errors_total": ("counter", "Upstream calls that raised or "
+                              "returned a 5xx."),
+    "upstream_request_duration_seconds": ("histogram", "Upstream call "
+                                          "latency."),
+    "upstream_requests_in_flight": ("gauge", "Upstream calls in "
+                                    "progress."),
+    "upstream_breaker_open": ("gauge", "Workers whose circuit breaker for "
+                              "the upstream is open or half-open."),
+    "upstream_breaker_rejections_total": ("counter", "Calls failed fast "
+                                          "by an open circuit breaker."),
+    "upstream_breaker_transitions_total": ("counter", "Circuit breaker "
+                                           "state changes."),
+}
+
+
+_IN_FLIGHT = ("django_requests_in_flight", ())
+# (route, status) -> series keys, so a request builds no label tuples
+_request_keys = {}
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Metrics:
+    def __init__(self, directory=None, flush_interval=5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self._reset()
+        # Forked workers start empty so the parent's series are not counted
+        # twice
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # series key: (name, ((label, value), ...))
+        self.counters = {}
+        self.gauges = {}
+        # histogram series -> [bucket counts..., +Inf count, sum]
+        self.histograms = {}
+        self.pid = os.getpid()
+        self.path = None
+        self.flusher = None
+
+    # The unlocked _inc/_add/_observe are called with self.lock held, so a
+    # request or upstream call takes the lock once per update batch
+
+    def _inc(self, key, amount=1):
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def _add(self, key, amount):
+        self.gauges[key] = self.gauges.get(key, 0) + amount
+
+    def _observe(self, key, seconds):
+        series = self.histograms.get(key)
+        if series is None:
+            series = self.histograms[key] = [0] * (len(LATENCY_BUCKETS) + 2)
+            if self.directory and self.flusher is None:
+                self._start_flusher()
+        series[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        series[-1] += seconds
+
+    def inc(self, name, labels, amount=1):
+        with self.lock:
+            self._inc((name, labels), amount)
+
+    def add(self, name, labels, amount):
+        with self.lock:
+            self._add((name, labels), amount)
+
+    def observe(self, name, labels, seconds):
+        with self.lock:
+            self._observe((name, labels), seconds)
+
+    def request_started(self):
+        with self.lock:
+            self._add(_IN_FLIGHT, 1)
+
+    def request_finished(self, route, status, seconds, failed):
+        keys = _request_keys.get((route, status))
+        if keys is None:
+            labels = (("route", route),)
+            keys = _request_keys[(route, status)] = (
+                ("django_requests_total",
+                 labels + (("status", str(status)),)),
+                ("django_request_errors_total", labels),
+                ("django_request_duration_seconds", labels))
+        with self.lock:
+            self._add(_IN_FLIGHT, -1)
+            self._inc(keys[0])
+            if failed:
+                self._inc(keys[1])
+            self._observe(keys[2], seconds)
+
+    def upstream_started(self, upstream):
+        with self.lock:
+            self._add(("upstream_requests_in_flight",
+                       (("upstream", upstream),)), 1)
+
+    def upstream_finished(self, labels, status, seconds):
+        failed = status == "error" or status >= 500
+        with self.lock:
+            self._add(("upstream_requests_in_flight", labels[:1]), -1)
+            self._inc(("upstream_requests_total",
+                       labels + (("status", str(status)),)))
+            if failed:
+                self._inc(("upstream_errors_total", labels))
+            self._observe(("upstream_request_duration_seconds", labels),
+                          seconds)
+
+    def upstream(self, upstream, endpoint):
+        return UpstreamTimer(self, upstream, endpoint)
+
+    def snapshot(self):
+        with self.lock:
+            return {"pid": self.pid,
+                    "counters": list(self.counters.items()),
+                    "gauges": list(self.gauges.items()),
+                    "histograms": [(key, list(series)) for key, series
+                                   in self.histograms.items()]}
+
+    # Sharing between workers
+
+    def _start_flusher(self):
+        self.path = os.path.join(
+            self.directory, f"{self.pid}-{time.time_ns()}.json")
+        self.flusher = threading.Thread(target=self._flush_loop,
+                                        name="metrics-flush", daemon=True)
+        self.flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as err:
+                logger.warning("Metrics flush failed %r", err)
+
+    def flush(self):
+        if self.path is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, self.path)
+
+    def collect(self):
+        # Snapshots of every worker, or just this process without a
+        # directory
+        if not self.directory:
+            return [self.snapshot()]
+        if self.path is not None:
+            self.flush()
+        snapshots = [] if self.path is not None else [self.snapshot()]
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            snapshots.append(_from_json(snapshot))
+        return snapshots
+
+    def render(self):
+        return render(merge(self.collect()))
+
+
+class UpstreamTimer:
+    """Context manager timing one upstream call; set .status on success."""
+
+    __slots__ = ("metrics", "labels", "status", "started")
+
+    def __init__(self, metrics, upstream, endpoint):
+        self.metrics = metrics
+        self.labels = (("upstream", upstream), ("endpoint", endpoint))
+        self.status = None
+
+    def __enter__(self):
+        self.metrics.upstream_started(self.labels[0][1])
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        status = self.status
+        if exc_type is not None or status is None:
+            status = "error"
+        self.metrics.upstream_finished(self.labels, status, elapsed)
+        upstream, endpoint = self.labels[0][1], self.labels[1][1]
+        upstream_logger.debug(
+            "%s %s %s in %.1fms", upstream, endpoint, status, elapsed * 1000,
+            extra={"upstream": upstream, "endpoint": endpoint,
+                   "status": status, "elapsed_ms": round(elapsed * 1000, 2)})
+        return False
+
+
+def _from_json(snapshot):
+    def keys(items):
+        return [((name, tuple(map(tuple, labels))), value)
+                for (name, labels), value in items]
+    return {"pid": snapshot["pid"],
+            "counters": keys(snapshot["counters"]),
+            "gauges": keys(snapshot["gauges"]),
+            "histograms": keys(snapshot["histograms"]),
+            "live": _pid_alive(snapshot["pid"])}
+
+
+def merge(snapshots):
+    counters, gauges, histograms = {}, {}, {}
+    for snapshot in snapshots:
+        for key, value in snapshot["counters"]:
+            counters[key] = counters.get(key, 0) + value
+        if snapshot.get("live", True):
+            for key, value in snapshot["gauges"]:
+                gauges[key] = gauges.get(key, 0) + value
+        for key, series in snapshot["histograms"]:
+            total = histograms.get(key)
+            histograms[key] = series if total is None else [
+                a + b for a, b in zip(total, series)]
+    return counters, gauges, histograms
+
+
+def _labels(labels, extra=()):
+    labels = labels + extra
+    if not labels:
+        return ""
+    pairs = ",".join('{}="{}"'.format(
+        name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in labels)
+    return "{" + pairs + "}"
+
+
+def render(merged):
+    counters, gauges, histograms = merged
+    by_name = {}
+    for kind, series in (("counter", counters), ("gauge", gauges),
+                         ("histogram", histograms)):
+        for (name, labels), value in series.items():
+            by_name.setdefault(name, (kind, []))[1].append((labels, value))
+    lines = []
+    for name in sorted(by_name):
+        kind, series = by_name[name]
+        lines.append(f"# HELP {name} {HELP.get(name, (kind, name))[1]}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(series, key=lambda s: s[0]):
+            if kind != "histogram":
+                lines.append(f"{name}{_labels(labels)} {value}")
+                continue
+            cumulative = 0
+            for edge, count in zip(LATENCY_BUCKETS + ("+Inf",), value[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket"
+                             f"{_labels(labels, (('le', edge),))} "
+                             f"{cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {value[-1]}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+metrics = Metrics(settings.METRICS_DIR, METRICS_FLUSH_INTERVAL)
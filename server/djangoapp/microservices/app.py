@@ -1,9 +1,50 @@
-from flask import Flask
-from nltk.sentiment import SentimentIntensityAnalyzer
+from flask import Flask, g, request
+from werkzeug.routing import PathConverter
+from engine import ScoringEngine, score
 import json
+import logging
+import time
+import uuid
+
+import json_logging
+
+# The pool forks first, so its workers do not inherit the log listener
+# thread's queue and locks
+engine = ScoringEngine().start()
+
+json_logging.configure()
+logger = logging.getLogger("sentiment")
 app = Flask("Sentiment Analyzer")
 
-sia = SentimentIntensityAnalyzer()
+
+class TextConverter(PathConverter):
+    # Review texts arrive percent-decoded, so any slashes in them (leading
+    # and repeated ones too) are part of the path
+    regex = ".+?"
+    part_isolating = False
+
+
+app.url_map.converters['text'] = TextConverter
+
+
+@app.before_request
+def start_request():
+    g.started = time.perf_counter()
+    json_logging.request_id.set(
+        request.headers.get('X-Request-ID') or uuid.uuid4().hex)
+
+
+# One sampled debug line per request (LOG_LEVEL=DEBUG,
+# LOG_SAMPLE="sentiment=100")
+@app.after_request
+def log_request(response):
+    elapsed = (time.perf_counter() - g.started) * 1000
+    logger.debug("%s %s %s in %.1fms", request.method, request.url_rule,
+                 response.status_code, elapsed,
+                 extra={"path": str(request.url_rule),
+                        "status": response.status_code,
+                        "elapsed_ms": round(elapsed, 2)})
+    return response
 
 
 @app.get('/')
@@ -12,23 +53,27 @@ def home():
     Use /analyze/text to get the sentiment"
 
 
-@app.get('/analyze/<input_txt>')
+@app.get('/analyze/<text:input_txt>', merge_slashes=False)
 def analyze_sentiment(input_txt):
+    return json.dumps(score(input_txt))
+
+
+# Score many texts in one call. Expects {"texts": [...]} and returns
+# {"sentiments": [{"sentiment": ..., "scores": ...}, ...]} in the same
+# order. Large batches are spread over the engine's worker pool.
+@app.post('/analyze_batch')
+def analyze_batch():
+    body = request.get_json(silent=True) or {}
+    texts = body.get('texts')
+    if not isinstance(texts, list):
+        return {"error": "Expected a JSON body with a 'texts' list"}, 400
+    return {"sentiments": engine.score_batch([str(text) for text in texts])}
+
 
-    scores = sia.polarity_scores(input_txt)
-    print(scores)
-    pos = float(scores['pos'])
-    neg = float(scores['neg'])
-    neu = float(scores['neu'])
-    res = "positive"
-    print("pos neg nue ", pos, neg, neu)
-    if (neg > pos and neg > neu):
-        res = "negative"
-    elif (neu > neg and neu > pos):
-        res = "neutral"
-    res = json.dumps({"sentiment": res})
-    print(res)
-    return res
+# Throughput of the batch endpoint since startup
+@app.get('/stats')
+def stats():
+    return engine.stats()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,115 @@
+# engine.py
+# Scoring engine for the sentiment service. The VADER lexicon is loaded
+# once in the parent process before the worker pool forks, so every worker
+# shares the parent's copy of it (copy-on-write) instead of loading its
+# own. Batches are split into chunks and scored in parallel; small batches
+# are scored in-process, where the pool's IPC would cost more than it
+# saves.
+
+import gc
+import multiprocessing
+import os
+import threading
+import time
+
+from nltk.sentiment import SentimentIntensityAnalyzer
+
+SENTIMENT_WORKERS = int(os.getenv('SENTIMENT_WORKERS', os.cpu_count() or 1))
+# Below this many texts a batch is scored without the pool
+SENTIMENT_MIN_PARALLEL = int(os.getenv('SENTIMENT_MIN_PARALLEL', 64))
+SENTIMENT_CHUNK_SIZE = int(os.getenv('SENTIMENT_CHUNK_SIZE', 256))
+
+sia = SentimentIntensityAnalyzer()
+
+
+def label_scores(scores):
+    pos = float(scores['pos'])
+    neg = float(scores['neg'])
+    neu = float(scores['neu'])
+    res = "positive"
+    if (neg > pos and neg > neu):
+        res = "negative"
+    elif (neu > neg and neu > pos):
+        res = "neutral"
+    return res
+
+
+def score(text):
+    scores = sia.polarity_scores(str(text))
+    return {"sentiment": label_scores(scores), "scores": scores}
+
+
+def score_chunk(texts):
+    return [score(text) for text in texts]
+
+
+class ScoringEngine:
+    def __init__(self, workers=SENTIMENT_WORKERS,
+                 min_parallel=SENTIMENT_MIN_PARALLEL,
+                 chunk_size=SENTIMENT_CHUNK_SIZE):
+        self.workers = workers
+        self.min_parallel = min_parallel
+        self.chunk_size = chunk_size
+        self.pool = None
+        self.lock = threading.Lock()
+        # Batches run concurrently on the service's threads, so throughput
+        # is measured over the time at least one batch was running
+        self.active = 0
+        self.busy_since = 0.0
+        self.counters = {"texts": 0, "batches": 0, "pooled_batches": 0,
+                         "busy_seconds": 0.0}
+
+    def start(self):
+        if self.workers > 1 and self.pool is None:
+            # Keep the lexicon out of the collector so forked workers do
+            # not touch (and copy) its pages
+            gc.freeze()
+            self.pool = multiprocessing.get_context('fork').Pool(
+                self.workers)
+        return self
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def score_batch(self, texts):
+        with self.lock:
+            if not self.active:
+                self.busy_since = time.perf_counter()
+            self.active += 1
+        pooled = self.pool is not None and len(texts) >= self.min_parallel
+        try:
+            if pooled:
+                # Enough chunks to keep every worker busy
+                size = max(1, min(self.chunk_size,
+                                  -(-len(texts) // self.workers)))
+                chunks = [texts[i:i + size]
+                          for i in range(0, len(texts), size)]
+                results = [result
+                           for chunk in self.pool.map(score_chunk, chunks)
+                           for result in chunk]
+            else:
+                results = score_chunk(texts)
+        finally:
+            with self.lock:
+                self.active -= 1
+                if not self.active:
+                    self.counters["busy_seconds"] += \
+                        time.perf_counter() - self.busy_since
+        with self.lock:
+            self.counters["texts"] += len(texts)
+            self.counters["batches"] += 1
+            self.counters["pooled_batches"] += int(pooled)
+        return results
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            if self.active:
+                stats["busy_seconds"] += time.perf_counter() - self.busy_since
+        seconds = stats["busy_seconds"]
+        stats["texts_per_sec"] = stats["texts"] / seconds if seconds else 0.0
+        stats["workers"] = self.workers if self.pool is not None else 1
+        return stats
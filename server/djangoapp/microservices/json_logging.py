@@ -0,0 +1,142 @@
+# json_logging.py
+# Non-blocking JSON logging for the Django app and the sentiment service
+# (stdlib only, so the service image can use it as is).
+#
+# QueueJsonHandler only copies each record onto a bounded queue; a
+# background thread encodes it as one JSON line and writes it, so request
+# threads never wait on stdout. When the queue is full records are dropped
+# and counted instead of blocking. Every line carries the request id of
+# the request that logged it, and any `extra` fields (upstream timings,
+# for example). Debug lines can be sampled per logger with
+# LOG_SAMPLE="djangoapp.restapis=100,djangoapp.upstream=10" (keep one in
+# N debug calls of each named logger; the others cost about as much as a
+# disabled log call).
+
+import contextvars
+import copy
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+
+# Set per request by the Django middleware or the service's before_request
+request_id = contextvars.ContextVar('request_id', default=None)
+
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message",
+                                                        "request_id"}
+_tracebacks = logging.Formatter()
+
+
+def parse_sample(spec):
+    # "logger=N,other=M" -> {"logger": N, "other": M}
+    rates = {}
+    for part in (spec or "").split(","):
+        name, _, rate = part.partition("=")
+        if name.strip() and rate.strip():
+            rates[name.strip()] = max(1, int(rate))
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {"time": datetime.fromtimestamp(
+                     record.created, timezone.utc).isoformat(
+                     timespec="milliseconds"),
+                 "level": record.levelname,
+                 "logger": record.name,
+                 "message": record.getMessage()}
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DebugSampler:
+    """Replaces a logger's isEnabledFor so only one in `rate` debug calls
+    gets through, before the logging module builds a record for it."""
+
+    def __init__(self, logger, rate):
+        self.is_enabled = logging.Logger.isEnabledFor.__get__(logger)
+        self.rate = rate
+        self.counter = itertools.count()
+
+    def __call__(self, level):
+        if not self.is_enabled(level):
+            return False
+        return level >= logging.INFO or next(self.counter) % self.rate == 0
+
+
+def sample_debug(rates):
+    for name, rate in rates.items():
+        logger = logging.getLogger(name)
+        logger.isEnabledFor = DebugSampler(logger, rate)
+
+
+def skip_record_details():
+    # The JSON lines carry no caller or process details, so skip the stack
+    # walk and lookups the logging module does for every record (see
+    # "Optimization" in the logging HOWTO). This changes every handler in
+    # the process, so only the code that owns its logging calls it.
+    logging._srcfile = None
+    logging.logProcesses = logging.logMultiprocessing = False
+
+
+class _Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # Waits for room so stop() works even when the queue is full
+        self.queue.put(self._sentinel)
+
+
+class QueueJsonHandler(logging.handlers.QueueHandler):
+    def __init__(self, stream=None, maxsize=10000, sample=""):
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+        sample_debug(parse_sample(sample))
+        target = logging.StreamHandler(stream or sys.stdout)
+        target.setFormatter(JsonFormatter())
+        self.listener = _Listener(self.queue, target)
+        self.listener.start()
+
+    def prepare(self, record):
+        # Merge the message arguments and render any traceback here, in
+        # the caller, so the queued record holds no live objects; the JSON
+        # encoding happens on the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _tracebacks.formatException(record.exc_info)
+            record.exc_info = None
+        record.request_id = request_id.get()
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        # Called by logging.shutdown() at exit; writes out what is queued
+        if self.listener._thread is not None:
+            self.listener.stop()
+        super().close()
+
+
+def configure(name=None, level=None, sample=None):
+    # For processes without Django's LOGGING setting (the sentiment service)
+    skip_record_details()
+    handler = QueueJsonHandler(sample=os.getenv('LOG_SAMPLE', '')
+                               if sample is None else sample)
+    logger = logging.getLogger(name)
+    logger.addHandler(handler)
+    logger.setLevel(level or os.getenv('LOG_LEVEL', 'INFO').upper())
+    return handler
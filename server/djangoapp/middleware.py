@@ -0,0 +1,145 @@
+# middleware.py
+# request_id_middleware tags each request (and its log lines) with the
+# incoming X-Request-ID, or a new one, and echoes it on the response.
+# metrics_middleware records per-route latency, counts and in-flight
+# requests (see metrics.py). compression_middleware gzips or brotli
+# compresses large text responses (see compression.py).
+# stale_response_middleware flags responses that were built from
+# last-known-good upstream data (see last_known_good.py) with an
+# X-Stale-Upstreams header and, for JSON object bodies,
+# "stale"/"staleUpstreams" fields.
+
+import json
+import re
+import time
+import uuid
+
+from asgiref.sync import iscoroutinefunction
+from django.utils.decorators import sync_and_async_middleware
+
+from .compression import compress_response
+from .last_known_good import stale_upstreams
+from .microservices.json_logging import request_id
+from .metrics import metrics
+
+
+# Incoming ids are reused only if they look like ids
+REQUEST_ID = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+
+def new_request_id(request):
+    incoming = request.headers.get('X-Request-ID', '')
+    if REQUEST_ID.fullmatch(incoming):
+        return incoming
+    return uuid.uuid4().hex
+
+
+@sync_and_async_middleware
+def request_id_middleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            request.request_id = new_request_id(request)
+            token = request_id.set(request.request_id)
+            try:
+                response = await get_response(request)
+            finally:
+                request_id.reset(token)
+            response['X-Request-ID'] = request.request_id
+            return response
+    else:
+        def middleware(request):
+            request.request_id = new_request_id(request)
+            token = request_id.set(request.request_id)
+            try:
+                response = get_response(request)
+            finally:
+                request_id.reset(token)
+            response['X-Request-ID'] = request.request_id
+            return response
+    return middleware
+
+
+def route_name(request):
+    match = request.resolver_match
+    if match is None:
+        return "unmatched"
+    return match.url_name or match.route
+
+
+def record_request(request, response, started):
+    status = response.status_code if response is not None else 500
+    metrics.request_finished(route_name(request), status,
+                             time.perf_counter() - started, status >= 500)
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            metrics.request_started()
+            started = time.perf_counter()
+            response = None
+            try:
+                response = await get_response(request)
+                return response
+            finally:
+                record_request(request, response, started)
+    else:
+        def middleware(request):
+            metrics.request_started()
+            started = time.perf_counter()
+            response = None
+            try:
+                response = get_response(request)
+                return response
+            finally:
+                record_request(request, response, started)
+    return middleware
+
+
+@sync_and_async_middleware
+def compression_middleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            return compress_response(request, await get_response(request))
+    else:
+        def middleware(request):
+            return compress_response(request, get_response(request))
+    return middleware
+
+
+def flag_stale(response, upstreams):
+    if not upstreams:
+        return response
+    names = sorted(upstreams)
+    response['X-Stale-Upstreams'] = ",".join(names)
+    # Streamed bodies only get the header
+    if not response.streaming and \
+            response.get('Content-Type', '').startswith('application/json'):
+        body = json.loads(response.content)
+        if isinstance(body, dict):
+            body["stale"] = True
+            body["staleUpstreams"] = names
+            response.content = json.dumps(body)
+    return response
+
+
+@sync_and_async_middleware
+def stale_response_middleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            upstreams = set()
+            token = stale_upstreams.set(upstreams)
+            try:
+                return flag_stale(await get_response(request), upstreams)
+            finally:
+                stale_upstreams.reset(token)
+    else:
+        def middleware(request):
+            upstreams = set()
+            token = stale_upstreams.set(upstreams)
+            try:
+                return flag_stale(get_response(request), upstreams)
+            finally:
+                stale_upstreams.reset(token)
+    return middleware
@@ -1,8 +1,12 @@
 # This script is responsible for populating the Django database
 # with initial data for car makes and car models.
 # It creates instances of the CarMake and CarModel models and associates
-#  them accordingly.
+#  them accordingly. Run it with `python manage.py seed_cars`; it only
+#  inserts the makes and models that are missing, in one transaction.
 
+from django.db import transaction
+
+from .catalog import car_catalog
 from .models import CarMake, CarModel
 
 
@@ -15,11 +19,23 @@ def initiate():
         {"name": "Toyota", "description": "Great cars. Japanese technology"},
     ]
 
-    car_make_instances = []
-    for data in car_make_data:
-        car_make_instances.append(
-             CarMake.objects.create(name=data['name'],
-                                    description=data['description']))
+    with transaction.atomic():
+        created = _seed(car_make_data)
+    if created:
+        car_catalog.invalidate()
+    return created
+
+
+def _seed(car_make_data):
+    # bulk_create skips save() and its signals, so initiate() invalidates
+    # the catalog itself
+    existing = set(CarMake.objects.values_list('name', flat=True))
+    new_makes = [CarMake(name=data['name'], description=data['description'])
+                 for data in car_make_data if data['name'] not in existing]
+    CarMake.objects.bulk_create(new_makes)
+    makes = {make.name: make for make in CarMake.objects.filter(
+        name__in=[data['name'] for data in car_make_data])}
+    car_make_instances = [makes[data['name']] for data in car_make_data]
 
     # Create CarModel instances with the corresponding CarMake instances
     car_model_data = [
@@ -56,6 +72,10 @@ def initiate():
       # Add more CarModel instances as needed
     ]
 
-    for data in car_model_data:
-        CarModel.objects.create(name=data['name'], car_make=data['car_make'],
-                                type=data['type'], year=data['year'])
+    existing = set(CarModel.objects.values_list('car_make_id', 'name'))
+    new_models = [CarModel(name=data['name'], car_make=data['car_make'],
+                           type=data['type'], year=data['year'])
+                  for data in car_model_data
+                  if (data['car_make'].id, data['name']) not in existing]
+    CarModel.objects.bulk_create(new_models)
+    return len(new_makes) + len(new_models)
@@ -0,0 +1,229 @@
+# response_cache.py
+# TTL cache for proxied upstream responses that change rarely (dealer list,
+# dealer details, makes/models). Entries are keyed by namespace and request
+# URL. A fresh entry is served directly; an entry past its TTL but inside
+# the stale window is served immediately while one background refresh
+# fetches a new copy (stale-while-revalidate). Error payloads are never
+# cached, and a failed refresh keeps serving the stale copy.
+#
+# Writes that change upstream data call invalidate(namespace), which bumps
+# the namespace's generation in this worker and, when RESPONSE_CACHE_ALIAS
+# names a shared Django cache, there too so every worker drops its copies.
+# A fetch that was already in flight stores its (pre-edit) result under the
+# old generation, where no lookup will find it. Workers read the shared
+# generation at most once every SHARED_CACHE_CHECK seconds, so a lookup
+# (on the event loop, for the async views) seldom touches the shared store
+# and another worker's edit is seen within that interval.
+
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .fanout import executor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTLS = {
+    # namespace: (ttl seconds, extra seconds a stale copy may be served)
+    "dealers": (float(os.getenv('DEALERS_CACHE_TTL', 300)),
+                float(os.getenv('DEALERS_CACHE_STALE', 600))),
+    "makes_models": (float(os.getenv('MAKES_MODELS_CACHE_TTL', 600)),
+                     float(os.getenv('MAKES_MODELS_CACHE_STALE', 1800))),
+}
+
+SHARED_CACHE_CHECK = float(os.getenv('SHARED_CACHE_CHECK', 1))
+
+FRESH, STALE, MISS = "fresh", "stale", "miss"
+
+
+def cacheable(value):
+    return value is not None and not (isinstance(value, dict) and
+                                      'error' in value)
+
+
+class SharedCounter:
+    """A counter kept in a shared Django cache. get() reads the store at
+    most once per `interval` seconds; bump() increments it there."""
+
+    def __init__(self, alias, key, interval=SHARED_CACHE_CHECK):
+        self.alias = alias
+        self.key = key
+        self.interval = interval
+        # (value, when it was read)
+        self.checked = None
+
+    def get(self):
+        if not self.alias:
+            return 0
+        checked = self.checked
+        now = time.monotonic()
+        if checked is not None and now - checked[1] < self.interval:
+            return checked[0]
+        try:
+            value = caches[self.alias].get(self.key, 0)
+        except Exception as err:
+            logger.warning("Shared counter store error %r", err)
+            return checked[0] if checked is not None else 0
+        self.checked = (value, now)
+        return value
+
+    def bump(self):
+        if not self.alias:
+            return
+        shared = caches[self.alias]
+        try:
+            shared.add(self.key, 0, None)
+            self.checked = (shared.incr(self.key), time.monotonic())
+        except Exception as err:
+            logger.warning("Shared counter store error %r", err)
+
+
+class ResponseCache:
+    def __init__(self, ttls, shared_alias=None, maxsize=1000):
+        self.ttls = dict(ttls)
+        self.shared_alias = shared_alias
+        self.maxsize = maxsize
+        self.entries = {}
+        # namespace -> invalidations in this worker, and in every worker
+        self.generations = {}
+        self.shared_generations = {
+            namespace: SharedCounter(shared_alias,
+                                     f"response-cache-gen:{namespace}")
+            for namespace in self.ttls}
+        self.refreshing = set()
+        # Running async refreshes, so they are not garbage collected
+        self.tasks = set()
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "stale_hits": 0, "misses": 0,
+                         "refreshes": 0, "refresh_errors": 0,
+                         "invalidations": 0}
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def _generation(self, namespace):
+        return (self.generations.get(namespace, 0),
+                self.shared_generations[namespace].get())
+
+    def _lookup(self, namespace, key):
+        ttl, stale = self.ttls[namespace]
+        generation = self._generation(namespace)
+        with self.lock:
+            entry = self.entries.get((namespace, key))
+        if entry is None or entry[2] != generation:
+            return MISS, None, generation
+        age = time.monotonic() - entry[1]
+        if age < ttl:
+            return FRESH, entry[0], generation
+        if age < ttl + stale:
+            return STALE, entry[0], generation
+        return MISS, entry[0], generation
+
+    def _store(self, namespace, key, value, generation):
+        if generation != self._generation(namespace):
+            # Fetched before an invalidation; keep any newer copy
+            return
+        with self.lock:
+            if len(self.entries) >= self.maxsize:
+                # Drop the oldest entry to keep the cache bounded
+                oldest = min(self.entries, key=lambda k: self.entries[k][1])
+                del self.entries[oldest]
+            self.entries[(namespace, key)] = (value, time.monotonic(),
+                                              generation)
+
+    def _start_refresh(self, namespace, key):
+        with self.lock:
+            if (namespace, key) in self.refreshing:
+                return False
+            self.refreshing.add((namespace, key))
+        self._count("refreshes")
+        return True
+
+    def _finish_refresh(self, namespace, key, value, generation):
+        with self.lock:
+            self.refreshing.discard((namespace, key))
+        if cacheable(value):
+            self._store(namespace, key, value, generation)
+        else:
+            self._count("refresh_errors")
+
+    def _refresh(self, namespace, key, fetch, generation):
+        value = None
+        try:
+            value = fetch()
+        finally:
+            self._finish_refresh(namespace, key, value, generation)
+
+    def _miss(self, namespace, key, value, old_value, generation):
+        if cacheable(value):
+            self._store(namespace, key, value, generation)
+            return value
+        # Upstream failed; an expired copy beats an error
+        return old_value if old_value is not None else value
+
+    def get_or_fetch(self, namespace, key, fetch):
+        state, value, generation = self._lookup(namespace, key)
+        if state == FRESH:
+            self._count("hits")
+            return value
+        if state == STALE:
+            self._count("stale_hits")
+            if self._start_refresh(namespace, key):
+                executor.submit(self._refresh, namespace, key, fetch,
+                                generation)
+            return value
+        self._count("misses")
+        return self._miss(namespace, key, fetch(), value, generation)
+
+    async def aget_or_fetch(self, namespace, key, fetch):
+        state, value, generation = self._lookup(namespace, key)
+        if state == FRESH:
+            self._count("hits")
+            return value
+        if state == STALE:
+            self._count("stale_hits")
+            if self._start_refresh(namespace, key):
+                task = asyncio.create_task(
+                    self._arefresh(namespace, key, fetch, generation))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+            return value
+        self._count("misses")
+        return self._miss(namespace, key, await fetch(), value, generation)
+
+    async def _arefresh(self, namespace, key, fetch, generation):
+        value = None
+        try:
+            value = await fetch()
+        finally:
+            self._finish_refresh(namespace, key, value, generation)
+
+    def invalidate(self, namespace):
+        with self.lock:
+            self.generations[namespace] = \
+                self.generations.get(namespace, 0) + 1
+            for entry_key in [k for k in self.entries if k[0] == namespace]:
+                del self.entries[entry_key]
+        self.shared_generations[namespace].bump()
+        self._count("invalidations")
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["size"] = len(self.entries)
+        return stats
+
+
+response_cache = ResponseCache(
+    DEFAULT_TTLS,
+    shared_alias=getattr(settings, 'RESPONSE_CACHE_ALIAS', None))
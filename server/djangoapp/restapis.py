@@ -2,13 +2,24 @@
 # This script provides functions to interact with several backend services
 # via REST APIs.
 
-import requests
+import logging
 import os
+import threading
+from urllib.parse import quote, urlsplit
 from dotenv import load_dotenv
-from django.http import JsonResponse
+from . import http_client
+from .circuit_breaker import breakers
+from .fast_json import JsonResponse
+from .last_known_good import last_known_good
+from .metrics import metrics
+from .response_cache import response_cache
+from .sentiment_cache import sentiment_cache
+from .single_flight import upstream_gets
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 backend_url = os.getenv(
     'backend_url', default="http://localhost:3030")
 sentiment_analyzer_url = os.getenv(
@@ -17,95 +28,267 @@ sentiment_analyzer_url = os.getenv(
 searchcars_url = os.getenv(
     'searchcars_url',
     default="http://localhost:3050/")
+# "remote" calls the sentiment microservice; "local" scores in this process
+# with the same engine (nltk is in requirements.txt; the VADER lexicon
+# bundled with the sentiment service is used when nltk has none installed)
+sentiment_engine = os.getenv('SENTIMENT_ENGINE', default="remote").lower()
 
+_local_engine = None
+_local_engine_lock = threading.Lock()
 
-def get_request(endpoint, **kwargs):
+
+def local_sentiment_engine():
+    # Imported on first use so the lexicon loads once per worker, and only
+    # in workers that score in-process
+    global _local_engine
+    if _local_engine is None:
+        with _local_engine_lock:
+            if _local_engine is None:
+                import nltk
+
+                nltk.data.path.append(os.path.join(
+                    os.path.dirname(os.path.abspath(__file__)),
+                    'microservices'))
+                from .microservices import engine
+                _local_engine = engine
+    return _local_engine
+
+
+def endpoint_label(request_url):
+    # Upstream path with numeric ids collapsed, for metric labels
+    parts = urlsplit(request_url).path.split("/")
+    return "/" + "/".join(":id" if part.isdigit() else part
+                          for part in parts if part)
+
+
+def upstream_call(upstream, request_url, send, endpoint=None):
+    # Runs send() under the upstream's circuit breaker and records its
+    # latency and status; calls the breaker rejects are not timed
+    endpoint = endpoint or endpoint_label(request_url)
+
+    def timed():
+        with metrics.upstream(upstream, endpoint) as timer:
+            response = send()
+            timer.status = response.status_code
+        return response
+    return breakers[upstream].call(timed)
+
+
+def shared_get(request_url, upstream, endpoint=None):
+    # Identical concurrent GETs share one upstream call (and one circuit
+    # breaker outcome). Each caller parses its own copy of the body, so
+    # views can modify the result freely.
+    return upstream_gets.do(
+        request_url,
+        lambda: upstream_call(upstream, request_url,
+                              lambda: http_client.get(request_url),
+                              endpoint))
+
+
+def read_json(request_url, upstream, fallback=True):
+    # GET and parse a JSON body. If the upstream fails, answers with a 5xx
+    # or its breaker is open, falls back to the last good body for the URL
+    # (flagging the response as stale) or None.
+    logger.debug("GET %s", request_url)
+    try:
+        response = shared_get(request_url, upstream)
+        if response.status_code < 500:
+            if response.status_code < 400:
+                last_known_good.remember(request_url, response.content)
+            return response.json()
+        logger.warning("Upstream %s returned %s", upstream,
+                       response.status_code)
+    except Exception as err:
+        logger.warning("Request to %s failed %r", upstream, err)
+    if fallback:
+        return last_known_good.recall(request_url, upstream)
+
+
+def backend_request_url(endpoint, **kwargs):
     params = ""
     if (kwargs):
         for key, value in kwargs.items():
             params = params+key+"="+value+"&"
 
-    request_url = backend_url+endpoint+"?"+params
-
-    print("GET from {} ".format(request_url))
-    try:
-        # Call get method of requests library with URL and parameters
-        response = requests.get(request_url)
-        return response.json()
-    except Exception as e:
-        # If any error occurs
-        print(f"Network exception occurred: {e}")
+    return backend_url+endpoint+"?"+params
 
 
-def searchcars_request(endpoint, **kwargs):
+def searchcars_request_url(endpoint, **kwargs):
     params = ""
     if (kwargs):
         for key, value in kwargs.items():
             params += f"{key}={value}&"
-    request_url = searchcars_url + endpoint + "?" + params.rstrip('&')
+    return searchcars_url + endpoint + "?" + params.rstrip('&')
+
 
-    print("GET from {} ".format(request_url))
+def get_request(endpoint, **kwargs):
+    return read_json(backend_request_url(endpoint, **kwargs), "backend")
+
+
+def searchcars_request(endpoint, **kwargs):
+    return read_json(searchcars_request_url(endpoint, **kwargs),
+                     "searchcars")
+
+
+def cached_read_json(namespace, request_url, upstream):
+    # read_json through the TTL response cache. The last-known-good
+    # fallback is applied outside the cache so a stale body is never
+    # cached as a fresh one.
+    value = response_cache.get_or_fetch(
+        namespace, request_url,
+        lambda: read_json(request_url, upstream, fallback=False))
+    if value is None:
+        value = last_known_good.recall(request_url, upstream)
+    return value
+
+
+def cached_get_request(namespace, endpoint, **kwargs):
+    # get_request through the TTL response cache for rarely changing data
+    return cached_read_json(namespace,
+                            backend_request_url(endpoint, **kwargs),
+                            "backend")
+
+
+def cached_searchcars_request(namespace, endpoint, **kwargs):
+    return cached_read_json(namespace,
+                            searchcars_request_url(endpoint, **kwargs),
+                            "searchcars")
+
+
+def sentiment_request_url(text):
+    return sentiment_analyzer_url+"analyze/"+quote(text, safe="")
+
+
+def _fetch_sentiment(text):
+    if sentiment_engine == "local":
+        return local_sentiment_engine().score(text)
+    request_url = sentiment_request_url(text)
+    # Call get method of the pooled session with URL and parameters
+    response = shared_get(request_url, "sentiment", "/analyze/:text")
+    return response.json()
+
+
+def analyze_review_sentiments(text, review_id=None):
+    sentiment_cache.remember_review(review_id, text)
+    cached = sentiment_cache.get(text)
+    if cached is not None:
+        return cached
     try:
-        # Call get method of requests library with URL and parameters
-        response = requests.get(request_url)
-        return response.json()
+        result = _fetch_sentiment(text)
+        if 'sentiment' in result:
+            sentiment_cache.set(text, result)
+        return result
     except Exception as err:
-        print(f"Unexpected {err=}, {type(err)=}")
-        print("Network exception occurred")
-    finally:
-        print("GET request call complete!")
+        logger.warning("Sentiment request failed %r", err)
+
+
+def split_cached_sentiments(texts, review_ids=None):
+    # Answers what it can from the sentiment cache. Returns the per-text
+    # results (None where uncached) and the unique texts still to score.
+    results = [None] * len(texts)
+    pending = []
+    for index, text in enumerate(texts):
+        if review_ids is not None:
+            sentiment_cache.remember_review(review_ids[index], text)
+        results[index] = sentiment_cache.get(text)
+        if results[index] is None and text not in pending:
+            pending.append(text)
+    return results, pending
 
 
-def analyze_review_sentiments(text):
-    request_url = sentiment_analyzer_url+"analyze/"+text
+def merge_scored_sentiments(texts, results, pending, sentiments):
+    if len(sentiments) != len(pending):
+        raise ValueError("Sentiment batch size mismatch")
+    scored = dict(zip(pending, sentiments))
+    for text, result in scored.items():
+        if result is not None and 'sentiment' in result:
+            sentiment_cache.set(text, result)
+    return [result if result is not None else scored[text]
+            for text, result in zip(texts, results)]
+
+
+def analyze_review_sentiments_batch(texts, review_ids=None):
+    # Returns one sentiment response (or None) per text, in order. Cached
+    # texts are answered locally and the rest are scored with a single
+    # round-trip to the analyzer's batch endpoint.
+    texts = list(texts)
+    results, pending = split_cached_sentiments(texts, review_ids)
+    if not pending:
+        return results
+
+    if sentiment_engine == "local":
+        sentiments = local_sentiment_engine().score_chunk(pending)
+        return merge_scored_sentiments(texts, results, pending, sentiments)
+
+    request_url = sentiment_analyzer_url+"analyze_batch"
     try:
-        # Call get method of requests library with URL and parameters
-        response = requests.get(request_url)
-        return response.json()
+        response = upstream_call(
+            "sentiment", request_url,
+            lambda: http_client.post(request_url, json={"texts": pending}))
+        if response.status_code in (404, 405):
+            # Older analyzer deployments only have the per-text endpoint
+            sentiments = [_fetch_sentiment(text) for text in pending]
+        else:
+            sentiments = response.json()['sentiments']
+        return merge_scored_sentiments(texts, results, pending, sentiments)
     except Exception as err:
-        print(f"Unexpected {err=}, {type(err)=}")
-        print("Network exception occurred for Sentiment")
+        logger.warning("Sentiment batch request failed %r", err)
+        return results
 
 
 def put_dealer(data, dealer_id):
     request_url = backend_url+"/update_dealer/"+str(dealer_id)
     try:
-        response = requests.put(request_url, data)
+        response = upstream_call(
+            "backend", request_url,
+            lambda: http_client.put(request_url, data))
         if response.status_code == 200:
+            response_cache.invalidate("dealers")
             return response.json()
         else:
-            print(f"Failed with status code {response.status_code}")
+            logger.warning("Failed with status code %s",
+                           response.status_code)
             return {"error": "Failed to update dealer"}
     except Exception as e:
-        print(f"Network exception occurred: {e}")
+        logger.warning("Network exception occurred %r", e)
         return {"error": "Network exception"}
 
 
 def post_dealer(data):
     request_url = backend_url+"/new_dealer"
     try:
-        response = requests.post(request_url, json=data)
-        print(response.json())
+        response = upstream_call(
+            "backend", request_url,
+            lambda: http_client.post(request_url, json=data))
+        if response.ok:
+            response_cache.invalidate("dealers")
+        logger.debug("Backend replied %s", response.content)
         return response.json()
     except Exception as e:
-        print(f"Network exception occurred: {e}")
+        logger.warning("Network exception occurred %r", e)
 
 
 def post_review(data_dict):
     request_url = backend_url+"/insert_review"
     try:
-        response = requests.post(request_url, json=data_dict)
-        print(response.json())
+        response = upstream_call(
+            "backend", request_url,
+            lambda: http_client.post(request_url, json=data_dict))
+        logger.debug("Backend replied %s", response.content)
         return response.json()
     except Exception as e:
-        print(f"Network exception occurred: {e}")
+        logger.warning("Network exception occurred %r", e)
 
 
 def put_review(data, review_id):
     request_url = backend_url+"/edit_review/"+str(review_id)
     try:
-        response = requests.put(request_url, data)
+        response = upstream_call(
+            "backend", request_url,
+            lambda: http_client.put(request_url, data))
         if response.status_code == 200:
+            if 'review' in data:
+                sentiment_cache.invalidate_review(review_id)
             return response.json()
         elif response.status_code == 403:
             return JsonResponse({"message": "Forbidden: You do not have \
@@ -115,10 +298,11 @@ def put_review(data, review_id):
             return JsonResponse({"message": "Review not found"},
                                 status=404)
         else:
-            print(f"Failed with status code {response.status_code}")
+            logger.warning("Failed with status code %s",
+                           response.status_code)
             return JsonResponse({"message":
                                 "An error occurred editing the review"},
                                 status=500)
     except Exception as e:
-        print(f"Network exception occurred: {e}")
+        logger.warning("Network exception occurred %r", e)
         return {"error": "Network exception"}
@@ -0,0 +1,163 @@
+# sentiment_cache.py
+# Content-addressed cache for sentiment analyzer results. Review texts are
+# normalized and hashed, and the hash maps to the analyzer's label and raw
+# polarity scores. Lookups go to a bounded in-process LRU first and then to
+# an optional shared Django cache backend, so every gunicorn worker can
+# reuse results computed by the others.
+
+import hashlib
+import logging
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+def normalize(text):
+    # VADER is case sensitive, so only whitespace and unicode form are
+    # normalized.
+    return " ".join(unicodedata.normalize('NFC', str(text)).split())
+
+
+def text_key(text):
+    digest = hashlib.sha256(normalize(text).encode('utf-8')).hexdigest()
+    return "sentiment:" + digest
+
+
+class LRUCache:
+    """Thread-safe, size-bounded mapping that evicts least recently used."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.data:
+                return None
+            self.data.move_to_end(key)
+            return self.data[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self.lock:
+            return self.data.pop(key, None) is not None
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+
+class SentimentCache:
+    def __init__(self, maxsize=10000, shared_alias=None):
+        self.local = LRUCache(maxsize)
+        # review id -> key of the text it was last scored with
+        self.review_keys = LRUCache(maxsize)
+        self.shared_alias = shared_alias
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "shared_hits": 0, "misses": 0,
+                         "invalidations": 0}
+
+    @property
+    def shared(self):
+        if not self.shared_alias:
+            return None
+        return caches[self.shared_alias]
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def _shared_call(self, method, *args):
+        # The shared store is an optimisation; never let it break a request
+        try:
+            return getattr(self.shared, method)(*args)
+        except Exception as err:
+            logger.warning("Sentiment cache store error %r", err)
+            return None
+
+    def get(self, text):
+        key = text_key(text)
+        value = self.local.get(key)
+        if value is not None:
+            self._count("hits")
+            return value
+        if self.shared is not None:
+            value = self._shared_call('get', key)
+            if value is not None:
+                self.local.set(key, value)
+                self._count("shared_hits")
+                return value
+        self._count("misses")
+        return None
+
+    def set(self, text, value):
+        key = text_key(text)
+        self.local.set(key, value)
+        if self.shared is not None:
+            self._shared_call('set', key, value, None)
+
+    def remember_review(self, review_id, text):
+        if review_id is None:
+            return
+        key = text_key(text)
+        # Called for every review on every page view; only an unseen or
+        # edited text is written
+        if self.review_keys.get(review_id) == key:
+            return
+        self.review_keys.set(review_id, key)
+        if self.shared is not None:
+            name = f"sentiment-review:{review_id}"
+            if self._shared_call('get', name) != key:
+                self._shared_call('set', name, key, None)
+
+    def invalidate_review(self, review_id):
+        # Drop the result for the text this review had before it was edited
+        key = self.review_keys.get(review_id)
+        if key is None and self.shared is not None:
+            key = self._shared_call('get', f"sentiment-review:{review_id}")
+        if key is None:
+            return False
+        self.local.delete(key)
+        self.review_keys.delete(review_id)
+        if self.shared is not None:
+            self._shared_call('delete_many',
+                              [key, f"sentiment-review:{review_id}"])
+        self._count("invalidations")
+        return True
+
+    def clear(self):
+        self.local.clear()
+        self.review_keys.clear()
+        if self.shared is not None:
+            self._shared_call('clear')
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats["evictions"] = self.local.evictions
+        stats["size"] = len(self.local)
+        stats["maxsize"] = self.local.maxsize
+        return stats
+
+
+sentiment_cache = SentimentCache(
+    maxsize=int(os.getenv('SENTIMENT_CACHE_SIZE', 10000)),
+    shared_alias=getattr(settings, 'SENTIMENT_CACHE_ALIAS', None))
@@ -0,0 +1,22 @@
+# signals.py
+# Keeps the in-memory car catalog in step with CarMake/CarModel edits, and
+# drops cached users when they are saved or deleted.
+
+from django.db.models.signals import post_delete, post_save
+
+from .catalog import car_catalog
+from .models import CarMake, CarModel, CustomUser
+from .user_cache import user_cache
+
+
+def connect():
+    for model in (CarMake, CarModel):
+        post_save.connect(car_catalog.invalidate, sender=model,
+                          dispatch_uid=f"car_catalog_save_{model.__name__}")
+        post_delete.connect(car_catalog.invalidate, sender=model,
+                            dispatch_uid=f"car_catalog_delete_"
+                                         f"{model.__name__}")
+    post_save.connect(user_cache.invalidate, sender=CustomUser,
+                      dispatch_uid="user_cache_save")
+    post_delete.connect(user_cache.invalidate, sender=CustomUser,
+                        dispatch_uid="user_cache_delete")
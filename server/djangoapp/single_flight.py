@@ -0,0 +1,83 @@
+# single_flight.py
+# Request coalescing for upstream GETs. While a call for a key is in
+# flight, identical calls from other threads (or tasks) wait for it and
+# receive the same outcome instead of issuing their own request; the
+# result or exception of the one upstream call is handed to every waiter.
+
+import asyncio
+import os
+import threading
+import weakref
+
+enabled = os.getenv('UPSTREAM_SINGLE_FLIGHT', 'true').lower() != 'false'
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        # key -> asyncio.Future, one table per event loop
+        self.async_calls = weakref.WeakKeyDictionary()
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        if not enabled:
+            return fn()
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as err:
+            call.error = err
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+    async def ado(self, key, fn):
+        if not enabled:
+            return await fn()
+        calls = self.async_calls.setdefault(asyncio.get_running_loop(), {})
+        future = calls.get(key)
+        if future is not None:
+            with self.lock:
+                self.coalesced += 1
+            # shield so a cancelled waiter does not cancel the shared call
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        calls[key] = future
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result
+        except BaseException as err:
+            future.set_exception(err)
+            # Mark retrieved so a call nobody else waited on does not warn
+            future.exception()
+            raise
+        finally:
+            del calls[key]
+
+
+upstream_gets = SingleFlight()
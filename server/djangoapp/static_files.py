@@ -0,0 +1,204 @@
+# static_files.py
+# Serves the React build without nginx (FRONTEND_SERVING=precompressed).
+#
+# `collectstatic` (CompressedStaticFilesStorage) writes .gz and, with the
+# brotli package, .br copies of every compressible file next to it at the
+# highest levels, once. static_asset picks the copy the client accepts, so
+# requests never compress anything. Build files whose names carry a
+# content hash (main.3f2a91c4.js, 453.1a2b3c4d.chunk.js) are cached by
+# browsers for a year without revalidation; everything else is sent with
+# an ETag and must be revalidated.
+#
+# spa_index serves index.html for every client-side route from memory
+# (read and compressed the first time a worker needs it) instead of
+# rendering it as a template per request.
+
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import StaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.template.loader import get_template
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .compression import COMPRESSIBLE, MIN_BYTES, available_encodings, \
+    choose_encoding, compress
+
+# Content hashes as emitted by the React build
+FINGERPRINTED = re.compile(r"\.[0-9a-f]{8,}\.")
+IMMUTABLE = "public, max-age=31536000, immutable"
+SUFFIXES = {"br": ".br", "gzip": ".gz"}
+# Precompressed once, so spend the time on the smallest output
+BEST = {"br": 11, "gzip": 9}
+
+Asset = namedtuple('Asset', ['path', 'content_type', 'variants', 'etag',
+                             'last_modified', 'immutable'])
+
+
+def content_type(name):
+    return mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+
+def precompress(path):
+    # Writes path.gz/path.br where they come out smaller; returns the
+    # encodings written
+    if not content_type(path).startswith(COMPRESSIBLE):
+        return []
+    with open(path, 'rb') as f:
+        content = f.read()
+    if len(content) < MIN_BYTES:
+        return []
+    written = []
+    for encoding in available_encodings():
+        compressed = compress(content, encoding, BEST[encoding])
+        if len(compressed) < len(content):
+            with open(path + SUFFIXES[encoding], 'wb') as f:
+                f.write(compressed)
+            written.append(encoding)
+    return written
+
+
+class CompressedStaticFilesStorage(StaticFilesStorage):
+    """Static files storage that precompresses what collectstatic copies."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            return
+        for name in paths:
+            if name.endswith(tuple(SUFFIXES.values())):
+                continue
+            if precompress(self.path(name)):
+                yield name, name, True
+
+
+class StaticAssets:
+    def __init__(self, root):
+        self.root = root
+        # name -> Asset; static files only change with a deploy (restart)
+        self.assets = {}
+
+    def find(self, name):
+        asset = self.assets.get(name)
+        if asset is None:
+            asset = self.load(name)
+            if asset is not None:
+                self.assets[name] = asset
+        return asset
+
+    def load(self, name):
+        try:
+            path = safe_join(self.root, name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            # Not collected (development): look in the app and build dirs
+            path = finders.find(name)
+            if not path:
+                return None
+        stat = os.stat(path)
+        variants = {encoding: path + suffix
+                    for encoding, suffix in SUFFIXES.items()
+                    if os.path.isfile(path + suffix)}
+        etag = quote_etag(f"{int(stat.st_mtime):x}-{stat.st_size:x}")
+        return Asset(path, content_type(path), variants,
+                     # One tag for every encoding, so a weak one
+                     "W/" + etag if variants else etag, int(stat.st_mtime),
+                     bool(FINGERPRINTED.search(os.path.basename(path))))
+
+    def serve(self, request, name):
+        asset = self.find(name)
+        if asset is None:
+            raise Http404(name)
+        if not asset.immutable:
+            not_modified = get_conditional_response(
+                request, etag=asset.etag, last_modified=asset.last_modified)
+            if not_modified is not None:
+                return self.add_headers(not_modified, asset)
+        encoding = choose_encoding(
+            request.headers.get('Accept-Encoding'),
+            [encoding for encoding in SUFFIXES if encoding in asset.variants])
+        response = FileResponse(
+            open(asset.variants.get(encoding, asset.path), 'rb'),
+            content_type=asset.content_type)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        return self.add_headers(response, asset)
+
+    def add_headers(self, response, asset):
+        if asset.variants:
+            patch_vary_headers(response, ('Accept-Encoding',))
+        if asset.immutable:
+            response.headers['Cache-Control'] = IMMUTABLE
+        else:
+            response.headers['Cache-Control'] = "no-cache"
+            response.headers['ETag'] = asset.etag
+            response.headers['Last-Modified'] = http_date(asset.last_modified)
+        return response
+
+
+class SpaShell:
+    """index.html of the React build, kept in memory in every encoding."""
+
+    def __init__(self, template_name='index.html'):
+        self.template_name = template_name
+        self.variants = None
+        self.etag = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        with self.lock:
+            if self.variants is None:
+                # The file TemplateView would render, found the same way
+                path = get_template(self.template_name).origin.name
+                with open(path, 'rb') as f:
+                    content = f.read()
+                variants = {None: content}
+                if len(content) >= MIN_BYTES:
+                    for encoding in available_encodings():
+                        variants[encoding] = compress(content, encoding,
+                                                      BEST[encoding])
+                self.etag = quote_etag(hashlib.blake2b(
+                    content, digest_size=16).hexdigest())
+                if len(variants) > 1:
+                    self.etag = "W/" + self.etag
+                self.variants = variants
+        return self.variants
+
+    def serve(self, request):
+        variants = self.variants or self.load()
+        response = get_conditional_response(request, etag=self.etag)
+        if response is None:
+            encoding = choose_encoding(
+                request.headers.get('Accept-Encoding'),
+                [encoding for encoding in variants if encoding])
+            response = HttpResponse(variants[encoding],
+                                    content_type="text/html; charset=utf-8")
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        if len(variants) > 1:
+            patch_vary_headers(response, ('Accept-Encoding',))
+        # Always revalidated, so a deploy's new bundle names are picked up
+        response.headers['Cache-Control'] = "no-cache"
+        response.headers['ETag'] = self.etag
+        return response
+
+
+static_assets = StaticAssets(settings.STATIC_ROOT)
+spa_shell = SpaShell()
+
+
+def static_asset(request, path):
+    return static_assets.serve(request, path)
+
+
+def spa_index(request):
+    return spa_shell.serve(request)
@@ -0,0 +1,1765 @@
+# tests.py
+# Tests for the upstream client layer behind the proxy views. The
+# dealership, inventory and sentiment backends are replaced by the local
+# stub servers in benchmarks/stubs.py.
+
+import asyncio
+import gzip
+import importlib.util
+import io
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+from urllib.parse import unquote
+
+import openai
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, TestCase, \
+    override_settings
+from django.urls import resolve
+
+from benchmarks.backends import seed_data
+from benchmarks.stubs import StubServer
+from djangoproj.database import database_config
+from . import async_restapis, async_views, chat, fast_json, http_client, \
+    restapis, views
+from .catalog import CarCatalog, car_catalog
+from .circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, \
+    CircuitOpenError, breakers
+from .compression import choose_encoding
+from .conditional import content_versions
+from .dealer_geo import DealerGeoIndex, dealer_locator, haversine_km
+from .inventory_index import InventorySnapshot, inventory_index
+from .last_known_good import last_known_good, mark_stale
+from .management.commands import benchmark
+from .metrics import Metrics
+from .microservices.json_logging import QueueJsonHandler, request_id
+from .models import CarMake, CarModel, CustomUser
+from .response_cache import ResponseCache, response_cache
+from .sentiment_cache import SentimentCache, sentiment_cache, text_key
+from .single_flight import upstream_gets
+from .static_files import SpaShell, StaticAssets, precompress, static_asset, \
+    spa_index
+from .user_cache import UserCache, user_cache
+
+DEALERS = [{"id": 1, "state": "Texas"}, {"id": 2, "state": "Kansas"}]
+_module_settings = []
+
+
+def setUpModule():
+    # djangoapp's JSON log lines are dropped rather than written among the
+    # test results; assertLogs still sees them
+    logger = logging.getLogger("djangoapp")
+    handlers = logger.handlers[:]
+    logger.handlers = [logging.NullHandler()]
+    _module_settings.append((logger, handlers))
+    # The file based caches (sentiment, sessions, shared) in a scratch
+    # directory instead of the developer's server/.cache
+    cache_dir = tempfile.mkdtemp()
+    test_caches = {
+        alias: {**config, 'LOCATION': os.path.join(cache_dir, alias)}
+        if 'LOCATION' in config else config
+        for alias, config in settings.CACHES.items()}
+    override = override_settings(CACHES=test_caches)
+    override.enable()
+    _module_settings.append((override, cache_dir))
+
+
+def tearDownModule():
+    override, cache_dir = _module_settings.pop()
+    override.disable()
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    logger, handlers = _module_settings.pop()
+    logger.handlers = handlers
+
+
+class HttpClientTests(SimpleTestCase):
+    def setUp(self):
+        self.stub = StubServer({
+            "/busy": lambda method, path, body: (503, {"error": "busy"}),
+            "/slow": DEALERS}).start()
+        self.addCleanup(self.stub.stop)
+        for name, value in (("get_retries", 2), ("retry_backoff", 0)):
+            patcher = mock.patch.object(http_client, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # Sessions read the retry settings when they are built
+        http_client.close_session()
+        self.addCleanup(http_client.close_session)
+
+    def test_only_gets_are_retried(self):
+        self.assertEqual(http_client.get(self.stub.url + "/busy").status_code,
+                         503)
+        self.assertEqual(self.stub.hits, {"/busy": 3})
+        self.assertEqual(http_client.post(self.stub.url + "/busy",
+                                          json={}).status_code, 503)
+        self.assertEqual(self.stub.hits, {"/busy": 4})
+        self.assertIs(http_client.get_session(), http_client.get_session())
+
+    def test_async_gets_are_retried(self):
+        async def run():
+            try:
+                get = await http_client.aget(self.stub.url + "/busy")
+                post = await http_client.apost(self.stub.url + "/busy",
+                                               json={})
+                return get.status_code, post.status_code
+            finally:
+                await http_client.aclose_session()
+
+        self.assertEqual(asyncio.run(run()), (503, 503))
+        self.assertEqual(self.stub.hits, {"/busy": 4})
+
+    def test_configured_timeout_is_used(self):
+        with mock.patch.object(http_client.requests.Session, "request",
+                               return_value="response") as request, \
+                mock.patch.object(http_client, "connect_timeout", 1.5), \
+                mock.patch.object(http_client, "read_timeout", 4):
+            http_client.get(self.stub.url + "/slow")
+        self.assertEqual(request.call_args.kwargs["timeout"], (1.5, 4))
+        self.stub.latency = 0.5
+        with mock.patch.object(http_client, "read_timeout", 0.1), \
+                self.assertRaises(http_client.requests.ReadTimeout):
+            http_client.post(self.stub.url + "/slow")
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        # Slow enough that every client is waiting before the first returns
+        self.stub = StubServer({"/fetchDealers": DEALERS},
+                               latency=0.3).start()
+        self.addCleanup(self.stub.stop)
+        patcher = mock.patch.object(restapis, 'backend_url', self.stub.url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_concurrent_identical_gets_share_one_upstream_call(self):
+        clients = 20
+        barrier = threading.Barrier(clients)
+        results = [None] * clients
+
+        def client(index):
+            barrier.wait()
+            results[index] = restapis.get_request("/fetchDealers")
+
+        threads = [threading.Thread(target=client, args=(i,))
+                   for i in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.stub.hits, {"/fetchDealers": 1})
+        self.assertEqual(results, [DEALERS] * clients)
+        # Every caller gets its own copy to modify
+        self.assertEqual(len({id(result) for result in results}), clients)
+
+    def test_concurrent_identical_async_gets_share_one_upstream_call(self):
+        async def run():
+            try:
+                return await asyncio.gather(
+                    *(async_restapis.get_request("/fetchDealers")
+                      for _ in range(20)))
+            finally:
+                await http_client.aclose_session()
+
+        results = asyncio.run(run())
+        self.assertEqual(self.stub.hits, {"/fetchDealers": 1})
+        self.assertEqual(results, [DEALERS] * 20)
+
+    def test_different_urls_are_not_coalesced(self):
+        restapis.get_request("/fetchDealers")
+        restapis.get_request("/fetchDealers/Texas")
+        self.assertEqual(self.stub.total_hits(), 2)
+
+    def test_waiters_receive_the_upstream_error(self):
+        started = threading.Event()
+        release = threading.Event()
+        errors = []
+
+        def failing_call():
+            started.set()
+            release.wait(5)
+            raise ConnectionError("backend down")
+
+        def call():
+            try:
+                upstream_gets.do("key", failing_call)
+            except ConnectionError as err:
+                errors.append(err)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=call) for _ in range(5)]
+        for thread in followers:
+            thread.start()
+        while upstream_gets.calls["key"].waiters < 5:
+            time.sleep(0.01)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join()
+        self.assertEqual(len(errors), 6)
+
+
+class DealerPageTests(SimpleTestCase):
+    REVIEWS = [{"id": 1, "review": "Great"}, {"id": 2, "review": "Awful"}]
+
+    def setUp(self):
+        self.backend = StubServer({"/fetchDealer/": [{"id": 3}],
+                                   "/fetchReviews/dealer/": self.REVIEWS})
+        self.inventory = StubServer({"/cars/": [{"make": "Audi"}]},
+                                    latency=0.5)
+        for stub, name in ((self.backend, 'backend_url'),
+                           (self.inventory, 'searchcars_url')):
+            stub.start()
+            self.addCleanup(stub.stop)
+            patcher = mock.patch.object(restapis, name, stub.url)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        response_cache.clear()
+        self.addCleanup(response_cache.clear)
+
+    def get_page(self, **timeouts):
+        with mock.patch.dict(views.DEALER_PAGE_TIMEOUTS, timeouts):
+            started = time.monotonic()
+            page = self.client.get("/djangoapp/dealer_page/3").json()
+        return page, time.monotonic() - started
+
+    def test_slow_and_failing_legs_are_left_out(self):
+        with mock.patch.object(views, 'analyze_review_sentiments_batch',
+                               side_effect=RuntimeError("analyzer down")), \
+                self.assertLogs("djangoapp.fanout", "WARNING"):
+            page, elapsed = self.get_page(inventory=0.1)
+        self.assertLess(elapsed, 0.4)
+        self.assertEqual(page["dealer"], [{"id": 3}])
+        self.assertEqual(page["reviews"], [
+            {**review, "sentiment": ""} for review in self.REVIEWS])
+        self.assertEqual(page["cars"], [])
+        self.assertTrue(page["partial"])
+        self.assertEqual(page["errors"], {"sentiments": "error",
+                                          "inventory": "timeout"})
+
+    def test_deadlines_count_from_the_start_of_the_request(self):
+        self.backend.latency = 0.3
+        with mock.patch.object(views, 'analyze_review_sentiments_batch',
+                               side_effect=lambda texts, ids: [
+                                   {"sentiment": "positive"}] * len(texts)):
+            page, elapsed = self.get_page(dealer=0.4, reviews=0.4,
+                                          sentiments=0.4, inventory=0.4)
+            complete, _ = self.get_page(inventory=1)
+        # Every leg was started at once, so none waited for another
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(page["dealer"], [{"id": 3}])
+        self.assertEqual([r["sentiment"] for r in page["reviews"]],
+                         ["positive", "positive"])
+        self.assertEqual(page["errors"], {"inventory": "timeout"})
+        self.assertEqual(complete["cars"], [{"make": "Audi"}])
+        self.assertFalse(complete["partial"])
+
+    def test_backend_error_bodies_are_not_reviews(self):
+        def limited(method, path, body):
+            return 429, {"error": "Too many requests"}
+
+        self.backend.routes.update({"/fetchReviews/": limited,
+                                    "/fetchReviews/dealer/": limited})
+        request = RequestFactory().get("/")
+
+        def call(view, *args):
+            response = view(request, *args)
+            if asyncio.iscoroutine(response):
+                async def run():
+                    try:
+                        return await response
+                    finally:
+                        await http_client.aclose_session()
+
+                response = asyncio.run(run())
+            return json.loads(response.content)
+
+        for module in (views, async_views):
+            with self.subTest(views=module.__name__):
+                self.assertEqual(
+                    call(module.get_dealer_reviews, 3)["status"], 503)
+                self.assertEqual(call(module.get_review, 3)["status"], 400)
+                page = call(module.get_dealer_page, 3)
+                self.assertEqual(page["reviews"], [])
+                self.assertEqual(page["errors"], {"reviews": "unavailable"})
+
+
+class ResponseCacheTests(SimpleTestCase):
+    def setUp(self):
+        clock = FakeClock()
+        patcher = mock.patch('djangoapp.response_cache.time.monotonic', clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.clock = clock
+        # Refreshes are run by the test instead of the thread pool
+        self.refreshes = []
+        patcher = mock.patch('djangoapp.response_cache.executor')
+        patcher.start().submit.side_effect = \
+            lambda *call: self.refreshes.append(call)
+        self.addCleanup(patcher.stop)
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        self.versions = iter(range(1, 100))
+        self.down = False
+
+    def new_cache(self, shared_alias='default'):
+        return ResponseCache({"dealers": (10, 20)}, shared_alias)
+
+    def fetch(self):
+        if self.down:
+            return {"error": "down"}
+        return {"version": next(self.versions)}
+
+    def get(self, cache):
+        return cache.get_or_fetch("dealers", "/fetchDealers",
+                                  self.fetch)["version"]
+
+    def run_refreshes(self):
+        for func, *args in self.refreshes:
+            func(*args)
+        self.refreshes.clear()
+
+    def test_entries_expire(self):
+        cache = self.new_cache()
+        self.assertEqual(self.get(cache), 1)
+        self.clock.now = 9
+        self.assertEqual(self.get(cache), 1)
+        self.clock.now = 31
+        self.assertEqual(self.get(cache), 2)
+        self.down = True
+        self.assertEqual(cache.get_or_fetch("dealers", "/other", self.fetch),
+                         {"error": "down"})
+        stats = cache.stats()
+        # Errors are not cached
+        self.assertEqual((stats["hits"], stats["misses"], stats["size"]),
+                         (1, 3, 1))
+
+    def test_stale_copies_are_served_while_refreshing(self):
+        cache = self.new_cache()
+        self.get(cache)
+        self.clock.now = 15
+        self.assertEqual([self.get(cache) for _ in range(3)], [1, 1, 1])
+        self.assertEqual(len(self.refreshes), 1)
+        self.run_refreshes()
+        self.assertEqual(self.get(cache), 2)
+        self.assertEqual(cache.stats()["stale_hits"], 3)
+
+        self.clock.now = 30
+        self.down = True
+        self.get(cache)
+        self.run_refreshes()
+        # A failed refresh keeps the stale copy
+        self.assertEqual(self.get(cache), 2)
+        self.assertEqual(cache.stats()["refresh_errors"], 1)
+
+    def test_invalidation_reaches_every_worker(self):
+        workers = [self.new_cache(), self.new_cache()]
+        self.assertEqual([self.get(worker) for worker in workers], [1, 2])
+        workers[0].invalidate("dealers")
+        # The other worker checks the shared generation once a second
+        self.assertEqual([self.get(worker) for worker in workers], [3, 2])
+        self.clock.now = 1
+        self.assertEqual([self.get(worker) for worker in workers], [3, 4])
+
+    def test_shared_generation_is_read_once_per_interval(self):
+        cache = self.new_cache()
+        with mock.patch.object(caches['default'], 'get',
+                               wraps=caches['default'].get) as get:
+            for now in (0, 0.5, 0.9, 1.0, 1.5):
+                self.clock.now = now
+                self.get(cache)
+        self.assertEqual(get.call_count, 2)
+
+    def test_async_refreshes_are_kept_until_done(self):
+        cache = self.new_cache()
+
+        async def fetch():
+            await asyncio.sleep(0)
+            return self.fetch()
+
+        async def scenario():
+            await cache.aget_or_fetch("dealers", "/fetchDealers", fetch)
+            self.clock.now = 15
+            await cache.aget_or_fetch("dealers", "/fetchDealers", fetch)
+            self.assertEqual(len(cache.tasks), 1)
+            await asyncio.gather(*cache.tasks)
+            return (await cache.aget_or_fetch("dealers", "/fetchDealers",
+                                              fetch))["version"]
+
+        self.assertEqual(asyncio.run(scenario()), 2)
+        self.assertEqual((cache.tasks, cache.refreshing), (set(), set()))
+
+    def test_inflight_refreshes_are_dropped_by_invalidation(self):
+        for alias in ('default', None):
+            with self.subTest(shared_alias=alias):
+                cache = self.new_cache(alias)
+                self.clock.now = 0
+                before = self.get(cache)
+                self.clock.now = 15
+                self.get(cache)
+                # The dealer is edited while the refresh is in flight
+                cache.invalidate("dealers")
+                self.run_refreshes()
+                self.assertEqual(self.get(cache), before + 2)
+
+
+class FakeChatClient:
+    """Stands in for OpenAIChatClient with a canned token stream."""
+
+    def __init__(self, tokens, error=None):
+        self.tokens = tokens
+        self.error = error
+        self.prompts = []
+
+    def complete(self, messages):
+        self.prompts.append(messages)
+        return "".join(self.tokens)
+
+    def stream(self, messages):
+        self.prompts.append(messages)
+        yield from self.tokens
+        if self.error is not None:
+            raise self.error
+
+    async def acomplete(self, messages):
+        return self.complete(messages)
+
+    async def astream(self, messages):
+        for token in self.stream(messages):
+            yield token
+
+
+def use_fake_chat(test, client, context_text=""):
+    chat.set_chat_client(client)
+    test.addCleanup(chat.set_chat_client, None)
+    chat.chat_answers.clear()
+    test.addCleanup(chat.chat_answers.clear)
+    patcher = mock.patch.object(chat.chat_context, 'build',
+                                lambda: context_text)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+    chat.chat_context.clear()
+    test.addCleanup(chat.chat_context.clear)
+
+
+def parse_events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines.get("event"), json.loads(lines["data"])))
+    return events
+
+
+class ChatStreamTests(SimpleTestCase):
+    def setUp(self):
+        use_fake_chat(self, FakeChatClient(["Hel", "lo", "!"]))
+
+    def post(self, body):
+        return self.client.post("/djangoapp/chat/", json.dumps(body),
+                                content_type="application/json")
+
+    def test_stream_relays_tokens_then_done(self):
+        response = self.post({"userMessage": "hi", "stream": True})
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual(response["Cache-Control"], "no-cache")
+        body = b"".join(response.streaming_content).decode()
+        self.assertEqual(parse_events(body),
+                         [(None, {"token": "Hel"}), (None, {"token": "lo"}),
+                          (None, {"token": "!"}), ("done", {})])
+
+    def test_stream_reports_model_errors(self):
+        use_fake_chat(self, FakeChatClient(
+            ["Hel"], error=openai.OpenAIError("boom")))
+        response = self.post({"userMessage": "hi", "stream": True})
+        body = b"".join(response.streaming_content).decode()
+        self.assertEqual([event for event, _ in parse_events(body)],
+                         [None, "error", "done"])
+
+    def test_without_stream_returns_whole_reply(self):
+        response = self.post({"userMessage": "hi"})
+        self.assertEqual(response.json(), {"response": "Hello!"})
+
+    def test_async_view_streams_tokens(self):
+        async def run():
+            response = await async_views.chat_view(
+                mock.Mock(method="POST", headers={},
+                          body=json.dumps({"userMessage": "hi",
+                                           "stream": True})))
+            return "".join([chunk.decode() async for chunk
+                            in response.streaming_content])
+
+        body = asyncio.run(run())
+        self.assertEqual(parse_events(body)[-1], ("done", {}))
+        self.assertEqual(len(parse_events(body)), 4)
+
+
+CARS = [
+    {"make": "Audi", "model": "A4", "bodyType": "Sedan", "price": 70000},
+    {"make": "Audi", "model": "Q5", "bodyType": "SUV", "price": 50000},
+    {"make": "Audi", "model": "Q7", "bodyType": "SUV", "price": 65000},
+]
+MAKES_MODELS = [{"make": "Audi", "models": ["Q7", "A4", "Q5"]}]
+
+
+class ChatAnswerCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.model = FakeChatClient(["Two dealers."])
+        use_fake_chat(self, self.model, context_text="Dealerships: ...")
+
+    def ask(self, question, **extra):
+        return self.client.post(
+            "/djangoapp/chat/", json.dumps({"userMessage": question,
+                                            **extra}),
+            content_type="application/json")
+
+    def test_normalized_repeats_are_answered_from_cache(self):
+        first = self.ask("Which dealers are in Texas?")
+        second = self.ask("  which dealers are in   TEXAS ")
+        self.assertEqual(first.json(), {"response": "Two dealers."})
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(len(self.model.prompts), 1)
+        self.assertEqual(chat.chat_answers.stats()["hits"], 1)
+
+    def test_streamed_answer_is_cached_for_later_requests(self):
+        response = self.ask("Cheapest SUV?", stream=True)
+        b"".join(response.streaming_content)
+        self.assertEqual(self.ask("cheapest suv").json(),
+                         {"response": "Two dealers."})
+        self.assertEqual(len(self.model.prompts), 1)
+
+    def test_failed_stream_is_not_cached(self):
+        use_fake_chat(self, FakeChatClient(
+            ["Two"], error=openai.OpenAIError("boom")))
+        response = self.ask("Cheapest SUV?", stream=True)
+        b"".join(response.streaming_content)
+        self.assertEqual(chat.chat_answers.stats()["size"], 0)
+
+    def test_context_is_built_once_and_sent_as_system_prompt(self):
+        with mock.patch.object(chat.chat_context, 'build',
+                               return_value="Dealerships: ...") as build:
+            chat.chat_context.clear()
+            self.ask("first question")
+            self.ask("second question")
+        self.assertEqual(build.call_count, 1)
+        system = self.model.prompts[0][0]["content"]
+        self.assertTrue(system.endswith("\n\nDealerships: ..."))
+
+
+class ChatContextTests(SimpleTestCase):
+    def test_build_context_summarizes_upstream_data(self):
+        dealer = {"id": 1, "full_name": "Holdlamis", "city": "El Paso",
+                  "st": "TX"}
+        stub = StubServer({"/fetchDealers": [dealer],
+                           "/makes_models/": MAKES_MODELS,
+                           "/inventory/": {"cars": CARS}}).start()
+        self.addCleanup(stub.stop)
+        for name, url in (('backend_url', stub.url),
+                          ('searchcars_url', stub.url)):
+            patcher = mock.patch.object(restapis, name, url)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        response_cache.clear()
+        self.addCleanup(response_cache.clear)
+
+        self.assertEqual(chat.build_context().split("\n"), [
+            "Dealerships (id: name, city, state): 1: Holdlamis, El Paso, TX",
+            "Makes and models: Audi (A4, Q5, Q7)",
+            "Price ranges by make and body type: "
+            "Audi SUV $50,000-$65,000 (2 cars); "
+            "Audi Sedan $70,000-$70,000 (1 cars)",
+        ])
+
+    def test_stale_snapshot_is_served_while_refreshing(self):
+        texts = iter(["v1", "v2"])
+        clock = FakeClock()
+        context = chat.ChatContext(lambda: next(texts), ttl=60, retry=60)
+        with mock.patch('djangoapp.chat.time.monotonic', clock), \
+                mock.patch.object(chat, 'executor') as executor:
+            first = context.get()
+            clock.now = 59
+            self.assertEqual(context.get(), first)
+            executor.submit.assert_not_called()
+            clock.now = 60
+            self.assertEqual(context.get(), first)
+            self.assertEqual(context.get(), first)
+            # One background refresh no matter how many requests saw it
+            # stale
+            executor.submit.assert_called_once_with(context._refresh)
+            context._refresh()
+            self.assertEqual(context.get().text, "v2")
+            self.assertNotEqual(context.get().version, first.version)
+            executor.submit.assert_called_once()
+
+
+class CarCatalogTests(TestCase):
+    def setUp(self):
+        call_command("seed_cars", stdout=open(os.devnull, "w"))
+        # The catalog outlives each test's rolled back transaction
+        car_catalog.invalidate()
+
+    def test_seeding_is_idempotent(self):
+        call_command("seed_cars", stdout=open(os.devnull, "w"))
+        self.assertEqual(CarMake.objects.count(), 5)
+        self.assertEqual(CarModel.objects.count(), 15)
+
+    def test_get_cars_is_served_without_queries(self):
+        self.client.get("/djangoapp/get_cars")
+        with self.assertNumQueries(0):
+            response = self.client.get("/djangoapp/get_cars")
+        self.assertEqual(len(response.json()["CarModels"]), 15)
+
+    def test_model_edits_refresh_the_catalog(self):
+        self.client.get("/djangoapp/get_cars")
+        make = CarMake.objects.get(name="Kia")
+        CarModel.objects.create(car_make=make, name="Sportage")
+        cars = self.client.get("/djangoapp/get_cars").json()["CarModels"]
+        self.assertIn({"CarModel": "Sportage", "CarMake": "Kia"}, cars)
+        make.delete()
+        cars = self.client.get("/djangoapp/get_cars").json()["CarModels"]
+        self.assertNotIn("Kia", {car["CarMake"] for car in cars})
+
+    def test_edits_reach_other_workers(self):
+        self.assertEqual(car_catalog.shared_alias, "shared")
+        clock = FakeClock()
+        with mock.patch('djangoapp.response_cache.time.monotonic', clock):
+            # Another worker's catalog, sharing only the cache with this one
+            worker = CarCatalog(shared_alias=car_catalog.shared_alias)
+            self.assertEqual(len(worker.get()), 15)
+            CarModel.objects.create(
+                car_make=CarMake.objects.get(name="Kia"), name="Sportage")
+            # It checks the shared version once a second
+            self.assertEqual(len(worker.get()), 15)
+            clock.now = 1
+            self.assertIn({"CarModel": "Sportage", "CarMake": "Kia"},
+                          worker.get())
+        self.assertEqual(worker.builds, 2)
+
+
+REVIEWS_JSON = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'database', 'data', 'reviews.json')
+MICROSERVICES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 'microservices')
+SENTIMENT_SERVICE_DEPS = all(importlib.util.find_spec(name)
+                             for name in ("flask", "nltk"))
+_sentiment_app = None
+
+
+def sentiment_app():
+    # microservices/app.py loaded the way its image runs it (its directory
+    # on sys.path), scoring in-process, without keeping its log handler
+    global _sentiment_app
+    if _sentiment_app is None:
+        root = logging.getLogger()
+        handlers, level = list(root.handlers), root.level
+        spec = importlib.util.spec_from_file_location(
+            "sentiment_app", os.path.join(MICROSERVICES_DIR, 'app.py'))
+        module = importlib.util.module_from_spec(spec)
+        with mock.patch.dict(os.environ, {"SENTIMENT_WORKERS": "1"}), \
+                mock.patch.object(sys, 'path',
+                                  [MICROSERVICES_DIR] + sys.path):
+            spec.loader.exec_module(module)
+        for handler in set(root.handlers) - set(handlers):
+            root.removeHandler(handler)
+            handler.close()
+        root.setLevel(level)
+        _sentiment_app = module
+    return _sentiment_app
+
+
+def scored(text):
+    # Stand-in analyzer result that shows which text was scored
+    return {"sentiment": "positive" if "good" in text else "negative",
+            "scores": {"text": text}}
+
+
+class SentimentCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.shared = caches['default']
+        self.shared.clear()
+        self.addCleanup(self.shared.clear)
+        self.cache = SentimentCache(maxsize=2, shared_alias='default')
+
+    def test_counters(self):
+        self.assertIsNone(self.cache.get("great car"))
+        self.cache.set("great car", {"sentiment": "positive"})
+        self.assertEqual(self.cache.get(" great  car "),
+                         {"sentiment": "positive"})
+        self.cache.set("bad car", {"sentiment": "negative"})
+        self.cache.set("ok car", {"sentiment": "neutral"})
+        # Evicted locally, still in the shared store
+        self.assertEqual(self.cache.get("great car"),
+                         {"sentiment": "positive"})
+        self.assertEqual(self.cache.stats(), {
+            "hits": 1, "shared_hits": 1, "misses": 1, "invalidations": 0,
+            "evictions": 2, "size": 2, "maxsize": 2})
+
+    def test_reviews_are_written_once_per_text(self):
+        with mock.patch.object(self.shared, 'set',
+                               wraps=self.shared.set) as shared_set:
+            for _ in range(3):
+                self.cache.remember_review(7, "great car")
+            SentimentCache(shared_alias='default').remember_review(
+                7, "great car")
+            self.assertEqual(shared_set.call_count, 1)
+            self.cache.remember_review(7, "great car, edited")
+            self.assertEqual(shared_set.call_count, 2)
+
+    def test_edited_reviews_are_rescored(self):
+        self.cache.remember_review(7, "great car")
+        self.cache.set("great car", {"sentiment": "positive"})
+        self.cache.set("other car", {"sentiment": "positive"})
+        stub = StubServer({"/edit_review/": {"id": 7}}).start()
+        self.addCleanup(stub.stop)
+        with mock.patch.object(restapis, 'backend_url', stub.url), \
+                mock.patch.object(restapis, 'sentiment_cache', self.cache):
+            restapis.put_review({"purchase": True}, 7)
+            self.assertIsNotNone(self.cache.get("great car"))
+            restapis.put_review({"review": "terrible car"}, 7)
+        self.assertIsNone(self.cache.get("great car"))
+        self.assertIsNotNone(self.cache.get("other car"))
+        self.assertEqual(self.cache.stats()["invalidations"], 1)
+        # Another worker finds the review's text through the shared store
+        other = SentimentCache(shared_alias='default')
+        other.remember_review(8, "fine car")
+        other.set("fine car", {"sentiment": "neutral"})
+        self.assertTrue(self.cache.invalidate_review(8))
+        self.assertIsNone(self.shared.get(text_key("fine car")))
+
+
+class SentimentBatchTests(SimpleTestCase):
+    TEXTS = ["good car", "bad service", "good car", "good price"]
+
+    def setUp(self):
+        self.bodies = []
+        for patcher in (mock.patch.object(restapis, 'sentiment_engine',
+                                          'remote'),
+                        mock.patch.object(sentiment_cache, 'shared_alias',
+                                          None)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        sentiment_cache.clear()
+        self.addCleanup(sentiment_cache.clear)
+
+    def serve(self, routes):
+        stub = StubServer(routes).start()
+        self.addCleanup(stub.stop)
+        patcher = mock.patch.object(restapis, 'sentiment_analyzer_url',
+                                    stub.url + "/")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return stub
+
+    def analyze_batch(self, method, path, body):
+        texts = json.loads(body)["texts"]
+        self.bodies.append(texts)
+        return 200, {"sentiments": [scored(text) for text in texts]}
+
+    def analyze(self, method, path, body):
+        return 200, scored(unquote(path[len("/analyze/"):]))
+
+    def test_repeated_texts_are_scored_once_in_order(self):
+        self.serve({"/analyze_batch": self.analyze_batch})
+        results = restapis.analyze_review_sentiments_batch(self.TEXTS)
+        self.assertEqual(self.bodies, [["good car", "bad service",
+                                        "good price"]])
+        self.assertEqual([result["scores"]["text"] for result in results],
+                         self.TEXTS)
+        # Cached texts are not sent again
+        restapis.analyze_review_sentiments_batch(["good price", "new one"])
+        self.assertEqual(self.bodies[1], ["new one"])
+
+    def test_older_services_are_asked_text_by_text(self):
+        for status in (404, 405):
+            sentiment_cache.clear()
+            stub = self.serve({
+                "/analyze_batch": lambda method, path, body, status=status: (
+                    status, {"error": "no such route"}),
+                "/analyze/": self.analyze})
+            results = restapis.analyze_review_sentiments_batch(self.TEXTS)
+            with self.subTest(status=status):
+                self.assertEqual([r["scores"]["text"] for r in results],
+                                 self.TEXTS)
+                self.assertEqual(stub.hits, {"/analyze_batch": 1,
+                                             "/analyze/good%20car": 1,
+                                             "/analyze/bad%20service": 1,
+                                             "/analyze/good%20price": 1})
+
+    def test_failed_batches_leave_results_empty(self):
+        self.serve({"/analyze_batch": lambda method, path, body: (
+            500, {"error": "down"})})
+        with self.assertLogs("djangoapp.restapis", "WARNING"):
+            results = restapis.analyze_review_sentiments_batch(self.TEXTS)
+        self.assertEqual(results, [None] * 4)
+
+    def test_async_batches_keep_blocking_work_off_the_event_loop(self):
+        self.serve({"/analyze_batch": self.analyze_batch})
+        threads = []
+
+        def record(func):
+            def wrapper(*args):
+                threads.append(threading.current_thread())
+                return func(*args)
+            return wrapper
+
+        engine = mock.Mock()
+        engine.score_chunk = record(lambda texts: [scored(text)
+                                                   for text in texts])
+
+        async def run():
+            try:
+                remote = await async_restapis.analyze_review_sentiments_batch(
+                    self.TEXTS, [1, 2, 3, 4])
+                restapis.sentiment_engine = "local"
+                local = await async_restapis.analyze_review_sentiments_batch(
+                    ["good lot"])
+                return remote, local
+            finally:
+                await http_client.aclose_session()
+
+        with mock.patch.object(restapis, 'split_cached_sentiments',
+                               record(restapis.split_cached_sentiments)), \
+                mock.patch.object(restapis, 'merge_scored_sentiments',
+                                  record(restapis.merge_scored_sentiments)), \
+                mock.patch.object(restapis, 'local_sentiment_engine',
+                                  return_value=engine):
+            remote, local = asyncio.run(run())
+        self.assertEqual([r["scores"]["text"] for r in remote], self.TEXTS)
+        self.assertEqual(local[0]["sentiment"], "positive")
+        # split + merge for each batch, and the local scoring
+        self.assertEqual(len(threads), 5)
+        self.assertNotIn(threading.current_thread(), threads)
+
+    @unittest.skipUnless(importlib.util.find_spec("nltk"),
+                         "nltk is not installed")
+    def test_throughput_counts_concurrent_batches_once(self):
+        from .microservices import engine
+
+        def slow_chunk(texts):
+            time.sleep(0.2)
+            return [None] * len(texts)
+
+        scoring = engine.ScoringEngine(workers=1)
+        with mock.patch.object(engine, 'score_chunk', slow_chunk):
+            threads = [threading.Thread(target=scoring.score_batch,
+                                        args=(["text"] * 10,))
+                       for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        stats = scoring.stats()
+        self.assertEqual((stats["texts"], stats["batches"]), (40, 4))
+        # About 0.2s for all four batches, not 0.8s
+        self.assertLess(stats["busy_seconds"], 0.5)
+        self.assertGreater(stats["texts_per_sec"], 80)
+
+    @unittest.skipUnless(SENTIMENT_SERVICE_DEPS,
+                         "flask or nltk is not installed")
+    def test_service_batch_endpoint(self):
+        client = sentiment_app().app.test_client()
+        texts = ["I love this dealer", "Terrible, rude staff",
+                 "I love this dealer", 42]
+        response = client.post("/analyze_batch", json={"texts": texts})
+        sentiments = response.get_json()["sentiments"]
+        self.assertEqual([result["sentiment"] for result in sentiments],
+                         ["positive", "negative", "positive", "neutral"])
+        self.assertEqual(sentiments[0], sentiments[2])
+        self.assertEqual(client.post("/analyze_batch",
+                                     json={"text": "x"}).status_code, 400)
+
+
+class SentimentEngineTests(SimpleTestCase):
+    def use_engine(self, name):
+        patcher = mock.patch.object(restapis, 'sentiment_engine', name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_local_engine_scores_batches_without_http(self):
+        engine = mock.Mock()
+        engine.score_chunk.side_effect = lambda texts: [
+            {"sentiment": "neutral", "scores": {}} for _ in texts]
+        self.use_engine("local")
+        with mock.patch.object(restapis, 'local_sentiment_engine',
+                               return_value=engine), \
+                mock.patch.object(sentiment_cache, 'shared_alias', None), \
+                mock.patch.object(restapis.http_client, 'post') as post:
+            sentiment_cache.clear()
+            self.addCleanup(sentiment_cache.clear)
+            results = restapis.analyze_review_sentiments_batch(
+                ["fine car", "ok service"])
+        post.assert_not_called()
+        self.assertEqual([r["sentiment"] for r in results],
+                         ["neutral", "neutral"])
+
+    @unittest.skipUnless(SENTIMENT_SERVICE_DEPS,
+                         "flask or nltk is not installed")
+    def test_local_and_remote_engines_agree_on_reviews(self):
+        service = sentiment_app().app.test_client()
+
+        def analyze(method, path, body):
+            # The request line as it reached the stub, routed and decoded
+            # by microservices/app.py
+            response = service.open(path, method=method)
+            return response.status_code, response.data, response.content_type
+
+        with open(REVIEWS_JSON) as f:
+            texts = [review['review'] for review in json.load(f)['reviews']]
+        # Characters that have to survive quoting, decoding and routing
+        texts += ["50% off? Great / fair deal #1", "/slow//service/",
+                  "caf\u00e9 & service: ok", "+1 :) no complaints"]
+        with StubServer({"/analyze/": analyze}) as stub, \
+                mock.patch.object(restapis, 'sentiment_analyzer_url',
+                                  stub.url + "/"):
+            self.use_engine("remote")
+            remote = [restapis._fetch_sentiment(text)["sentiment"]
+                      for text in texts]
+        self.use_engine("local")
+        local = [restapis._fetch_sentiment(text)["sentiment"]
+                 for text in texts]
+        self.assertEqual(local, remote)
+
+
+CAR_RECORDS_JSON = os.path.join(os.path.dirname(REVIEWS_JSON),
+                                os.pardir, os.pardir, 'carsInventory',
+                                'data', 'car_records.json')
+
+
+def load_inventory():
+    # Documents as the carsInventory service returns them
+    with open(CAR_RECORDS_JSON) as f:
+        cars = json.load(f)['cars']
+    return [{"_id": f"{index:024x}", **car, "__v": 0}
+            for index, car in enumerate(cars)]
+
+
+def service_inventory(cars, params):
+    # GET /inventory/ from carsInventory/app.js, written out directly
+    def wanted(car):
+        if params.get('make') and car['make'] != params['make']:
+            return False
+        if params.get('model') and car['model'] != params['model']:
+            return False
+        if params.get('year') and car['year'] < int(params['year']):
+            return False
+        for field in ('mileage', 'price'):
+            low = params.get(field + 'Min')
+            high = params.get(field + 'Max')
+            if low and high and not int(low) <= car[field] <= int(high):
+                return False
+        return True
+
+    matches = [car for car in cars if wanted(car)]
+    page, limit = int(params['page']), int(params['limit'])
+    return {"status": 200,
+            "cars": matches[(page - 1) * limit:page * limit],
+            "totalCars": len(matches),
+            "totalPages": -(-len(matches) // limit),
+            "currentPage": page}
+
+
+class InventoryIndexTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.cars = load_inventory()
+        cls.snapshot = InventorySnapshot(cls.cars)
+
+    def test_inventory_matches_the_service(self):
+        queries = [
+            {},
+            {"page": "3", "per_page": "7"},
+            {"make": "Audi"},
+            {"make": "Audi", "model": "A4", "year": "2020"},
+            {"mileageMin": "10000", "mileageMax": "40000", "page": "2"},
+            {"priceMin": "20000", "priceMax": "45000", "year": "2019"},
+            {"priceMin": "20000"},
+            {"make": "Tesla"},
+            {"page": "100"},
+        ]
+        for query in queries:
+            params = views.inventory_params(query)
+            with self.subTest(query=query):
+                self.assertEqual(self.snapshot.inventory(params),
+                                 service_inventory(self.cars, params))
+
+    def test_dealer_cars_follow_the_service_routes(self):
+        dealer = [car for car in self.cars if car['dealer_id'] == 1]
+        self.assertEqual(self.snapshot.dealer_cars(1, {}), dealer)
+        self.assertEqual(self.snapshot.dealer_cars(1, {"price": "30000"}),
+                         [car for car in dealer
+                          if 20000 < car['price'] <= 30000])
+        self.assertEqual(self.snapshot.dealer_cars(1, {"mileage": "x"}),
+                         [car for car in dealer if car['mileage'] > 200000])
+        self.assertIn("error", self.snapshot.dealer_cars(1, {"year": "x"}))
+
+    def test_sort_orders(self):
+        params = views.inventory_params({"sort": "-price", "per_page": "5"})
+        prices = [car['price']
+                  for car in self.snapshot.inventory(params)['cars']]
+        self.assertEqual(prices, sorted((car['price'] for car in self.cars),
+                                        reverse=True)[:5])
+
+    def walk(self, snapshot, query):
+        cars, cursor = [], ""
+        while cursor is not None:
+            page = snapshot.keyset_page(views.inventory_params(query),
+                                        cursor)
+            cars += page["cars"]
+            cursor = page["nextCursor"]
+        return cars, page["total"]
+
+    def test_cursor_pages_walk_the_stable_sort_order(self):
+        for sort in ("price", "-mileage", "year"):
+            field = sort.lstrip("-")
+            # Ties in _id order, which load_inventory() makes insertion
+            # order; sorted() is stable and keeps it too
+            expected = sorted(
+                [car for car in self.cars if car['year'] >= 2020],
+                key=lambda car: -car[field] if sort[0] == "-" else car[field])
+            for per_page in ("1", "7", "500"):
+                with self.subTest(sort=sort, per_page=per_page):
+                    cars, total = self.walk(self.snapshot, {
+                        "sort": sort, "per_page": per_page, "year": "2020"})
+                    self.assertEqual(total, len(expected))
+                    self.assertEqual(cars, expected)
+
+    def test_cursor_survives_a_snapshot_refresh(self):
+        def order(car):
+            return car["price"], car["_id"]
+
+        ordered = sorted(self.cars, key=order)
+        # End the first page inside a run of equal prices
+        split = next(index for index in range(1, len(ordered))
+                     if ordered[index]["price"] ==
+                     ordered[index - 1]["price"])
+        params = views.inventory_params({"per_page": str(split)})
+        first = self.snapshot.keyset_page(params)
+        self.assertEqual(first["cars"], ordered[:split])
+        # Another worker's rebuild: the cursor's car was sold, the rest
+        # arrive in a different order and one car is new
+        cars = [car for car in self.cars if car != ordered[split - 1]]
+        random.Random(3).shuffle(cars)
+        cars.append({**ordered[split], "_id": "f" * 24})
+        refreshed = InventorySnapshot(cars)
+        self.assertNotEqual(refreshed.version, self.snapshot.version)
+        self.assertEqual(InventorySnapshot(list(self.cars)).version,
+                         self.snapshot.version)
+        second = refreshed.keyset_page(params, first["nextCursor"])
+        self.assertEqual(second["cars"], [
+            car for car in sorted(cars, key=order)
+            if order(car) > order(ordered[split - 1])][:split])
+
+    def test_cursor_of_the_wrong_shape_is_a_bad_request(self):
+        cursors = [views.encode_cursor(7), views.encode_cursor(["price"]),
+                   views.encode_cursor(["price", "10", "a"]),
+                   views.encode_cursor({"page": 2})]
+        for snapshot in (self.snapshot, None):
+            for cursor in cursors:
+                with self.subTest(cursor=cursor, index=bool(snapshot)), \
+                        mock.patch.object(views, 'current_snapshot',
+                                          return_value=snapshot):
+                    response = self.client.get("/djangoapp/full_inventory",
+                                               {"cursor": cursor}).json()
+                    self.assertEqual(response["status"], 400)
+
+    def test_full_inventory_cursor_mode_without_the_index(self):
+        pages = iter([2, 3])
+
+        def inventory(method, path, body):
+            return 200, {"cars": [], "totalCars": 25, "totalPages": 3,
+                         "currentPage": next(pages)}
+
+        stub = StubServer({"/inventory/": inventory}).start()
+        self.addCleanup(stub.stop)
+        with mock.patch.object(restapis, 'searchcars_url', stub.url), \
+                mock.patch.object(views, 'current_snapshot',
+                                  return_value=None):
+            second = self.client.get("/djangoapp/full_inventory", {
+                "cursor": views.encode_cursor(["page", 2])}).json()
+            third = self.client.get("/djangoapp/full_inventory", {
+                "cursor": second["nextCursor"]}).json()
+            bad = self.client.get("/djangoapp/full_inventory",
+                                  {"cursor": "not a cursor"}).json()
+        self.assertEqual(second["total"], 25)
+        self.assertIsNone(third["nextCursor"])
+        self.assertEqual(bad["status"], 400)
+
+    def test_facets_count_each_choice_without_its_own_filter(self):
+        query = {"make": "Audi", "year": "2021",
+                 "priceMin": "0", "priceMax": "60000"}
+        facets = self.snapshot.facets(views.inventory_params(query))
+
+        def count(drop=(), **change):
+            params = {k: v for k, v in {**query, **change}.items()
+                      if k not in drop}
+            return service_inventory(self.cars, views.inventory_params(
+                params))["totalCars"]
+
+        self.assertEqual(facets["total"], count())
+        self.assertEqual(facets["facets"]["make"]["Audi"], count())
+        self.assertEqual(facets["facets"]["make"]["Kia"], count(make="Kia"))
+        self.assertEqual(sum(facets["facets"]["make"].values()),
+                         count(drop=("make",)))
+        self.assertEqual(facets["facets"]["year"]["2022"],
+                         count(year="2022") - count(year="2023"))
+        price = facets["facets"]["price"]
+        self.assertEqual([bucket["atMost"] for bucket in price],
+                         [20000, 40000, 60000, 80000, None])
+        self.assertEqual(sum(bucket["count"] for bucket in price),
+                         count(drop=("priceMin", "priceMax")))
+        over = [car for car in self.cars if car['make'] == "Audi"
+                and car['year'] >= 2021 and car['price'] > 80000]
+        self.assertEqual(price[-1]["count"], len(over))
+
+    def test_full_inventory_is_served_from_the_index(self):
+        stub = StubServer({"/inventory/": {"cars": self.cars}}).start()
+        self.addCleanup(stub.stop)
+        patcher = mock.patch.object(restapis, 'searchcars_url', stub.url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        inventory_index.clear()
+        self.addCleanup(inventory_index.clear)
+
+        for page in ("1", "2"):
+            response = self.client.get("/djangoapp/full_inventory",
+                                       {"make": "Kia", "page": page})
+            self.assertEqual(response.json()["total"], len(
+                [car for car in self.cars if car['make'] == "Kia"]))
+        self.assertEqual(stub.total_hits(), 1)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker("test", failure_rate=0.5, slow_call=1,
+                                      window=4, min_calls=4,
+                                      open_seconds=10, clock=self.clock)
+
+    def call(self, status=200, elapsed=0.0):
+        def fn():
+            self.clock.now += elapsed
+            return mock.Mock(status_code=status)
+        return self.breaker.call(fn)
+
+    def test_opens_at_failure_rate_and_fails_fast(self):
+        self.call()
+        self.call()
+        self.call(status=503)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.call(status=500)
+        self.assertEqual(self.breaker.state, OPEN)
+
+        fn = mock.Mock()
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.call(fn)
+        fn.assert_not_called()
+        self.assertEqual(self.breaker.stats()["rejected"], 1)
+
+    def test_slow_calls_count_as_failures(self):
+        for _ in range(4):
+            self.call(elapsed=2)
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_half_open_probe_closes_or_reopens(self):
+        for _ in range(4):
+            self.call(status=500)
+        self.clock.now += 10
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        # Only one probe at a time
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record(True)
+        self.assertEqual(self.breaker.state, OPEN)
+
+        self.clock.now += 10
+        self.call()
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(self.breaker.stats()["transitions"],
+                         {"closed->open": 1, "open->half_open": 2,
+                          "half_open->open": 1, "half_open->closed": 1})
+
+
+class LastKnownGoodTests(SimpleTestCase):
+    def setUp(self):
+        self.failing = False
+        reviews = [{"id": 7, "review": "Great service"}]
+
+        def fetch_reviews(method, path, body):
+            if self.failing:
+                return 500, {"error": "down"}
+            return 200, reviews
+
+        self.stub = StubServer({"/fetchReviews/dealer/": fetch_reviews})
+        self.stub.start()
+        self.addCleanup(self.stub.stop)
+        for patcher in (
+                mock.patch.object(restapis, 'backend_url', self.stub.url),
+                mock.patch.dict(breakers, {"backend": CircuitBreaker(
+                    "backend", failure_rate=1.0, window=2, min_calls=2,
+                    open_seconds=60)}),
+                mock.patch.object(views, 'analyze_review_sentiments_batch',
+                                  side_effect=lambda texts, ids: [
+                                      {"sentiment": "positive"}]),
+                mock.patch.object(async_views,
+                                  'analyze_review_sentiments_batch',
+                                  side_effect=mock.AsyncMock(return_value=[
+                                      {"sentiment": "positive"}]))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        last_known_good.clear()
+        self.addCleanup(last_known_good.clear)
+
+    def test_failing_upstream_is_served_stale_then_fails_fast(self):
+        url = "/djangoapp/reviews/dealer/1"
+        served = last_known_good.stats()["served"]
+        fresh = self.client.get(url)
+        self.assertNotIn('X-Stale-Upstreams', fresh)
+        self.assertNotIn("stale", fresh.json())
+
+        self.failing = True
+        for _ in range(3):
+            stale = self.client.get(url)
+            self.assertEqual(stale['X-Stale-Upstreams'], "backend")
+            self.assertEqual(stale.json()["staleUpstreams"], ["backend"])
+            self.assertEqual(stale.json()["reviews"],
+                             fresh.json()["reviews"])
+        # The third call was rejected by the open breaker
+        self.assertEqual(self.stub.total_hits(), 3)
+
+        health = self.client.get("/djangoapp/upstream_health").json()
+        self.assertEqual(health["breakers"]["backend"]["state"], OPEN)
+        self.assertEqual(health["breakers"]["backend"]["transitions"],
+                         {"closed->open": 1})
+        self.assertEqual(health["last_known_good"]["served"], served + 3)
+
+    def test_async_client_falls_back_the_same_way(self):
+        endpoint = "/fetchReviews/dealer/1"
+
+        async def run():
+            try:
+                results = [await async_restapis.get_request(endpoint)]
+                self.failing = True
+                for _ in range(3):
+                    results.append(
+                        await async_restapis.get_request(endpoint))
+                return results
+            finally:
+                await http_client.aclose_session()
+
+        results = asyncio.run(run())
+        self.assertEqual(results, [[{"id": 7, "review": "Great service"}]] * 4)
+        self.assertEqual(breakers["backend"].state, OPEN)
+        self.assertEqual(self.stub.total_hits(), 3)
+
+    def test_reviews_without_fallback_are_unavailable(self):
+        self.failing = True
+        response = self.client.get("/djangoapp/reviews/dealer/1")
+        self.assertEqual(response.json()["status"], 503)
+
+
+class MetricsTests(SimpleTestCase):
+    def test_routes_and_upstreams_are_exported(self):
+        with StubServer({"/fetchReviews/dealer/": []}) as stub, \
+                mock.patch.object(restapis, 'backend_url', stub.url):
+            self.client.get("/djangoapp/reviews/dealer/3")
+            self.client.get("/djangoapp/reviews/dealer/4")
+        text = self.client.get("/djangoapp/metrics").content.decode()
+
+        self.assertIn('django_requests_total{route="dealer_reviews",'
+                      'status="200"}', text)
+        self.assertIn('upstream_request_duration_seconds_count{'
+                      'upstream="backend",endpoint="/fetchReviews/dealer/:id"'
+                      '}', text)
+        self.assertIn('django_request_duration_seconds_bucket{'
+                      'route="dealer_reviews",le="+Inf"}', text)
+
+    def test_scrape_merges_worker_files(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        workers = [Metrics(directory, flush_interval=3600)
+                   for _ in range(2)]
+        for worker in workers:
+            worker.request_started()
+            worker.request_finished("get_dealers", 200, 0.003, False)
+            worker.request_started()
+            worker.flush()
+        # A worker that has exited: its counters stay, its gauges do not
+        exited = subprocess.Popen([sys.executable, "-c", "pass"])
+        exited.wait()
+        dead = Metrics(directory, flush_interval=3600)
+        dead.request_started()
+        dead.request_finished("get_dealers", 500, 0.2, True)
+        dead.request_started()
+        dead.pid = exited.pid
+        dead.flush()
+
+        text = workers[0].render()
+        self.assertIn('django_requests_total{route="get_dealers",'
+                      'status="200"} 2', text)
+        self.assertIn('django_request_errors_total{route="get_dealers"} 1',
+                      text)
+        self.assertIn('django_request_duration_seconds_count{'
+                      'route="get_dealers"} 3', text)
+        self.assertIn("django_requests_in_flight 2", text)
+
+
+class JsonLoggingTests(SimpleTestCase):
+    def log_lines(self, emit, **options):
+        stream = io.StringIO()
+        handler = QueueJsonHandler(stream=stream, **options)
+        logger = logging.getLogger("djangoapp.tests.json")
+        logger.addHandler(handler)
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+        try:
+            emit(logger)
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+            vars(logger).pop('isEnabledFor', None)
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    def test_records_are_json_with_request_id_and_extras(self):
+        def emit(logger):
+            token = request_id.set("req-1")
+            try:
+                logger.info("GET %s", "/fetchDealers",
+                            extra={"elapsed_ms": 1.5})
+            finally:
+                request_id.reset(token)
+            try:
+                raise ValueError("bad")
+            except ValueError:
+                logger.exception("failed")
+
+        first, second = self.log_lines(emit)
+        self.assertEqual(first["message"], "GET /fetchDealers")
+        self.assertEqual(first["request_id"], "req-1")
+        self.assertEqual(first["elapsed_ms"], 1.5)
+        self.assertNotIn("request_id", second)
+        self.assertIn("ValueError: bad", second["exc"])
+
+    def test_debug_lines_are_sampled_per_logger(self):
+        def emit(logger):
+            for i in range(10):
+                logger.debug("line %d", i)
+            logger.warning("kept")
+
+        lines = self.log_lines(emit, sample="djangoapp.tests.json=5")
+        self.assertEqual([line["message"] for line in lines],
+                         ["line 0", "line 5", "kept"])
+
+    def test_handlers_leave_the_logging_module_alone(self):
+        with mock.patch.object(logging, '_srcfile', "caller lookups on"), \
+                mock.patch.object(logging, 'logProcesses', True):
+            self.log_lines(lambda logger: logger.info("line"))
+            self.assertEqual(logging._srcfile, "caller lookups on")
+            self.assertTrue(logging.logProcesses)
+
+    def test_request_id_is_echoed(self):
+        response = self.client.get("/djangoapp/metrics",
+                                   HTTP_X_REQUEST_ID="abc-123")
+        self.assertEqual(response['X-Request-ID'], "abc-123")
+        generated = self.client.get("/djangoapp/metrics",
+                                    HTTP_X_REQUEST_ID="bad id\n")
+        self.assertRegex(generated['X-Request-ID'], r"^[0-9a-f]{32}$")
+
+
+class UserCacheTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            "dealer-7", "secret", user_type="dealer", dealer_id=7)
+        self.client.force_login(self.user)
+
+    def test_signed_in_requests_skip_the_database(self):
+        self.assertEqual(self.client.put("/djangoapp/edit_dealer/8")
+                         .status_code, 403)
+        hits = user_cache.stats()["hits"]
+        with self.assertNumQueries(0):
+            response = self.client.put("/djangoapp/edit_dealer/8")
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(user_cache.stats()["hits"], hits + 1)
+
+    def test_saving_a_user_refreshes_its_permissions(self):
+        self.client.put("/djangoapp/edit_dealer/8")
+        self.user.dealer_id = 8
+        self.user.save()
+        with mock.patch.object(views, "put_dealer",
+                               return_value={"id": 8}) as put_dealer:
+            response = self.client.put("/djangoapp/edit_dealer/8", "{}")
+        self.assertEqual(response.status_code, 200)
+        put_dealer.assert_called_once_with({}, 8)
+
+    def test_deactivated_users_are_signed_out(self):
+        self.client.put("/djangoapp/edit_dealer/8")
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.post("/djangoapp/add_review", "{}",
+                                    content_type="application/json")
+        self.assertEqual(response.json()["status"], 403)
+
+    def test_user_changes_reach_other_workers(self):
+        self.assertEqual(user_cache.alias, "shared")
+        # Another worker's user cache, sharing only the store with this one
+        worker = UserCache(user_cache.alias, ttl=60)
+        loads = []
+
+        def load():
+            loads.append(self.user.pk)
+            return CustomUser.objects.get(pk=self.user.pk)
+
+        self.assertEqual(worker.get_or_load(self.user.pk, load).dealer_id, 7)
+        self.assertEqual(worker.get_or_load(self.user.pk, load).dealer_id, 7)
+        self.user.dealer_id = 8
+        self.user.save()
+        self.assertEqual(worker.get_or_load(self.user.pk, load).dealer_id, 8)
+        self.assertEqual(len(loads), 2)
+
+
+class DatabaseConfigTests(SimpleTestCase):
+    def test_sqlite_uses_wal_and_persistent_connections(self):
+        config = database_config(Path("/srv"), {})["default"]
+        self.assertEqual(config["NAME"], Path("/srv/db.sqlite3"))
+        self.assertEqual(config["CONN_MAX_AGE"], 60)
+        self.assertTrue(config["CONN_HEALTH_CHECKS"])
+        self.assertIn("journal_mode=WAL", config["OPTIONS"]["init_command"])
+        self.assertEqual(config["OPTIONS"]["transaction_mode"], "IMMEDIATE")
+        asgi = database_config(Path("/srv"), {"SERVER_MODE": "asgi",
+                                              "SQLITE_WAL": "false"})
+        self.assertEqual(asgi["default"]["CONN_MAX_AGE"], 0)
+        self.assertNotIn("init_command", asgi["default"]["OPTIONS"])
+
+    def test_postgres_pools_connections(self):
+        config = database_config(Path("/srv"), {
+            "DATABASE_ENGINE": "postgres", "POSTGRES_HOST": "db",
+            "DB_POOL_MAX_SIZE": "4", "DB_CONN_MAX_AGE": "600"})["default"]
+        self.assertEqual(config["ENGINE"], "django.db.backends.postgresql")
+        self.assertEqual(config["HOST"], "db")
+        self.assertEqual(config["OPTIONS"]["pool"]["max_size"], 4)
+        self.assertEqual(config["CONN_MAX_AGE"], 0)
+        with self.assertRaises(ValueError):
+            database_config(Path("/srv"), {"DATABASE_ENGINE": "oracle"})
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        call_command("seed_cars", stdout=open(os.devnull, "w"))
+        car_catalog.invalidate()
+        content_versions.clear()
+
+    def test_unchanged_responses_are_not_resent(self):
+        first = self.client.get("/djangoapp/get_cars")
+        self.assertEqual(first["Cache-Control"], "no-cache")
+        again = self.client.get("/djangoapp/get_cars",
+                                HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.content, b"")
+        self.assertEqual(again["ETag"], first["ETag"])
+        since = self.client.get("/djangoapp/get_cars",
+                                HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+        self.assertEqual(since.status_code, 304)
+
+    def test_edits_change_the_etag(self):
+        first = self.client.get("/djangoapp/get_cars")
+        CarModel.objects.create(car_make=CarMake.objects.get(name="Kia"),
+                                name="Sportage")
+        again = self.client.get("/djangoapp/get_cars",
+                                HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 200)
+        self.assertNotEqual(again["ETag"], first["ETag"])
+
+    def test_large_responses_are_compressed(self):
+        dealers = [{"id": i, "state": "Texas", "city": "Austin"}
+                   for i in range(200)]
+        with mock.patch.object(views, "cached_get_request",
+                               return_value=dealers):
+            plain = self.client.get("/djangoapp/get_dealers")
+            packed = self.client.get("/djangoapp/get_dealers",
+                                     HTTP_ACCEPT_ENCODING="gzip, deflate")
+            revalidated = self.client.get(
+                "/djangoapp/get_dealers", HTTP_ACCEPT_ENCODING="gzip",
+                HTTP_IF_NONE_MATCH=packed["ETag"])
+        self.assertNotIn("Content-Encoding", plain)
+        self.assertEqual(plain["Vary"], "Accept-Encoding")
+        self.assertEqual(packed["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(packed.content), plain.content)
+        self.assertEqual(packed["ETag"], "W/" + plain["ETag"])
+        self.assertEqual(revalidated.status_code, 304)
+        small = self.client.get("/djangoapp/get_cars",
+                                HTTP_ACCEPT_ENCODING="gzip")
+        self.assertNotIn("Content-Encoding", small)
+
+    def test_stale_responses_are_not_tagged(self):
+        def stale(namespace, endpoint):
+            mark_stale("backend")
+            return DEALERS
+
+        with mock.patch.object(views, "cached_get_request", stale):
+            response = self.client.get("/djangoapp/get_dealers")
+        self.assertTrue(response.json()["stale"])
+        self.assertNotIn("ETag", response)
+
+    def test_encoding_negotiation(self):
+        self.assertEqual(choose_encoding("gzip;q=0.5, identity"), "gzip")
+        self.assertIsNone(choose_encoding("gzip;q=0"))
+        self.assertIsNone(choose_encoding(""))
+        self.assertIn(choose_encoding("*"), ("br", "gzip"))
+
+
+class DealerGeoTests(SimpleTestCase):
+    def setUp(self):
+        rng = random.Random(3)
+        self.dealers = [{"id": i, "lat": rng.uniform(25, 49),
+                         "long": rng.uniform(-124, -67)} for i in range(2000)]
+        self.seeded = seed_data()["dealers"]
+        dealer_locator.clear()
+
+    def test_nearest_matches_a_full_scan(self):
+        index = DealerGeoIndex(self.dealers + [{"id": -1}, {
+            "id": -2, "lat": "north", "long": 0}], leaf_size=8)
+        self.assertEqual(len(index), len(self.dealers))
+        lats = [dealer["lat"] for dealer in self.dealers]
+        lons = [dealer["long"] for dealer in self.dealers]
+        rng = random.Random(4)
+        for _ in range(50):
+            lat, lon = rng.uniform(20, 55), rng.uniform(-130, -60)
+            k, radius = rng.choice([1, 5, 20]), rng.choice([None, 100, 400])
+            distances = haversine_km(lat, lon, lats, lons)
+            expected = [i for i in sorted(range(len(self.dealers)),
+                                          key=distances.__getitem__)[:k]
+                        if radius is None or distances[i] <= radius]
+            found = index.nearest(lat, lon, k, radius)
+            self.assertEqual([dealer["id"] for dealer, _ in found], expected)
+            for (_, distance), i in zip(found, expected):
+                self.assertAlmostEqual(distance, distances[i])
+        self.assertEqual(DealerGeoIndex([]).nearest(30, -97), [])
+
+    def test_nearby_view(self):
+        with mock.patch.object(views, "cached_get_request",
+                               return_value=self.seeded):
+            response = self.client.get(
+                "/djangoapp/dealers/nearby?lat=31.7&lon=-106.3&k=3")
+            within = self.client.get("/djangoapp/dealers/nearby?lat=31.7"
+                                     "&lon=-106.3&radius=5")
+            bad = [self.client.get("/djangoapp/dealers/nearby" + query)
+                   for query in ("", "?lat=91&lon=0", "?lat=1&lon=x",
+                                 "?lat=1&lon=1&k=0", "?lat=1&lon=1&radius=-1")]
+        dealers = response.json()["dealers"]
+        self.assertEqual(len(dealers), 3)
+        self.assertEqual(dealers[0]["city"], "El Paso")
+        self.assertEqual(dealers, sorted(dealers, key=lambda d: d["distance"]))
+        self.assertNotIn("distance", self.seeded[0])
+        # Two El Paso dealers share coordinates
+        self.assertEqual({dealer["id"] for dealer in within.json()["dealers"]},
+                         {1, 16})
+        self.assertEqual([r.json()["status"] for r in bad], [400] * 5)
+
+    def test_index_follows_the_dealer_list(self):
+        moved = [dict(dealer) for dealer in self.seeded]
+        moved[1].update(lat=0.1, long=0.1)
+        query = "/djangoapp/dealers/nearby?lat=0&lon=0&k=1"
+
+        def nearest(dealers):
+            with mock.patch.object(views, "cached_get_request",
+                                   return_value=dealers):
+                return self.client.get(query).json()["dealers"][0]["id"]
+
+        builds = dealer_locator.builds
+        first = nearest(self.seeded)
+        self.assertNotEqual(first, 2)
+        self.assertEqual(nearest(self.seeded), first)
+        # A fresh copy of the same list, as a cache miss or a last known
+        # good fallback gives, keeps the index
+        self.assertEqual(nearest(json.loads(json.dumps(self.seeded))), first)
+        self.assertEqual(dealer_locator.builds, builds + 1)
+        # An edit replaces the cached list, which is indexed afresh
+        self.assertEqual(nearest(moved), 2)
+        self.assertEqual(dealer_locator.stats(),
+                         {"builds": builds + 2, "dealers": len(self.seeded)})
+        with mock.patch.object(views, "cached_get_request",
+                               return_value={"error": "down"}):
+            self.assertEqual(self.client.get(query).json()["status"], 503)
+
+    def test_async_view_indexes_off_the_event_loop(self):
+        request = RequestFactory().get("/djangoapp/dealers/nearby",
+                                       {"lat": "31.7", "lon": "-106.3"})
+        threads = []
+
+        def build(dealers):
+            threads.append(threading.current_thread())
+            return DealerGeoIndex(dealers)
+
+        async def view():
+            threads.append(threading.current_thread())
+            return await async_views.nearby_dealers(request)
+
+        with mock.patch.object(async_views, "cached_get_request",
+                               mock.AsyncMock(return_value=self.seeded)), \
+                mock.patch('djangoapp.dealer_geo.DealerGeoIndex', build):
+            response = asyncio.run(view())
+        self.assertEqual(len(json.loads(response.content)["dealers"]), 10)
+        loop_thread, build_thread = threads
+        self.assertIsNot(build_thread, loop_thread)
+
+
+class StaticFilesTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        os.makedirs(os.path.join(self.root, "js"))
+        self.bundle = b"function render(dealer) { return dealer; }\n" * 100
+        self.write("js/main.0123abcd.js", self.bundle)
+        self.write("style.css", b"body { margin: 0; }\n" * 100)
+        self.assets = StaticAssets(self.root)
+        self.requests = RequestFactory()
+
+    def write(self, name, content):
+        with open(os.path.join(self.root, name), "wb") as f:
+            f.write(content)
+        precompress(os.path.join(self.root, name))
+
+    def get(self, name, **headers):
+        return self.assets.serve(self.requests.get("/static/" + name,
+                                                   **headers), name)
+
+    def test_hashed_bundles_are_immutable_and_precompressed(self):
+        response = self.get("js/main.0123abcd.js",
+                            HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["Cache-Control"],
+                         "public, max-age=31536000, immutable")
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)),
+                         self.bundle)
+        plain = self.get("js/main.0123abcd.js")
+        self.assertNotIn("Content-Encoding", plain)
+        self.assertEqual(b"".join(plain.streaming_content), self.bundle)
+
+    def test_unhashed_files_are_revalidated(self):
+        response = self.get("style.css")
+        self.assertEqual(response["Cache-Control"], "no-cache")
+        again = self.get("style.css", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(again.status_code, 304)
+        with self.assertRaises(Http404):
+            self.get("../style.css")
+        with self.assertRaises(Http404):
+            self.get("missing.js")
+
+    def test_spa_shell_is_served_from_memory(self):
+        self.write("index.html", b"<html><body><div id=root></div>" +
+                   b"<script src=/static/js/main.0123abcd.js></script>" * 30)
+        templates = [{"BACKEND":
+                      "django.template.backends.django.DjangoTemplates",
+                      "DIRS": [self.root]}]
+        with override_settings(TEMPLATES=templates):
+            shell = SpaShell()
+            first = shell.serve(self.requests.get("/dealers"))
+            with open(os.path.join(self.root, "index.html"), "wb") as f:
+                f.write(b"changed")
+            packed = shell.serve(self.requests.get(
+                "/dealer/15", HTTP_ACCEPT_ENCODING="gzip"))
+        self.assertIn(b"<div id=root>", first.content)
+        self.assertEqual(gzip.decompress(packed.content), first.content)
+        self.assertEqual(first["Cache-Control"], "no-cache")
+        revalidated = shell.serve(self.requests.get(
+            "/", HTTP_IF_NONE_MATCH=first["ETag"]))
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_routes(self):
+        self.assertEqual(resolve("/static/js/main.js").func, static_asset)
+        self.assertEqual(resolve("/dealer/15").func, spa_index)
+
+
+class FastJsonTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.cars = load_inventory()
+        cls.snapshot = InventorySnapshot(cls.cars)
+
+    def test_encoders_agree_with_the_stdlib(self):
+        data = {"status": 200, "price": Decimal("19999.50"), 3: "three",
+                "cars": self.cars[:5], "text": "Zo\u00eb \u2713"}
+        self.addCleanup(fast_json.set_json_encoder, None)
+        for encoder in (fast_json.StdlibEncoder(), fast_json.OrjsonEncoder()):
+            fast_json.set_json_encoder(encoder)
+            with self.subTest(encoder=type(encoder).__name__):
+                response = fast_json.JsonResponse(data)
+                self.assertEqual(json.loads(response.content),
+                                 json.loads(json.dumps(
+                                     data, cls=DjangoJSONEncoder)))
+        with self.assertRaises(TypeError):
+            fast_json.JsonResponse([1, 2])
+
+    def test_long_lists_are_streamed_in_batches(self):
+        with mock.patch.object(fast_json, "STREAM_BATCH", 7):
+            chunks = list(fast_json.json_array_chunks(
+                {"status": 200}, "cars", iter(self.cars[:20])))
+            empty = b"".join(fast_json.json_array_chunks({}, "cars", []))
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(json.loads(b"".join(chunks)),
+                         {"status": 200, "cars": self.cars[:20]})
+        self.assertEqual(json.loads(empty), {"cars": []})
+        short = fast_json.json_list_response({"status": 200}, "cars",
+                                             self.cars[:5])
+        self.assertFalse(short.streaming)
+        self.assertTrue(fast_json.json_list_response(
+            {"status": 200}, "cars", iter(self.cars)).streaming)
+
+    def test_inventory_is_streamed_from_the_index(self):
+        dealer = [car for car in self.cars if car['dealer_id'] == 1]
+        with mock.patch.object(views, 'current_snapshot',
+                               return_value=self.snapshot), \
+                mock.patch.object(fast_json, "STREAM_MIN_ITEMS", 2):
+            response = self.client.get("/djangoapp/get_inventory/1")
+            packed = self.client.get("/djangoapp/get_inventory/1",
+                                     HTTP_ACCEPT_ENCODING="gzip")
+        self.assertTrue(response.streaming)
+        self.assertEqual(json.loads(b"".join(response.streaming_content)),
+                         {"status": 200, "cars": dealer})
+        self.assertEqual(packed["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(
+            b"".join(packed.streaming_content))), {"status": 200,
+                                                   "cars": dealer})
+
+
+class BenchmarkCommandTests(SimpleTestCase):
+    def test_every_route_has_a_plan(self):
+        plans = benchmark.route_plans(seed_data(), 10)
+        self.assertEqual(benchmark.djangoapp_routes() -
+                         {name.split(':')[0] for name in plans}, set())
+
+    def test_compare_flags_regressions(self):
+        previous = {"a": {"rps": 100, "p99_ms": 10},
+                    "b": {"rps": 100, "p99_ms": 10}}
+        current = {"a": {"rps": 95, "p99_ms": 10.5},
+                   "b": {"rps": 80, "p99_ms": 10},
+                   "c": {"rps": 1, "p99_ms": 1}}
+        changes = {route: regressed for route, _, _, regressed in
+                   benchmark.compare(previous, current, 10)}
+        self.assertEqual(changes, {"a": False, "b": True})
@@ -2,7 +2,10 @@
 from django.urls import path
 from django.conf.urls.static import static
 from django.conf import settings
-from . import views
+from . import views, async_views
+
+# Proxy views have async twins for ASGI deployments
+proxy_views = async_views if settings.ASYNC_PROXY_VIEWS else views
 
 app_name = 'djangoapp'
 urlpatterns = [
@@ -12,15 +15,20 @@ urlpatterns = [
     path(route='register', view=views.registration, name='register'),
     path(route='get_cars', view=views.get_cars, name='getcars'),
     # path for dealer reviews view
-    path(route='get_dealers', view=views.get_dealerships, name='get_dealers'),
-    path(route='get_dealers/<str:state>', view=views.get_dealerships,
+    path(route='get_dealers', view=proxy_views.get_dealerships,
+         name='get_dealers'),
+    path(route='get_dealers/<str:state>', view=proxy_views.get_dealerships,
          name='get_dealers_by_state'),
+    path(route='dealers/nearby', view=proxy_views.nearby_dealers,
+         name='nearby_dealers'),
     # path for add a review view
-    path(route='dealer/<int:dealer_id>', view=views.get_dealer_details,
+    path(route='dealer/<int:dealer_id>', view=proxy_views.get_dealer_details,
          name='dealer_details'),
-    path(route='reviews/dealer/<int:dealer_id>', view=views.get_dealer_reviews,
-         name='dealer_reviews'),
-    path(route='reviews/<int:review_id>', view=views.get_review,
+    path(route='dealer_page/<int:dealer_id>', view=proxy_views.get_dealer_page,
+         name='dealer_page'),
+    path(route='reviews/dealer/<int:dealer_id>',
+         view=proxy_views.get_dealer_reviews, name='dealer_reviews'),
+    path(route='reviews/<int:review_id>', view=proxy_views.get_review,
          name='review'),
     path(route='add_review', view=views.add_review, name='add_review'),
     path(route='put_review/<int:review_id>', view=views.edit_review,
@@ -29,11 +37,17 @@ urlpatterns = [
          name='edit_dealer'),
     path(route='new_dealer', view=views.new_dealer,
          name='new_dealer'),
-    path(route='get_inventory/<int:dealer_id>', view=views.get_inventory,
+    path(route='get_inventory/<int:dealer_id>', view=proxy_views.get_inventory,
          name='get_inventory'),
-    path(route='full_inventory', view=views.full_inventory,
+    path(route='full_inventory', view=proxy_views.full_inventory,
          name='full_inventory'),
-    path(route='makes_models', view=views.makes_models,
+    path(route='inventory_facets', view=views.inventory_facets,
+         name='inventory_facets'),
+    path(route='makes_models', view=proxy_views.makes_models,
          name='makes_models'),
-    path(route='chat/', view=views.chat_view, name='chat'),
+    path(route='chat/', view=proxy_views.chat_view, name='chat'),
+    path(route='cache_stats', view=views.cache_stats, name='cache_stats'),
+    path(route='upstream_health', view=views.upstream_health,
+         name='upstream_health'),
+    path(route='metrics', view=views.prometheus_metrics, name='metrics'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,85 @@
+# user_cache.py
+# Short-TTL cache of signed-in users. Django's AuthenticationMiddleware
+# loads request.user from the database on every authenticated request
+# (add_review, edit_dealer reading user_type/dealer_id); CachedModelBackend
+# answers those lookups from a Django cache instead. The cached object is
+# the CustomUser itself, so user_type, dealer_id and the password hash
+# behind session verification stay available. Saving or deleting a user
+# drops its entry (see signals.py).
+#
+# USER_CACHE_ALIAS picks the cache: the workers' shared file cache by
+# default, so a save or delete drops the user in every worker, not only in
+# the one that handled it (a per-worker cache such as 'default' would keep
+# serving the old user_type, dealer_id or password hash until the TTL
+# ran out); USER_CACHE_TTL=0 turns the cache off.
+
+import functools
+import logging
+import threading
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+def user_key(user_id):
+    return f"auth-user:{user_id}"
+
+
+class UserCache:
+    def __init__(self, alias='default', ttl=60):
+        self.alias = alias
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def get_or_load(self, user_id, load):
+        if not self.ttl:
+            return load()
+        store = caches[self.alias]
+        try:
+            user = store.get(user_key(user_id))
+        except Exception as err:
+            logger.warning("User cache store error %r", err)
+            return load()
+        if user is not None:
+            self._count("hits")
+            return user
+        self._count("misses")
+        user = load()
+        if user is not None:
+            try:
+                store.set(user_key(user_id), user, self.ttl)
+            except Exception as err:
+                logger.warning("User cache store error %r", err)
+        return user
+
+    def invalidate(self, sender=None, instance=None, **kwargs):
+        # Also a post_save/post_delete receiver for the user model
+        if instance is None or instance.pk is None:
+            return
+        try:
+            caches[self.alias].delete(user_key(instance.pk))
+        except Exception as err:
+            logger.warning("User cache store error %r", err)
+        self._count("invalidations")
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        return user_cache.get_or_load(
+            user_id, functools.partial(super().get_user, user_id))
+
+
+user_cache = UserCache(getattr(settings, 'USER_CACHE_ALIAS', 'shared'),
+                       getattr(settings, 'USER_CACHE_TTL', 60))
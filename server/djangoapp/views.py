@@ -1,22 +1,37 @@
 from django.contrib.auth import logout, get_user_model
 
-from django.http import JsonResponse
+from django.http import HttpResponse
 from django.contrib.auth import login, authenticate
 import logging
 import json
 from django.views.decorators.csrf import csrf_exempt
-from .models import CarMake, CarModel
-from .populate import initiate
+from .catalog import car_catalog
+from .circuit_breaker import breakers
+from .conditional import conditional_get, content_versions
+from .dealer_geo import NEARBY_K, NEARBY_MAX_K, dealer_locator
+from .chat import chat_answers, chat_context, event_stream_response, \
+    reply, reply_tokens, sse_tokens, wants_stream
+from .fanout import FanOut
+from .fast_json import JsonResponse, json_list_response
+from .inventory_index import current_snapshot, decode_cursor, \
+    encode_cursor
+from .last_known_good import last_known_good
+from .metrics import metrics
+from .response_cache import response_cache
 from .restapis import get_request, analyze_review_sentiments, \
-                    post_review, searchcars_request, put_dealer, \
-                    put_review, post_dealer
+                    analyze_review_sentiments_batch, post_review, \
+                    searchcars_request, put_dealer, put_review, post_dealer, \
+                    cached_get_request, cached_searchcars_request
+from .sentiment_cache import sentiment_cache
+from .single_flight import upstream_gets
+from .user_cache import user_cache
 import openai
 import os
+import time
 
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
 User = get_user_model()
-openai.api_key = os.getenv('OpenAIAPIKey')
 
 
 # Create a `login_request` view to handle sign in request
@@ -71,7 +86,7 @@ def registration(request):
         if User.objects.filter(username=username).exists():
             username_exist = True
     except Exception as e:
-        print(f"Error: {e}")
+        logger.warning("Error checking for user %s %r", username, e)
         # If not, simply log this is a new user
         logger.debug("{} is new user".format(username))
 
@@ -97,43 +112,81 @@ def registration(request):
         return JsonResponse(data)
 
 
+@conditional_get
 def get_cars(request):
-    count = CarMake.objects.filter().count()
-    print(count)
-    if (count == 0):
-        initiate()
-    car_models = CarModel.objects.select_related('car_make')
-    cars = []
-    for car_model in car_models:
-        cars.append({"CarModel": car_model.name,
-                     "CarMake": car_model.car_make.name})
-    return JsonResponse({"CarModels": cars})
+    # Seeded by `manage.py seed_cars`; served from memory until an edit
+    return JsonResponse({"CarModels": car_catalog.get()})
 
 
 # Update the `get_dealerships` render list of dealerships all by default,
 # particular state if state is passed
+@conditional_get
 def get_dealerships(request, state="All"):
     if (state == "All"):
         endpoint = "/fetchDealers"
     else:
         endpoint = "/fetchDealers/"+state
-    dealerships = get_request(endpoint)
+    dealerships = cached_get_request("dealers", endpoint)
+    if isinstance(dealerships, list):
+        return json_list_response({"status": 200}, "dealers", dealerships)
     return JsonResponse({"status": 200, "dealers": dealerships})
 
 
+def nearby_params(data):
+    # (lat, lon, k, radius in km or None); ValueError for anything else
+    try:
+        lat, lon = float(data['lat']), float(data['lon'])
+        k = min(int(data.get('k', NEARBY_K)), NEARBY_MAX_K)
+        radius = data.get('radius')
+        radius = float(radius) if radius else None
+    except KeyError:
+        raise ValueError("lat and lon are required")
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180) or k < 1 or \
+            (radius is not None and not radius > 0):
+        raise ValueError("Coordinates, k or radius out of range")
+    return lat, lon, k, radius
+
+
+# Create a `nearby_dealers` view with the `k` dealers closest to `lat` and
+# `lon` (within `radius` km when given), nearest first, each with its
+# `distance` in km
+def nearby_dealers(request):
+    try:
+        lat, lon, k, radius = nearby_params(request.GET)
+    except ValueError:
+        return JsonResponse({"status": 400, "message": "Bad Request"})
+    dealerships = cached_get_request("dealers", "/fetchDealers")
+    if not isinstance(dealerships, list):
+        return JsonResponse({"status": 503,
+                             "message": "Dealers unavailable"})
+    return JsonResponse({"status": 200,
+                         "dealers": dealer_locator.nearby(
+                             dealerships, lat, lon, k, radius)})
+
+
+def attach_sentiments(reviews, sentiments):
+    for review_detail, response in zip(reviews, sentiments):
+        if response is not None:
+            review_detail['sentiment'] = response['sentiment']
+        else:
+            review_detail['sentiment'] = ""
+
+
 # Create a `get_dealer_reviews` view to render the reviews of a dealer
+@conditional_get
 def get_dealer_reviews(request, dealer_id):
     if (dealer_id):
         endpoint = "/fetchReviews/dealer/"+str(dealer_id)
         reviews = get_request(endpoint)
-        for review_detail in reviews:
-            response = analyze_review_sentiments(review_detail['review'])
-            print(response)
-            if response is not None:
-                review_detail['sentiment'] = response['sentiment']
-            else:
-                review_detail['sentiment'] = ""
-        return JsonResponse({"status": 200, "reviews": reviews})
+        # None when the backend is down; its error body on a 4xx
+        if not isinstance(reviews, list):
+            return JsonResponse({"status": 503,
+                                 "message": "Reviews unavailable"})
+        sentiments = analyze_review_sentiments_batch(
+            [review_detail['review'] for review_detail in reviews],
+            [review_detail.get('id') for review_detail in reviews])
+        attach_sentiments(reviews, sentiments)
+        return json_list_response({"status": 200}, "reviews", reviews)
     else:
         return JsonResponse({"status": 400, "message": "Bad Request"})
 
@@ -143,8 +196,9 @@ def get_review(request, review_id):
     if (review_id):
         endpoint = "/fetchReviews/"+str(review_id)
         review = get_request(endpoint)
-        if review is not None:
-            response = analyze_review_sentiments(review[0]['review'])
+        if isinstance(review, list) and review:
+            response = analyze_review_sentiments(review[0]['review'],
+                                                 review[0].get('id'))
             if response is not None:
                 review[0]['sentiment'] = response['sentiment']
             else:
@@ -160,12 +214,61 @@ def get_review(request, review_id):
 def get_dealer_details(request, dealer_id):
     if (dealer_id):
         endpoint = "/fetchDealer/"+str(dealer_id)
-        dealership = get_request(endpoint)
+        dealership = cached_get_request("dealers", endpoint)
         return JsonResponse({"status": 200, "dealer": dealership})
     else:
         return JsonResponse({"status": 400, "message": "Bad Request"})
 
 
+# Seconds from the start of the request each dealer page leg may take
+DEALER_PAGE_TIMEOUTS = {
+    "dealer": float(os.getenv('DEALER_PAGE_DEALER_TIMEOUT', 5)),
+    "reviews": float(os.getenv('DEALER_PAGE_REVIEWS_TIMEOUT', 5)),
+    "sentiments": float(os.getenv('DEALER_PAGE_SENTIMENTS_TIMEOUT', 7)),
+    "inventory": float(os.getenv('DEALER_PAGE_INVENTORY_TIMEOUT', 5)),
+}
+
+
+# Create a `get_dealer_page` view that returns the dealer, its reviews with
+# sentiments and its inventory in one response. The upstream calls run
+# concurrently and any leg that is slow or down is left empty and listed
+# in "errors".
+def get_dealer_page(request, dealer_id):
+    if not dealer_id:
+        return JsonResponse({"status": 400, "message": "Bad Request"})
+    timeouts = DEALER_PAGE_TIMEOUTS
+    legs = FanOut()
+    legs.submit("dealer", cached_get_request, "dealers",
+                "/fetchDealer/"+str(dealer_id))
+    legs.submit("reviews", get_request,
+                "/fetchReviews/dealer/"+str(dealer_id))
+    legs.submit("inventory", searchcars_request, "/cars/"+str(dealer_id))
+
+    reviews = legs.result("reviews", timeouts["reviews"], default=[])
+    if not isinstance(reviews, list):
+        # The backend's error body on a 4xx
+        legs.errors["reviews"] = "unavailable"
+        reviews = []
+    if reviews:
+        # Sentiments depend on the review texts, so they start as soon as
+        # the reviews arrive while the other legs are still in flight.
+        legs.submit("sentiments", analyze_review_sentiments_batch,
+                    [review_detail['review'] for review_detail in reviews],
+                    [review_detail.get('id') for review_detail in reviews])
+        sentiments = legs.result("sentiments", timeouts["sentiments"],
+                                 default=[None] * len(reviews))
+        attach_sentiments(reviews, sentiments)
+
+    dealer = legs.result("dealer", timeouts["dealer"], default=[])
+    inventory = legs.result("inventory", timeouts["inventory"], default=[])
+    return JsonResponse({"status": 200,
+                         "dealer": dealer,
+                         "reviews": reviews,
+                         "cars": inventory,
+                         "partial": legs.partial,
+                         "errors": legs.errors})
+
+
 # Create a `add_review` view to submit a review
 def add_review(request):
     if (request.user.is_anonymous is False):
@@ -191,11 +294,11 @@ def edit_dealer(request, dealer_id):
                 response = put_dealer(data, dealer_id)
                 return JsonResponse(response, status=200)
             except Exception as err:
-                print("Error editing dealer", err)
+                logger.warning("Error editing dealer %r", err)
                 return JsonResponse({"message": "Error in Editing Dealer"},
                                     status=401)
         else:
-            print("method not allowed")
+            logger.info("Method %s not allowed", request.method)
             return JsonResponse({"message": "Method Not Allowed"}, status=405)
     else:
         return JsonResponse({"status": 403, "message": "No Access"},
@@ -210,11 +313,11 @@ def new_dealer(request):
             response = post_dealer(data)
             return JsonResponse(response, status=200)
         except Exception as err:
-            print("Error creating dealer", err)
+            logger.warning("Error creating dealer %r", err)
             return JsonResponse({"message": "Error in creating Dealer"},
                                 status=401)
     else:
-        print("method not allowed")
+        logger.info("Method %s not allowed", request.method)
         return JsonResponse({"message": "Method Not Allowed"}, status=405)
 
 
@@ -226,83 +329,158 @@ def edit_review(request, review_id):
             response = put_review(data, review_id)
             return JsonResponse(response)
         except Exception as err:
-            print("Error editing Review", err)
+            logger.warning("Error editing review %r", err)
             return JsonResponse({"message": "Error in Editing Review"},
                                 status=401)
     else:
-        print("method not allowed")
+        logger.info("Method %s not allowed", request.method)
         return JsonResponse({"message": "Method Not Allowed"}, status=405)
 
 
+def inventory_endpoint(dealer_id, data):
+    if 'year' in data:
+        return "/carsbyyear/"+str(dealer_id)+"/"+data['year']
+    elif 'make' in data:
+        return "/carsbymake/"+str(dealer_id)+"/"+data['make']
+    elif 'model' in data:
+        return "/carsbymodel/"+str(dealer_id)+"/"+data['model']
+    elif 'mileage' in data:
+        return "/carsbymaxmileage/"+str(dealer_id)+"/"+data['mileage']
+    elif 'price' in data:
+        return "/carsbyprice/"+str(dealer_id)+"/"+data['price']
+    return "/cars/"+str(dealer_id)
+
+
 def get_inventory(request, dealer_id):
     data = request.GET
     if (dealer_id):
-        if 'year' in data:
-            endpoint = "/carsbyyear/"+str(dealer_id)+"/"+data['year']
-        elif 'make' in data:
-            endpoint = "/carsbymake/"+str(dealer_id)+"/"+data['make']
-        elif 'model' in data:
-            endpoint = "/carsbymodel/"+str(dealer_id)+"/"+data['model']
-        elif 'mileage' in data:
-            endpoint = "/carsbymaxmileage/"+str(dealer_id)+"/"+data['mileage']
-        elif 'price' in data:
-            endpoint = "/carsbyprice/"+str(dealer_id)+"/"+data['price']
+        snapshot = current_snapshot()
+        if snapshot is not None:
+            rows = snapshot.dealer_rows(dealer_id, data)
+            if not isinstance(rows, dict):
+                # Records are built batch by batch as they are sent
+                return json_list_response({"status": 200}, "cars",
+                                          snapshot.iter_records(rows),
+                                          count=len(rows))
+            cars = rows
         else:
-            endpoint = "/cars/"+str(dealer_id)
-
-        cars = searchcars_request(endpoint)
+            cars = searchcars_request(inventory_endpoint(dealer_id, data))
+            if isinstance(cars, list):
+                return json_list_response({"status": 200}, "cars", cars)
         return JsonResponse({"status": 200, "cars": cars})
     else:
         return JsonResponse({"status": 400, "message": "Bad Request"})
 
 
+def inventory_params(data):
+    page = data.get('page', 1)  # Default to page 1 if not provided
+    limit = data.get('per_page', 10)  # Default to 10 if not provided
+    mileage_min = data.get('mileageMin')
+    mileage_max = data.get('mileageMax')
+    price_min = data.get('priceMin')
+    price_max = data.get('priceMax')
+    make = data.get('make')
+    model = data.get('model')
+    year = data.get('year')
+    # Only the local inventory index sorts; the service ignores it
+    sort = data.get('sort')
+
+    # Build filter parameters to pass to searchcars_request
+    params = {"page": str(page), "limit": str(limit)}
+    if mileage_min is not None and mileage_max is not None:
+        params['mileageMin'] = mileage_min
+        params['mileageMax'] = mileage_max
+    if price_min is not None and price_max is not None:
+        params['priceMin'] = price_min
+        params['priceMax'] = price_max
+    if make is not None:
+        params['make'] = make
+    if model is not None:
+        params['model'] = model
+    if year is not None:
+        params['year'] = year
+    if sort is not None:
+        params['sort'] = sort
+    return params
+
+
+def inventory_page(cars):
+    return {"status": 200,
+            "cars": cars['cars'],
+            "total": cars['totalCars'],
+            "currentPage": cars['currentPage'],
+            "totalPages": cars['totalPages']}
+
+
+def service_cursor_params(params, cursor):
+    # Cursor pagination without the local index: the cursor is a page
+    # number for the inventory service
+    page = 1
+    if cursor:
+        kind, page = decode_cursor(cursor, str, int)
+        if kind != "page":
+            raise ValueError("Invalid cursor")
+    return {**params, "page": str(page)}
+
+
+def service_cursor_page(cars):
+    page = cars['currentPage']
+    more = page < (cars['totalPages'] or 0)
+    return {"status": 200,
+            "cars": cars['cars'],
+            "total": cars['totalCars'],
+            "nextCursor": encode_cursor(["page", page + 1]) if more else None}
+
+
+# Create a `full_inventory` view for the car list. Pass `cursor` (empty for
+# the first page, then each response's `nextCursor`) for cursor pagination
+# in a stable `sort` order instead of page numbers.
 def full_inventory(request):
-    data = request.GET
     endpoint = "/inventory/"
 
     try:
-        page = data.get('page', 1)  # Default to page 1 if not provided
-        limit = data.get('per_page', 10)  # Default to 10 if not provided
-        mileage_min = data.get('mileageMin')
-        mileage_max = data.get('mileageMax')
-        price_min = data.get('priceMin')
-        price_max = data.get('priceMax')
-        make = data.get('make')
-        model = data.get('model')
-        year = data.get('year')
-
-        # Build filter parameters to pass to searchcars_request
-        filters = {}
-        if mileage_min is not None and mileage_max is not None:
-            filters['mileageMin'] = mileage_min
-            filters['mileageMax'] = mileage_max
-        if price_min is not None and price_max is not None:
-            filters['priceMin'] = price_min
-            filters['priceMax'] = price_max
-        if make is not None:
-            filters['make'] = make
-        if model is not None:
-            filters['model'] = model
-        if year is not None:
-            filters['year'] = year
-
-        cars = searchcars_request(endpoint,
-                                  page=str(page),
-                                  limit=str(limit),
-                                  **filters)
-        return JsonResponse({"status": 200,
-                             "cars": cars['cars'],
-                             "total": cars['totalCars'],
-                             "currentPage": cars['currentPage'],
-                             "totalPages": cars['totalPages']})
-    except Exception as e:
-        print("error getting full inventory", e)
+        params = inventory_params(request.GET)
+        cursor = request.GET.get('cursor')
+        snapshot = current_snapshot()
+        if cursor is not None and snapshot is not None:
+            return JsonResponse(snapshot.keyset_page(params, cursor))
+        if cursor is not None:
+            cars = searchcars_request(
+                endpoint, **service_cursor_params(params, cursor))
+            return JsonResponse(service_cursor_page(cars))
+        if snapshot is not None:
+            cars = snapshot.inventory(params)
+        else:
+            cars = searchcars_request(endpoint, **params)
+        return JsonResponse(inventory_page(cars))
+    except ValueError:
+        return JsonResponse({"status": 400, "message": "Bad Request"})
+    except Exception:
+        logger.exception("Error getting full inventory")
+        return JsonResponse({"status": 500,
+                             "error": "An internal error has occurred!"})
+
+
+# Create an `inventory_facets` view with the number of cars behind each
+# CarList filter choice, for the filters currently applied
+def inventory_facets(request):
+    snapshot = current_snapshot()
+    if snapshot is None:
+        return JsonResponse({"status": 503,
+                             "error": "Inventory index unavailable"})
+    try:
+        return JsonResponse(snapshot.facets(inventory_params(request.GET)))
+    except Exception:
+        logger.exception("Error getting inventory facets")
         return JsonResponse({"status": 500,
                              "error": "An internal error has occurred!"})
 
 
+# Create a `chat_view` to answer chat messages. Send "stream": true (or
+# Accept: text/event-stream) to receive tokens as server-sent events.
 def chat_view(request):
     if request.method == 'POST':
+        started = time.perf_counter()
         body = json.loads(request.body)
         user_message = body.get('userMessage', '')
         # Get the user's message from the request data
@@ -310,43 +488,62 @@ def chat_view(request):
         if not user_message:
             return JsonResponse({"error": "No message provided"}, status=400)
 
+        snapshot = chat_context.get()
+        if wants_stream(request, body):
+            tokens = reply_tokens(user_message, snapshot)
+            return event_stream_response(sse_tokens(tokens, started))
+
         try:
-            # Make the request to OpenAI's GPT-3/4 API
-            response = openai.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system",
-                     "content": "You are a helpful assistant."},
-                    {
-                        "role": "user",
-                        "content": user_message
-                    }
-                ]
-            )
-
-            # Get the response from the API
-            chat_gpt_message = response.choices[0].message.content
+            chat_gpt_message = reply(user_message, snapshot)
 
             return JsonResponse({"response": chat_gpt_message})
 
         except openai.OpenAIError as e:
-            print("Error in OpenAI", e)
+            logger.warning("Error in OpenAI %r", e)
             return JsonResponse({"status": 500,
                                  "error": "An internal error has occurred!"})
 
     return JsonResponse({'error': 'Invalid request method'}, status=405)
 
 
+@conditional_get
 def makes_models(request):
     if request.method == 'GET':
         endpoint = "/makes_models/"
         try:
-            res = searchcars_request(endpoint)
+            res = cached_searchcars_request("makes_models", endpoint)
             return JsonResponse({"status": 200, "makes_models": res})
-        except Exception as e:
-            print("error getting makes/models", e)
+        except Exception:
+            logger.exception("Error getting makes/models")
             return JsonResponse({"status": 500,
                                  "error": "An internal error has occurred!"})
     else:
-        print("method not allowed")
+        logger.info("Method %s not allowed", request.method)
         return JsonResponse({"message": "Method Not Allowed"}, status=405)
+
+
+# Create a `cache_stats` view to report upstream cache counters
+def cache_stats(request):
+    return JsonResponse({"status": 200,
+                         "responses": response_cache.stats(),
+                         "sentiments": sentiment_cache.stats(),
+                         "chat_answers": chat_answers.stats(),
+                         "users": user_cache.stats(),
+                         "conditional": content_versions.stats(),
+                         "nearby_dealers": dealer_locator.stats(),
+                         "coalesced_gets": upstream_gets.coalesced})
+
+
+# Create an `upstream_health` view to report circuit breaker states
+def upstream_health(request):
+    return JsonResponse({"status": 200,
+                         "breakers": {name: breaker.stats()
+                                      for name, breaker in breakers.items()},
+                         "last_known_good": last_known_good.stats()})
+
+
+# Create a `prometheus_metrics` view to expose latency and error metrics
+def prometheus_metrics(request):
+    return HttpResponse(metrics.render(),
+                        content_type="text/plain; version=0.0.4; "
+                                     "charset=utf-8")
@@ -0,0 +1,78 @@
+# database.py
+# Builds settings.DATABASES from the environment.
+#
+# DATABASE_ENGINE=sqlite (default) uses SQLITE_PATH (db.sqlite3 next to
+# manage.py). Connections are kept open for DB_CONN_MAX_AGE seconds (60,
+# or 0 with SERVER_MODE=asgi) and checked before reuse. The journal is
+# switched to WAL so readers never block the writer, write transactions
+# take the lock when they start (so two workers upgrading read locks
+# cannot fail each other with "database is locked"), and a busy writer is
+# waited on for SQLITE_TIMEOUT seconds. SQLITE_WAL=false keeps the
+# rollback journal and SQLITE_TRANSACTION_MODE=DEFERRED the old locking.
+#
+# DATABASE_ENGINE=postgres connects with POSTGRES_DB, POSTGRES_USER,
+# POSTGRES_PASSWORD, POSTGRES_HOST and POSTGRES_PORT through a psycopg
+# connection pool per worker (DB_POOL_MIN_SIZE/DB_POOL_MAX_SIZE; needs
+# psycopg[pool]), for deployments with several replicas. DB_POOL=false
+# uses persistent connections instead.
+
+import os
+
+SQLITE_INIT = ("PRAGMA journal_mode=WAL;"
+               "PRAGMA synchronous=NORMAL;")
+
+
+def flag(env, name, default):
+    return env.get(name, default).lower() in ('1', 'true', 'yes', 'on')
+
+
+def sqlite_config(env, base_dir):
+    options = {"timeout": float(env.get('SQLITE_TIMEOUT', 20)),
+               "transaction_mode": env.get('SQLITE_TRANSACTION_MODE',
+                                           'IMMEDIATE')}
+    if flag(env, 'SQLITE_WAL', 'true'):
+        options["init_command"] = SQLITE_INIT
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': env.get('SQLITE_PATH', base_dir / 'db.sqlite3'),
+        'OPTIONS': options,
+    }
+
+
+def postgres_config(env):
+    config = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': env.get('POSTGRES_DB', 'dealership'),
+        'USER': env.get('POSTGRES_USER', 'postgres'),
+        'PASSWORD': env.get('POSTGRES_PASSWORD', ''),
+        'HOST': env.get('POSTGRES_HOST', 'localhost'),
+        'PORT': env.get('POSTGRES_PORT', '5432'),
+        'OPTIONS': {},
+    }
+    if flag(env, 'DB_POOL', 'true'):
+        # Pooled connections are returned after each request, so Django
+        # must not also keep them open (CONN_MAX_AGE has to be 0)
+        config['OPTIONS']['pool'] = {
+            "min_size": int(env.get('DB_POOL_MIN_SIZE', 2)),
+            "max_size": int(env.get('DB_POOL_MAX_SIZE', 10)),
+            "timeout": float(env.get('DB_POOL_TIMEOUT', 10)),
+        }
+        config['CONN_MAX_AGE'] = 0
+    return config
+
+
+def database_config(base_dir, env=os.environ):
+    engine = env.get('DATABASE_ENGINE', 'sqlite').lower()
+    if engine == 'sqlite':
+        config = sqlite_config(env, base_dir)
+    elif engine in ('postgres', 'postgresql'):
+        config = postgres_config(env)
+    else:
+        raise ValueError(f"Unknown DATABASE_ENGINE {engine!r}")
+    # Under ASGI each request may run on a new thread, leaving persistent
+    # connections behind; Django recommends pooling there instead
+    default_age = 0 if env.get('SERVER_MODE', '').lower() == 'asgi' else 60
+    config.setdefault('CONN_MAX_AGE',
+                      int(env.get('DB_CONN_MAX_AGE', default_age)))
+    config['CONN_HEALTH_CHECKS'] = True
+    return {'default': config}
@@ -13,6 +13,10 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 import os
 from pathlib import Path
 
+from djangoapp.microservices.json_logging import skip_record_details
+
+from .database import database_config
+
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -36,6 +40,10 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [],
 }
 
+# The React app's `npm run build` output (index.html and static/)
+FRONTEND_BUILD_DIR = os.getenv('FRONTEND_BUILD_DIR',
+                               os.path.join(BASE_DIR, 'frontend/build'))
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -49,6 +57,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'djangoapp.middleware.request_id_middleware',
+    'djangoapp.middleware.metrics_middleware',
+    'djangoapp.middleware.compression_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,6 +67,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'djangoapp.middleware.stale_response_middleware',
 ]
 
 ROOT_URLCONF = 'djangoproj.urls'
@@ -65,8 +77,8 @@ TEMPLATES = [
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [
             os.path.join(BASE_DIR, 'frontend/static'),
-            os.path.join(BASE_DIR, 'frontend/build'),
-            os.path.join(BASE_DIR, 'frontend/build/static'),
+            FRONTEND_BUILD_DIR,
+            os.path.join(FRONTEND_BUILD_DIR, 'static'),
         ],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -81,17 +93,92 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'djangoproj.wsgi.application'
+ASGI_APPLICATION = 'djangoproj.asgi.application'
+
+# Serve the upstream proxy views from djangoapp/async_views.py. Only worth
+# enabling under an ASGI server (see gunicorn.conf.py, SERVER_MODE=asgi).
+ASYNC_PROXY_VIEWS = os.getenv('ASYNC_PROXY_VIEWS', 'false').lower() == 'true'
 
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
-DATABASES = {
+# djangoproj/database.py reads DATABASE_ENGINE (sqlite or postgres),
+# persistent connection and pool settings from the environment.
+
+DATABASES = database_config(BASE_DIR)
+
+# Caches
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# The 'sentiment' cache is file based so that every gunicorn worker in a
+# container shares sentiment results. Point SENTIMENT_CACHE_ALIAS at
+# another alias (or set it empty to disable the shared store).
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'sentiment': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('SENTIMENT_CACHE_DIR',
+                              os.path.join(BASE_DIR, '.cache/sentiment')),
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+
+SENTIMENT_CACHE_ALIAS = os.getenv('SENTIMENT_CACHE_ALIAS', 'sentiment')
+
+# Sessions
+# SESSION_STORE=cache (default) keeps sessions in the file based 'sessions'
+# cache shared by the workers in a container, so authenticated requests and
+# login() skip the SQLite session table and its write lock. signed_cookies
+# stores the session in the cookie itself; db and cached_db use the
+# database as before.
+
+SESSION_STORE = os.getenv('SESSION_STORE', 'cache')
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + SESSION_STORE
+SESSION_CACHE_ALIAS = 'sessions'
+CACHES['sessions'] = {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': os.getenv('SESSION_CACHE_DIR',
+                          os.path.join(BASE_DIR, '.cache/sessions')),
+    'OPTIONS': {'MAX_ENTRIES': 100000},
+}
+
+# request.user is loaded through djangoapp.user_cache, which keeps users
+# for USER_CACHE_TTL seconds in USER_CACHE_ALIAS (0 loads every time), the
+# 'shared' file cache below by default so that saving a user drops it in
+# every worker.
+AUTHENTICATION_BACKENDS = ['djangoapp.user_cache.CachedModelBackend']
+USER_CACHE_ALIAS = os.getenv('USER_CACHE_ALIAS', 'shared')
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', 60))
+
+# Workers write their metrics here so /djangoapp/metrics can report all of
+# them (gunicorn.conf.py sets it). Empty keeps metrics per process.
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+
+# Class used by the chat views to talk to the language model
+CHAT_CLIENT = os.getenv('CHAT_CLIENT', 'djangoapp.chat.OpenAIChatClient')
+
+# Class that encodes djangoapp's JSON responses (falls back to the stdlib
+# encoder when orjson is not installed)
+JSON_ENCODER = os.getenv('JSON_ENCODER', 'djangoapp.fast_json.OrjsonEncoder')
+
+# Proxied dealer and makes/models responses are cached per worker; their
+# invalidation counters live in RESPONSE_CACHE_ALIAS, the file based
+# 'shared' cache of the workers in a container by default, so a dealer edit
+# in one worker drops every worker's copy. Empty keeps them per worker.
+CACHES['shared'] = {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': os.getenv('SHARED_CACHE_DIR',
+                          os.path.join(BASE_DIR, '.cache/shared')),
+    'TIMEOUT': None,
+    # Signed-in users live here too; culling at the default 300 entries
+    # would also drop the invalidation counters
+    'OPTIONS': {'MAX_ENTRIES': 100000},
 }
+RESPONSE_CACHE_ALIAS = os.getenv('RESPONSE_CACHE_ALIAS', 'shared')
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -115,6 +202,37 @@ AUTH_PASSWORD_VALIDATORS = [
 
 AUTH_USER_MODEL = 'djangoapp.CustomUser'
 
+# Logging
+# djangoapp logs JSON lines through a queue drained by a background thread
+# (see djangoapp/microservices/json_logging.py). LOG_SAMPLE keeps one in N
+# debug lines of the named loggers, e.g. "djangoapp.upstream=10".
+# skip_record_details() turns off the caller and process lookups the
+# logging module does for every record; the JSON lines do not use them.
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'json': {
+            '()': 'djangoapp.microservices.json_logging.QueueJsonHandler',
+            'sample': os.getenv('LOG_SAMPLE',
+                                'djangoapp.restapis=100,'
+                                'djangoapp.async_restapis=100,'
+                                'djangoapp.upstream=100'),
+        },
+    },
+    'loggers': {
+        'djangoapp': {
+            'handlers': ['json'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+    },
+}
+skip_record_details()
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.2/topics/i18n/
 
@@ -133,7 +251,23 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.2/howto/static-files/
 
 STATIC_URL = '/static/'
-STATIC_ROOT = os.path.join(BASE_DIR, 'static')
+STATIC_ROOT = os.getenv('STATIC_ROOT', os.path.join(BASE_DIR, 'static'))
+
+# FRONTEND_SERVING=precompressed (default) serves collected static files
+# with their .gz/.br copies and far-future caching for hashed build files,
+# and index.html from memory (see djangoapp/static_files.py).
+# FRONTEND_SERVING=template renders index.html per request and serves
+# static files with django.views.static.
+FRONTEND_SERVING = os.getenv('FRONTEND_SERVING', 'precompressed')
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'djangoapp.static_files.CompressedStaticFilesStorage',
+    },
+}
 MEDIA_ROOT = os.path.join(STATIC_ROOT, 'media')
 MEDIA_URL = '/media/'
 
@@ -144,6 +278,6 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'frontend/static'),
-    os.path.join(BASE_DIR, 'frontend/build'),
-    os.path.join(BASE_DIR, 'frontend/build/static'),
+    FRONTEND_BUILD_DIR,
+    os.path.join(FRONTEND_BUILD_DIR, 'static'),
 ]
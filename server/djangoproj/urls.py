@@ -13,14 +13,30 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
 from django.urls import path, include, re_path
 from django.views.generic import TemplateView
 from django.conf.urls.static import static
 from django.conf import settings
+from djangoapp import static_files
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('djangoapp/', include('djangoapp.urls')),
-    re_path(r'^.*$', TemplateView.as_view(template_name="index.html")),
-] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
+]
+
+# Static files first: the SPA catch-all matches every other path
+if settings.FRONTEND_SERVING == 'template':
+    urlpatterns += static(settings.STATIC_URL,
+                          document_root=settings.STATIC_ROOT) + [
+        re_path(r'^.*$', TemplateView.as_view(template_name="index.html")),
+    ]
+else:
+    static_prefix = re.escape(settings.STATIC_URL.lstrip('/'))
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.+)$' % static_prefix,
+                static_files.static_asset),
+        re_path(r'^.*$', static_files.spa_index),
+    ]
@@ -3,5 +3,6 @@
 echo "Making migrations and migrating the database. "
 python manage.py makemigrations --noinput
 python manage.py migrate --noinput
+python manage.py seed_cars
 python manage.py collectstatic --noinput
 exec "$@"
\ No newline at end of file
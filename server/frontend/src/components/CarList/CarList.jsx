@@ -4,7 +4,8 @@
 // fetched from the backend API. Users can filter cars by various criteria 
 // such as make, model, year, mileage, and price. It includes options to 
 // reset filters and dynamically updates the displayed cars based on user input.
-import React, { useState, useEffect, useContext } from 'react';
+// More cars are loaded with cursor pagination as the user scrolls down.
+import React, { useState, useEffect, useContext, useRef } from 'react';
 import '../Dealers/SearchCars.css';
 import './CarList.css';
 import { DealerContext } from '../../contexts/DealerContext';
@@ -18,58 +19,82 @@ const CarList = () => {
     const [modelList, setModelList] = useState([]); // Stores car models for the filter
     const { dealers, error, loading } = useContext(DealerContext); // Context for dealer data
     const [message, setMessage] = useState("Loading Cars...."); // Message displayed when loading cars
-    const [currentPage, setCurrentPage] = useState(1); // Current page for pagination
-    const [totalPages, setTotalPages] = useState(1); // Total number of pages for pagination
+    const [nextCursor, setNextCursor] = useState(null); // Cursor for the next batch of cars, null at the end
+    const [total, setTotal] = useState(0); // Number of cars matching the filters
+    const [facets, setFacets] = useState(null); // Number of cars behind each filter choice
     const [filters, setFilters] = useState({
         mileage: [0, 200000],
         price: [0, 100000],
         make: 'all',
         model: 'all',
         year: 'all',
+        sort: 'price',
     }); // Filter criteria for cars
+    const sentinel = useRef(null); // Element at the end of the list that triggers loading more
+    const request = useRef(0); // Id of the latest request, to drop stale responses
+    const loadingMore = useRef(false);
 
     const [limit, setLimit] = useState(10); // Number of cars per page
     const [resetSlider, setResetSlider] = useState(false); // State for resetting the slider
 
     const dealer_url = `/djangoapp/full_inventory`; // URL endpoint for fetching car data
     const make_model_url = `/djangoapp/makes_models`
+    const facets_url = `/djangoapp/inventory_facets`
 
-    // Function to fetch car data based on current filters and pagination
-    const fetchCars = async (page = 1) => {
+    // Function to build the query parameters for the current filters
+    const filterParams = (params = {}) => {
+        const queryParams = new URLSearchParams(params);
+        if (filters.mileage[0] !== 0 || filters.mileage[1] !== 200000) {
+            queryParams.append('mileageMin', filters.mileage[0])
+            queryParams.append('mileageMax', filters.mileage[1]);
+        }
+        if (filters.price[0] !== 0 || filters.price[1] !== 100000) {
+            queryParams.append('priceMin', filters.price[0]);
+            queryParams.append('priceMax', filters.price[1]);
+        }
+        if (filters.make !== 'all') queryParams.append('make', filters.make);
+        if (filters.model !== 'all') queryParams.append('model', filters.model);
+        if (filters.year !== 'all') queryParams.append('year', filters.year);
+        return queryParams;
+    }
+
+    // Function to fetch how many cars each filter choice would show
+    const fetchFacets = async () => {
+        try {
+            const res = await fetch(`${facets_url}?${filterParams().toString()}`, { method: "GET" });
+            const retobj = await res.json();
+            setFacets(retobj.status === 200 ? retobj.facets : null);
+        } catch (err) {
+            console.error("Error fetching filter counts", err)
+            setFacets(null);
+        }
+    }
+
+    // Function to fetch a batch of cars after the given cursor ('' for the first batch)
+    const fetchCars = async (cursor = '') => {
+        const id = ++request.current;
         try {
             // Prepare query parameters for the API call
-            const queryParams = new URLSearchParams({ page, limit });
-            if (filters.mileage[0] !== 0 || filters.mileage[1] !== 200000) {
-                queryParams.append('mileageMin', filters.mileage[0])
-                queryParams.append('mileageMax', filters.mileage[1]);
-            }
-            if (filters.price[0] !== 0 || filters.price[1] !== 100000) {
-                queryParams.append('priceMin', filters.price[0]);
-                queryParams.append('priceMax', filters.price[1]);
-            }
-            if (filters.make !== 'all') queryParams.append('make', filters.make);
-            if (filters.model !== 'all') queryParams.append('model', filters.model);
-            if (filters.year !== 'all') queryParams.append('year', filters.year);
+            const queryParams = filterParams({ cursor, per_page: limit, sort: filters.sort });
 
             // Fetch car data from the API
             const res = await fetch(`${dealer_url}?${queryParams.toString()}`, { method: "GET" });
             const retobj = await res.json();
 
+            if (id !== request.current) return; // Filters changed while loading
+
             // Handle the response from the API
             if (retobj.status === 200) {
-                if (!Array.isArray(retobj.cars) || retobj.cars.length === 0) {
-                    setCars(retobj.cars); // Set the cars to an empty array if no cars are found
-                    setMessage("No cars found."); // Show message if no cars are found
-                    setCurrentPage(1); // Reset current page to 1
-                    setTotalPages(1); // Reset total pages
-                } else {
-                    setMessage("");
-                    setCars(retobj.cars); // Set the cars
-                    setTotalPages(retobj.totalPages); // Set total pages from the API response
-                    setCurrentPage(retobj.currentPage); // Set the current page from the API response
+                const batch = Array.isArray(retobj.cars) ? retobj.cars : [];
+                setCars((prevCars) => (cursor ? [...prevCars, ...batch] : batch));
+                setTotal(retobj.total);
+                setNextCursor(retobj.nextCursor);
+                if (!cursor) {
+                    setMessage(batch.length === 0 ? "No cars found." : "");
                 }
             }
             else {
+                setNextCursor(null);
                 setMessage("No cars found.");
             }
         } catch (err) {
@@ -78,16 +103,14 @@ const CarList = () => {
         }
     }
 
-    // Functions to handle pagination
-    const handleNextPage = () => {
-        if (currentPage < totalPages) {
-            setCurrentPage(currentPage + 1);
-        }
-    };
-    
-    const handlePreviousPage = () => {
-        if (currentPage > 1) {
-            setCurrentPage(currentPage - 1);
+    // Load the next batch once, however often the sentinel comes into view
+    const loadMore = async () => {
+        if (!nextCursor || loadingMore.current) return;
+        loadingMore.current = true;
+        try {
+            await fetchCars(nextCursor);
+        } finally {
+            loadingMore.current = false;
         }
     };
 
@@ -147,8 +170,8 @@ const CarList = () => {
                 make: 'all',
                 model: 'all',
                 year: 'all',
+                sort: filters.sort,
             });
-            setCurrentPage(1);
             setResetSlider(true); // Trigger reset in RangeSlider
             setTimeout(() => setResetSlider(false), 0);
         }
@@ -185,10 +208,37 @@ const CarList = () => {
         }));
     };
 
-    // Fetch car data whenever filters or pagination changes
+    // Start again from the first batch whenever the filters change
+    useEffect(() => {
+        setNextCursor(null);
+        fetchCars('');
+        fetchFacets();
+    }, [filters]);
+
+    // Label a filter choice with its car count, when counts are available
+    const withCount = (label, facet, value) => {
+        if (!facets || !facets[facet]) return label;
+        return `${label} (${facets[facet][value] ?? 0})`;
+    }
+
+    // Cars from the given year or newer, for the "or newer" year choices
+    const yearCount = (year) => {
+        if (!facets) return null;
+        return Object.entries(facets.year)
+            .filter(([y]) => Number(y) >= year)
+            .reduce((sum, [, count]) => sum + count, 0);
+    }
+
+    // Load more cars when the end of the list scrolls into view
     useEffect(() => {
-        fetchCars(currentPage);
-    }, [filters, currentPage]);
+        const node = sentinel.current;
+        if (!node || !nextCursor) return undefined;
+        const observer = new IntersectionObserver((entries) => {
+            if (entries[0].isIntersecting) loadMore();
+        }, { rootMargin: '400px' });
+        observer.observe(node);
+        return () => observer.disconnect();
+    }, [nextCursor]);
 
     // Populate makes and models when starting
     useEffect(() => {
@@ -211,7 +261,7 @@ const CarList = () => {
                                 <option value="all"> -- All -- </option>
                                 {makes.map((make, index) => (
                                     <option key={index} value={make}>
-                                        {make}
+                                        {withCount(make, 'make', make)}
                                     </option>
                                 ))}
                             </>
@@ -228,7 +278,7 @@ const CarList = () => {
                                 <option value='all'> -- All -- </option>
                                 {models.map((model, index) => (
                                     <option key={index} value={model}>
-                                        {model}
+                                        {withCount(model, 'model', model)}
                                     </option>
                                 ))}
                             </>
@@ -238,11 +288,11 @@ const CarList = () => {
                     <label className="filter-label">Year</label>
                     <select className="filter-select" id="year" value={filters.year} onChange={handleFilterChange}>
                         <option selected value='all'> -- All -- </option>
-                        <option value='2024'>2024 or newer</option>
-                        <option value='2023'>2023 or newer</option>
-                        <option value='2022'>2022 or newer</option>
-                        <option value='2021'>2021 or newer</option>
-                        <option value='2020'>2020 or newer</option>
+                        {[2024, 2023, 2022, 2021, 2020].map((year) => (
+                            <option key={year} value={String(year)} disabled={yearCount(year) === 0}>
+                                {year} or newer{facets ? ` (${yearCount(year)})` : ''}
+                            </option>
+                        ))}
                     </select>
                     {/* Mileage filter */}
                     <label className="filter-label">Mileage</label>
@@ -268,6 +318,14 @@ const CarList = () => {
                         label="Price" 
                         reset={resetSlider}
                     />
+                    {/* Sort order */}
+                    <label className="filter-label">Sort by</label>
+                    <select className="filter-select" id="sort" value={filters.sort} onChange={handleFilterChange}>
+                        <option value='price'>Price: low to high</option>
+                        <option value='-price'>Price: high to low</option>
+                        <option value='mileage'>Mileage: low to high</option>
+                        <option value='-year'>Year: newest first</option>
+                    </select>
                     <button className="reset-button" onClick={reset}>Reset</button>
                 </div>
             </div>
@@ -296,19 +354,13 @@ const CarList = () => {
                     </div>
                 )}
             </div>
-            {/* Pagination */}
-            <div className="pagination-controls">
-                <button 
-                    onClick={handlePreviousPage} 
-                    disabled={currentPage === 1}>
-                    Previous
-                </button>
-                <span>Page {currentPage} of {totalPages}</span>
-                <button 
-                    onClick={handleNextPage} 
-                    disabled={currentPage === totalPages}>
-                    Next
-                </button>
+            {/* Infinite scroll */}
+            <div className="pagination-controls" ref={sentinel}>
+                {!message && (
+                    <span>
+                        {nextCursor ? 'Loading more cars...' : `Showing all ${total} cars`}
+                    </span>
+                )}
             </div>
         </div>
     );
@@ -22,30 +22,64 @@ const ChatBot = () => {
         setIsLoading(true);
 
         try {
-            console.log("sending", userInput)
             const response = await fetch('/djangoapp/chat/', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
+                    'Accept': 'text/event-stream',
                 },
-                body: JSON.stringify({ userMessage: userInput }),
+                body: JSON.stringify({ userMessage: userInput, stream: true }),
             });
 
-            const data = await response.json();
-            console.log("recieved", data, response)
-
-            if (response.ok) {
-                // Add bot response to chat
-                setMessages((prevMessages) => [
-                    ...prevMessages,
-                    { sender: 'bot', text: data.response },
-                ]);
-            } else {
+            if (!response.ok || !response.body) {
+                const data = await response.json();
                 console.error('Server error:', data.error);
                 setMessages((prevMessages) => [
                     ...prevMessages,
                     { sender: 'bot', text: 'Sorry, something went wrong.' },
                 ]);
+                return;
+            }
+
+            // Show the reply as the tokens arrive
+            setMessages((prevMessages) => [
+                ...prevMessages,
+                { sender: 'bot', text: '' },
+            ]);
+            const appendToReply = (text) => {
+                setIsLoading(false);
+                setMessages((prevMessages) => {
+                    const last = prevMessages[prevMessages.length - 1];
+                    return [
+                        ...prevMessages.slice(0, -1),
+                        { ...last, text: last.text + text },
+                    ];
+                });
+            };
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let done = false;
+            while (!done) {
+                const chunk = await reader.read();
+                if (chunk.done) break;
+                buffer += decoder.decode(chunk.value, { stream: true });
+                // Server-sent events are separated by a blank line
+                const events = buffer.split('\n\n');
+                buffer = events.pop();
+                for (const event of events) {
+                    const lines = event.split('\n');
+                    const name = lines.find((line) => line.startsWith('event: '));
+                    const data = lines.find((line) => line.startsWith('data: '));
+                    if (name === 'event: done') {
+                        done = true;
+                    } else if (name === 'event: error') {
+                        appendToReply('Sorry, something went wrong.');
+                    } else if (data) {
+                        appendToReply(JSON.parse(data.slice(6)).token);
+                    }
+                }
             }
         } catch (error) {
             console.error('Network error:', error);
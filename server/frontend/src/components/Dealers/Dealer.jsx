@@ -28,35 +28,24 @@ const Dealer = () => {
     const curr_url = window.location.href;
     const root_url = curr_url.substring(0, curr_url.indexOf("dealer"));
     const { id } = useParams();
-    const dealer_url = root_url + `djangoapp/dealer/${id}`;
-    const reviews_url = root_url + `djangoapp/reviews/dealer/${id}`;
+    const dealer_page_url = root_url + `djangoapp/dealer_page/${id}`;
     const post_review = root_url + `postreview/${id}`;
     const put_dealer = root_url + `editdealer/${id}`;
 
-    const get_dealer = async () => {
+    // Dealer, reviews (with sentiments) and inventory arrive in one
+    // response; the backend fetches them concurrently.
+    const get_dealer_page = async () => {
         try {
-            const res = await fetch(dealer_url, {
+            const res = await fetch(dealer_page_url, {
                 method: "GET"
             });
             const retobj = await res.json();
 
             if (retobj.status === 200) {
                 let dealerobjs = Array.from(retobj.dealer)
-                setDealer(dealerobjs[0]);
-            }
-        } catch (err) {
-            console.error("Failed to fetch dealer:", err);
-        }
-    }
-
-    const get_reviews = async () => {
-        try {
-            const res = await fetch(reviews_url, {
-                method: "GET"
-            });
-            const retobj = await res.json();
-
-            if (retobj.status === 200) {
+                if (dealerobjs.length > 0) {
+                    setDealer(dealerobjs[0]);
+                }
                 if (retobj.reviews.length > 0) {
                     setReviews(retobj.reviews)
                 } else {
@@ -64,7 +53,7 @@ const Dealer = () => {
                 }
             }
         } catch (err) {
-            console.error("Failed to get reviews:", err);
+            console.error("Failed to fetch dealer page:", err);
         }
     }
 
@@ -82,8 +71,7 @@ const Dealer = () => {
     }
 
     useEffect(() => {
-        get_dealer();
-        get_reviews();
+        get_dealer_page();
         getUserLocation();
     }, []);
 
@@ -0,0 +1,32 @@
+# gunicorn.conf.py
+# Server configuration for the Django tier.
+# SERVER_MODE=wsgi (default) runs sync workers on djangoproj.wsgi.
+# SERVER_MODE=asgi runs uvicorn workers on djangoproj.asgi and serves the
+# upstream proxy views from djangoapp/async_views.py, so each worker can
+# hold many in-flight upstream requests.
+
+import os
+import shutil
+
+server_mode = os.getenv('SERVER_MODE', 'wsgi').lower()
+
+bind = os.getenv('GUNICORN_BIND', ':8000')
+workers = int(os.getenv('GUNICORN_WORKERS', 3))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+
+if server_mode == 'asgi':
+    wsgi_app = 'djangoproj.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    os.environ.setdefault('ASYNC_PROXY_VIEWS', 'true')
+else:
+    wsgi_app = 'djangoproj.wsgi:application'
+
+# Every worker writes its metrics here; /djangoapp/metrics merges them
+metrics_dir = os.environ.setdefault(
+    'METRICS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '.cache', 'metrics'))
+
+
+def on_starting(server):
+    # Counters start from zero with each server run
+    shutil.rmtree(metrics_dir, ignore_errors=True)